@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import User, Dish, Order, OrderItem, Canteen, CanteenDish
+from django.db import transaction
+from .models import User, Dish, Order, OrderItem, Canteen, CanteenDish, DailySales, StockHold, stock_total
+from .search import text_match, words
+from .stock import rebalance_slots
 
 
 class OrderItemInline(admin.TabularInline):
@@ -7,9 +10,23 @@ class OrderItemInline(admin.TabularInline):
     raw_id_fields = ['dish']
     extra = 1 # Количество пустых форм для добавления
 
-class CanteenDishInline(admin.TabularInline):
+class StockTotalMixin:
+    # Остаток горячего блюда лежит в строке CanteenDish и слотах StockSlot,
+    # поэтому рядом с quantity показывается сумма
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(available_quantity=stock_total())
+
+    @admin.display(description="Всего в наличии")
+    def total_quantity(self, obj):
+        return getattr(obj, 'available_quantity', obj.quantity)
+
+class CanteenDishInline(StockTotalMixin, admin.TabularInline):
     model = CanteenDish
     extra = 1
+    # Режим горячего блюда включается в разделе «Блюда в столовых»: там же
+    # остаток перераскладывается по слотам
+    fields = ('canteen', 'dish', 'quantity', 'hot_slots', 'total_quantity')
+    readonly_fields = ('hot_slots', 'total_quantity')
 
 @admin.register(Dish)
 class DishAdmin(admin.ModelAdmin):
@@ -17,12 +34,47 @@ class DishAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     inlines = [CanteenDishInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Тот же поиск по индексам, что и у dishes/search, вместо icontains по всей таблице
+        if not words(search_term):
+            return queryset, False
+        match = text_match(search_term)
+        if match is None:
+            return queryset.none(), False
+        return queryset.filter(match[0]), False
+
 @admin.register(Canteen)
 class CanteenAdmin(admin.ModelAdmin):
-    list_display = ('name', 'address', 'is_open')
+    list_display = ('name', 'address', 'is_open', 'slot_minutes', 'slot_max_orders', 'slot_max_dishes')
     list_filter = ('is_open',)
     inlines = [CanteenDishInline]
 
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'canteen', 'dish', 'quantity', 'revenue', 'orders')
+    list_filter = ('canteen', 'date')
+    date_hierarchy = 'date'
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    # Только просмотр: количество резерва уже списано с остатка
+    list_display = ('user', 'canteen', 'dish', 'quantity', 'expires_at')
+    list_filter = ('canteen',)
+    readonly_fields = ('user', 'canteen', 'dish', 'quantity', 'expires_at')
+
+@admin.register(CanteenDish)
+class CanteenDishAdmin(StockTotalMixin, admin.ModelAdmin):
+    # У горячего блюда quantity — пополнение, еще не разложенное по слотам:
+    # при сохранении весь остаток раскладывается по hot_slots слотам поровну
+    list_display = ('dish', 'canteen', 'quantity', 'hot_slots', 'total_quantity')
+    list_filter = ('canteen',)
+    readonly_fields = ('total_quantity',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.hot_slots or 'hot_slots' in form.changed_data:
+            with transaction.atomic():
+                rebalance_slots(obj.id, obj.hot_slots)
+
 admin.site.register(User)
-admin.site.register(OrderItem)
-admin.site.register(CanteenDish)
\ No newline at end of file
+admin.site.register(OrderItem)
\ No newline at end of file
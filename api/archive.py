@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.db import connection, transaction
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'canteen_id', 'status', 'preparation_type', 'preparation_time', 'created_at', 'total_price')
+
+
+def _month_start(moment):
+    return date(moment.year, moment.month, 1)
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def ensure_archive_partitions(months):
+    # PostgreSQL: помесячные секции архива. Создаются до вставки строк, иначе
+    # строки попадут в секцию по умолчанию и секцию за этот месяц нельзя будет создать
+    if connection.vendor != 'postgresql':
+        return
+    table = ArchivedOrder._meta.db_table
+    with connection.cursor() as cursor:
+        for month in sorted(months):
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} '
+                'FOR VALUES FROM (%s) TO (%s)',
+                [month, _next_month(month)]
+            )
+
+
+def archive_batch(before, batch_size):
+    # Переносит до batch_size закрытых заказов старше before вместе с позициями.
+    # Одна короткая транзакция на порцию; заказы, заблокированные другими
+    # транзакциями (например, сменой статуса), пропускаются до следующего запуска
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status='closed', created_at__lt=before)
+            .order_by('id')
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return 0
+        ids = [order['id'] for order in orders]
+        items = list(OrderItem.objects.filter(order_id__in=ids).values('id', 'order_id', 'dish_id', 'quantity', 'unit_price'))
+
+        ensure_archive_partitions({_month_start(order['created_at']) for order in orders})
+        ArchivedOrder.objects.bulk_create(ArchivedOrder(**order) for order in orders)
+        ArchivedOrderItem.objects.bulk_create(ArchivedOrderItem(**item) for item in items)
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(orders)
@@ -1,5 +1,144 @@
+import hashlib
+import hmac
+import time
+
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
 from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+from django.utils.functional import cached_property
+
+REVOKED_TOKEN_KEY = 'jwt:revoked:token:{jti}'
+TOKEN_GENERATION_KEY = 'jwt:generation:user:{user_id}'
+LOGIN_RESULT_KEY = 'auth:login:{digest}'
+LOGIN_FAILED = 'failed'
+
+# Хранилище отзыва токенов без вытеснения (см. CACHES в settings)
+token_cache = ConnectionProxy(caches, 'tokens')
+
+
+class CanteenTokenUser(TokenUser):
+    # Пользователь, восстановленный из claims токена без обращения к БД
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def canteen_id(self):
+        return self.token.get('canteen_id')
+
+
+def add_user_claims(token, user):
+    # Роль и столовая нужны для stateless-проверки прав (IsCanteenWorker),
+    # поколение — для отзыва всех токенов пользователя
+    token['role'] = user.role
+    token['canteen_id'] = user.canteen_id
+    token['generation'] = token_cache.get(TOKEN_GENERATION_KEY.format(user_id=user.pk), 0)
+    return token
+
+
+def _lifetime_seconds():
+    # Отзыв всех токенов пользователя должен пережить и refresh-токены
+    return int(max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+
+
+def revoke_token(token):
+    # Отзыв одного токена (выход из системы, ротация refresh-токена) до истечения
+    # его срока действия. Возвращает False, если токен уже был отозван: cache.add
+    # атомарен, поэтому один refresh-токен нельзя обменять дважды
+    remaining = int(token['exp'] - time.time())
+    if remaining <= 0:
+        return False
+    return token_cache.add(REVOKED_TOKEN_KEY.format(jti=token[api_settings.JTI_CLAIM]), True, timeout=remaining)
+
+
+def revoke_user_tokens(user_id):
+    # Отзыв всех токенов пользователя, выданных до текущего момента (смена
+    # роли, столовой, пароля или блокировка): поколение пользователя растет,
+    # и токены с меньшим поколением в claims недействительны. Сравнение по
+    # счетчику, а не по времени выдачи, не зависит от точности iat (секунды).
+    # Ключ живет срок жизни токенов и начинается со времени в микросекундах:
+    # после истечения ключа новое поколение больше всех выданных ранее
+    key = TOKEN_GENERATION_KEY.format(user_id=user_id)
+    timeout = _lifetime_seconds()
+    if token_cache.add(key, time.time_ns() // 1000, timeout=timeout):
+        return
+    try:
+        token_cache.incr(key)
+    except ValueError:
+        token_cache.add(key, time.time_ns() // 1000, timeout=timeout)
+        return
+    token_cache.touch(key, timeout)
+
+
+def _revocation_keys(token):
+    return (
+        REVOKED_TOKEN_KEY.format(jti=token.get(api_settings.JTI_CLAIM)),
+        TOKEN_GENERATION_KEY.format(user_id=token.get(api_settings.USER_ID_CLAIM)),
+    )
+
+
+def _is_revoked(token, token_key, user_key, revoked):
+    if token_key in revoked:
+        return True
+    generation = revoked.get(user_key)
+    return generation is not None and token.get('generation', 0) < generation
+
+
+def is_token_revoked(token):
+    token_key, user_key = _revocation_keys(token)
+    return _is_revoked(token, token_key, user_key, token_cache.get_many([token_key, user_key]))
+
+
+async def ais_token_revoked(token):
+    token_key, user_key = _revocation_keys(token)
+    return _is_revoked(token, token_key, user_key, await token_cache.aget_many([token_key, user_key]))
+
+
+def load_user(user):
+    # Для эндпоинтов, которым нужна полная модель пользователя
+    from .models import User
+
+    if isinstance(user, TokenUser):
+        return User.objects.get(pk=user.id)
+    return user
+
+
+def _password_fingerprint(user):
+    # Смена пароля (и перехеширование) делает сохраненный результат входа недействительным
+    return hashlib.sha256(user.password.encode()).hexdigest()[:16]
+
+
+def authenticate_credentials(request, username, password):
+    # Проверка пароля — самая дорогая часть входа (сотни миллисекунд CPU).
+    # Результат для той же пары логин/пароль переиспользуется AUTH_COALESCE_SECONDS
+    # секунд; в кэше хранится только HMAC пары, а не сам пароль
+    from .models import User
+
+    timeout = settings.AUTH_COALESCE_SECONDS
+    if not timeout:
+        return authenticate(request, username=username, password=password)
+
+    digest = hmac.new(settings.SECRET_KEY.encode(), f'{username}\0{password}'.encode(), hashlib.sha256).hexdigest()
+    key = LOGIN_RESULT_KEY.format(digest=digest)
+    cached = cache.get(key)
+    if cached == LOGIN_FAILED:
+        return None
+    if cached is not None:
+        user_id, fingerprint = cached
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is not None and _password_fingerprint(user) == fingerprint:
+            return user
+
+    user = authenticate(request, username=username, password=password)
+    cache.set(key, (user.pk, _password_fingerprint(user)) if user is not None else LOGIN_FAILED, timeout)
+    return user
+
 
 class JWTCookieAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -11,6 +150,48 @@ class JWTCookieAuthentication(JWTAuthentication):
 
         # Валидируем токен
         validated_token = self.get_validated_token(token)
-        
+
+        if is_token_revoked(validated_token):
+            raise InvalidToken('Токен отозван')
+
+        # В stateless-режиме пользователь строится из claims токена без запроса к БД
+        if settings.JWT_STATELESS_AUTH and 'role' in validated_token:
+            return CanteenTokenUser(validated_token), validated_token
+
         # Получаем пользователя по валидному токену
-        return self.get_user(validated_token), validated_token
\ No newline at end of file
+        return self.get_user(validated_token), validated_token
+
+    async def aauthenticate(self, request):
+        # Вариант для асинхронных представлений (Django View с async def):
+        # токен проверяется так же, а пользователь читается через async ORM
+        token = request.COOKIES.get('access_token')
+
+        if token is None:
+            return None
+
+        validated_token = self.get_validated_token(token)
+
+        if await ais_token_revoked(validated_token):
+            raise InvalidToken('Токен отозван')
+
+        if settings.JWT_STATELESS_AUTH and 'role' in validated_token:
+            return CanteenTokenUser(validated_token), validated_token
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        # Повторяет JWTAuthentication.get_user
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('Пользователь заблокирован', code='user_inactive')
+
+        return user
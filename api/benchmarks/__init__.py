@@ -0,0 +1,2 @@
+# Нагрузочные тесты обеденного пика: генератор данных (seed.py, команда
+# seed_load) и сценарии с отчетом в JSON (scenarios.py, команда run_load)
@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    # Тестовые данные бенчмарка создаются в транзакции и откатываются в конце
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
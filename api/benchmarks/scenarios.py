@@ -0,0 +1,369 @@
+import json
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+import django
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.analytics import apply_sales, order_sales
+from api.authentication import add_user_claims
+from api.menu_cache import bump_menu_version_on_commit
+from api.menu_sync import record_menu_changes
+from api.models import (
+    CanteenDish, DailySales, Order, OrderItem, StockHold, StockSlot, TimeSlot, User, stock_total
+)
+from api.stock import rebalance_slots
+
+from .seed import PREFIX, seeded_canteens
+
+# Доли операций в смеси обеденного пика
+DEFAULT_MIX = {'menu': 60, 'order': 20, 'worker_queue': 15, 'worker_status': 5}
+# Ответы, которые для сценария нормальны: 304 на опрос меню без изменений,
+# 400 — блюдо закончилось
+EXPECTED_STATUSES = {
+    'menu': {200, 304},
+    'order': {201, 400},
+    'worker_queue': {200},
+    'worker_status': {200},
+}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def token_cookie(user):
+    return str(add_user_claims(RefreshToken.for_user(user).access_token, user))
+
+
+class HTTPResponse:
+    def __init__(self, status_code, headers=None, body=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+
+    def __getitem__(self, name):
+        return self.headers[name.lower()]
+
+    @property
+    def data(self):
+        return json.loads(self.body)
+
+
+class HTTPClient:
+    # Клиент с keep-alive для прогона против запущенного сервера (--url), с тем
+    # же интерфейсом, что у APIClient, в объеме, нужном Actor. Сбой соединения
+    # записывается как ответ с кодом 0
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        if url.scheme not in ('http', 'https'):
+            raise ValueError(f'Нужен адрес http:// или https://, а не {base_url!r}')
+        self.connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.connection = None
+        self.cookies = SimpleCookie()
+
+    def get(self, path, **extra):
+        return self.request('GET', path, None, extra)
+
+    def post(self, path, data, format='json', **extra):
+        return self.request('POST', path, json.dumps(data).encode(), extra)
+
+    def request(self, method, path, body, extra):
+        # extra — заголовки в виде META, как у тестового клиента: HTTP_IF_NONE_MATCH
+        headers = {name[5:].replace('_', '-').title(): value for name, value in extra.items()}
+        headers['Accept'] = 'application/json'
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=30)
+        try:
+            self.connection.request(method, self.prefix + path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, HTTPException):
+            self.close()
+            return HTTPResponse(0)
+        for cookie in response.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(cookie)
+        if response.will_close:
+            self.close()
+        return HTTPResponse(response.status, {name.lower(): value for name, value in response.getheaders()}, content)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Actor:
+    # Один поток нагрузки: студент, который смотрит меню и оформляет заказы,
+    # и работники кухни всех столовых, которые опрашивают очередь и меняют статусы
+    def __init__(self, config, fixture, seed):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.canteens = fixture['canteens']
+        self.hot_dishes = fixture['hot_dishes']
+        self.student = self.client()
+        self.student.cookies['access_token'] = fixture['students'][seed % len(fixture['students'])]
+        self.workers = {}
+        for canteen_id, token in fixture['workers'].items():
+            self.workers[canteen_id] = self.client()
+            self.workers[canteen_id].cookies['access_token'] = token
+        self.etags = {}
+        self.paid = defaultdict(list)
+        self.ready = defaultdict(list)
+        self.samples = defaultdict(list)
+
+    def client(self):
+        if self.config.get('url'):
+            return HTTPClient(self.config['url'])
+        # Ошибка сервера (например, блокировка SQLite) записывается как ответ 500
+        return APIClient(HTTP_HOST='localhost', raise_request_exception=False)
+
+    def run(self, deadline):
+        names, weights = zip(*self.config['mix'].items())
+        try:
+            while time.perf_counter() < deadline:
+                name = self.rng.choices(names, weights)[0]
+                canteen_id = self.rng.choice(self.canteens)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    name, status_code = getattr(self, name)(canteen_id)
+                    elapsed = time.perf_counter() - started
+                # Запросы к БД внешнего сервера отсюда не видны
+                query_count = None if self.config.get('url') else len(queries.captured_queries)
+                self.samples[name].append((elapsed, query_count, status_code))
+        finally:
+            for client in (self.student, *self.workers.values()):
+                if isinstance(client, HTTPClient):
+                    client.close()
+            connection.close()
+        return self.samples
+
+    def menu(self, canteen_id):
+        # Клиент опрашивает меню с ETag последнего ответа
+        headers = {}
+        if canteen_id in self.etags:
+            headers['HTTP_IF_NONE_MATCH'] = self.etags[canteen_id]
+        response = self.student.get(reverse('canteen-menu', kwargs={'canteen_id': canteen_id}), **headers)
+        if response.status_code == 200:
+            self.etags[canteen_id] = response['ETag']
+        return 'menu', response.status_code
+
+    def order(self, canteen_id):
+        dishes = self.rng.sample(self.hot_dishes, k=min(len(self.hot_dishes), self.rng.choice((1, 1, 2))))
+        response = self.student.post(reverse('set_order'), {
+            'canteen_id': canteen_id,
+            'items': [{'dish_id': dish_id, 'quantity': self.rng.choice((1, 1, 2))} for dish_id in dishes],
+        }, format='json')
+        return 'order', response.status_code
+
+    def worker_queue(self, canteen_id):
+        response = self.workers[canteen_id].get(reverse('worker-order-list') + '?page_size=20')
+        if response.status_code == 200:
+            self.paid[canteen_id] = [order['id'] for order in response.data['results'] if order['status'] == 'paid']
+        return 'worker_queue', response.status_code
+
+    def worker_status(self, canteen_id):
+        # Готовые заказы выдаются, затем готовятся следующие из очереди
+        if self.ready[canteen_id]:
+            ids, new_status = self.ready.pop(canteen_id), 'closed'
+        elif self.paid[canteen_id]:
+            ids, new_status = self.paid.pop(canteen_id)[:self.config['status_batch']], 'ready'
+        else:
+            return self.worker_queue(canteen_id)
+        response = self.workers[canteen_id].post(reverse('worker-order-bulk-status'), {'ids': ids, 'status': new_status}, format='json')
+        if response.status_code == 200 and new_status == 'ready':
+            self.ready[canteen_id] = response.data['changed']
+        return 'worker_status', response.status_code
+
+
+def run_threads(config, fixture, first_seed):
+    # Запускается в каждом процессе нагрузки: config['threads'] потоков
+    deadline = time.perf_counter() + config['duration']
+    actors = [Actor(config, fixture, first_seed + index) for index in range(config['threads'])]
+    results = [None] * len(actors)
+
+    def target(index):
+        results[index] = actors[index].run(deadline)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(len(actors))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = defaultdict(list)
+    for samples in results:
+        for name, values in samples.items():
+            merged[name].extend(values)
+    return dict(merged)
+
+
+def prepare_fixture(config):
+    canteens = list(seeded_canteens().values_list('id', flat=True))
+    if not canteens:
+        raise LookupError('Нет данных для нагрузки: сначала выполните seed_load')
+    # Горячие блюда — самые заказываемые в истории (первые по распределению seed_load)
+    hot_dishes = list(
+        CanteenDish.objects.filter(canteen_id=canteens[0], dish__name__startswith=f'{PREFIX} ')
+        .order_by('dish_id').values_list('dish_id', flat=True)[:config['hot_dishes']]
+    )
+    concurrency = config['processes'] * config['threads']
+    students = User.objects.filter(username__startswith=f'{PREFIX}-student-').order_by('id')[:concurrency]
+    workers = User.objects.filter(username__startswith=f'{PREFIX}-worker-', canteen_id__in=canteens)
+    return {
+        'canteens': canteens,
+        'hot_dishes': hot_dishes,
+        'students': [token_cookie(user) for user in students],
+        'workers': {user.canteen_id: token_cookie(user) for user in workers},
+    }
+
+
+def stock_snapshot(canteens):
+    return {
+        (canteen_id, dish_id): quantity
+        for canteen_id, dish_id, quantity in CanteenDish.objects.filter(canteen_id__in=canteens)
+        .annotate(available_quantity=stock_total()).values_list('canteen_id', 'dish_id', 'available_quantity')
+    }
+
+
+def check_stock(canteens, before, first_order_id):
+    # Остаток до нагрузки = остаток после + продано за время нагрузки
+    sold = {
+        (row['order__canteen_id'], row['dish_id']): row['total']
+        for row in OrderItem.objects.filter(order_id__gt=first_order_id, order__canteen_id__in=canteens)
+        .values('order__canteen_id', 'dish_id').annotate(total=Sum('quantity'))
+    }
+    after = stock_snapshot(canteens)
+    mismatched = [
+        {'canteen_id': key[0], 'dish_id': key[1], 'before': quantity, 'after': after.get(key), 'sold': sold.get(key, 0)}
+        for key, quantity in before.items()
+        if after.get(key) is None or after[key] < 0 or after[key] + sold.get(key, 0) != quantity
+    ]
+    return {'checked': len(before), 'sold': sum(sold.values()), 'mismatched': mismatched, 'ok': not mismatched}
+
+
+# Таблицы, в которые пишет прогон. Строки с id больше запомненного перед
+# прогоном созданы нагрузкой
+RUN_MODELS = (Order, TimeSlot, StockHold)
+
+
+def watermarks():
+    return {model: model.objects.aggregate(value=Max('id'))['value'] or 0 for model in RUN_MODELS}
+
+
+def restore(canteens, before, marks):
+    # Возвращает базу к состоянию до прогона, чтобы повторные прогоны были сравнимы
+    with transaction.atomic():
+        # Продажи прогона вычитаются из DailySales тем же apply_sales, которым
+        # их добавили заказы; строки, созданные прогоном, обнуляются и удаляются
+        sold = order_sales(OrderItem, order_id__gt=marks[Order], order__canteen_id__in=canteens)
+        apply_sales({
+            (canteen_id, dish_id, day): (-quantity, -revenue, -orders)
+            for canteen_id, dish_id, day, quantity, revenue, orders in sold
+        })
+        DailySales.objects.filter(canteen_id__in=canteens, orders=0).delete()
+
+        ids = Order.objects.filter(id__gt=marks[Order], canteen_id__in=canteens).values_list('id', flat=True)
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__gt=marks[Order], canteen_id__in=canteens).delete()
+        for model in (TimeSlot, StockHold):
+            model.objects.filter(id__gt=marks[model], canteen_id__in=canteens).delete()
+
+        # Остаток горячих блюд возвращается в строку CanteenDish и заново раскладывается по слотам
+        StockSlot.objects.filter(canteen_dish__canteen_id__in=canteens).update(quantity=0)
+        for (canteen_id, dish_id), quantity in before.items():
+            CanteenDish.objects.filter(canteen_id=canteen_id, dish_id=dish_id).update(quantity=quantity)
+        for canteen_dish_id in CanteenDish.objects.filter(canteen_id__in=canteens, hot_slots__gt=0).values_list('id', flat=True):
+            rebalance_slots(canteen_dish_id)
+        # Остатки изменены через update(): версии меню не откатываются, а растут,
+        # чтобы клиенты, синхронизированные во время прогона, получили остатки заново
+        record_menu_changes(before)
+        bump_menu_version_on_commit(*canteens)
+
+
+def summarize(samples, elapsed):
+    latencies = [sample[0] for sample in samples]
+    queries = [sample[1] for sample in samples]
+    return {
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        },
+        'queries': None if None in queries else {'avg': round(statistics.mean(queries), 2), 'max': max(queries)},
+    }
+
+
+def run(config):
+    fixture = prepare_fixture(config)
+    canteens = fixture['canteens']
+    before = stock_snapshot(canteens)
+    marks = watermarks()
+
+    started = time.perf_counter()
+    if config['processes'] == 1:
+        parts = [run_threads(config, fixture, 0)]
+    else:
+        # Соединения с БД нельзя передавать в дочерние процессы
+        connection.close()
+        with ProcessPoolExecutor(config['processes'], initializer=django.setup) as pool:
+            parts = list(pool.map(
+                run_threads,
+                [config] * config['processes'],
+                [fixture] * config['processes'],
+                [index * config['threads'] for index in range(config['processes'])],
+            ))
+    elapsed = time.perf_counter() - started
+
+    samples = defaultdict(list)
+    for part in parts:
+        for name, values in part.items():
+            samples[name].extend(values)
+
+    scenarios = {}
+    for name, values in sorted(samples.items()):
+        scenarios[name] = summarize(values, elapsed)
+        statuses = defaultdict(int)
+        for _, _, status_code in values:
+            statuses[str(status_code)] += 1
+        scenarios[name]['statuses'] = dict(sorted(statuses.items()))
+        scenarios[name]['errors'] = sum(
+            count for status_code, count in statuses.items() if int(status_code) not in EXPECTED_STATUSES[name]
+        )
+    all_samples = [sample for values in samples.values() for sample in values]
+    if not all_samples:
+        raise RuntimeError('За время прогона не выполнено ни одного запроса')
+
+    report = {
+        'config': config,
+        'database': connection.vendor,
+        'duration': round(elapsed, 2),
+        'total': {**summarize(all_samples, elapsed), 'errors': sum(item['errors'] for item in scenarios.values())},
+        'scenarios': scenarios,
+        'stock': check_stock(canteens, before, marks[Order]),
+    }
+    if not config['keep']:
+        restore(canteens, before, marks)
+    return report
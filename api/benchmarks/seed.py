@@ -0,0 +1,110 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ArchivedOrder, ArchivedOrderItem, Canteen, CanteenDish, Dish, Order, OrderItem, User
+from api.search import bump_index_version
+
+# Все сгенерированные данные помечены префиксом: по нему их находит run_load
+# и удаляет seed_load --clear
+PREFIX = 'load'
+PASSWORD = 'load-pass-123'
+# Доля заказов по часам дня: пик в обед
+HOUR_WEIGHTS = {8: 3, 9: 4, 10: 5, 11: 12, 12: 25, 13: 22, 14: 10, 15: 6, 16: 5, 17: 4, 18: 4}
+
+
+def canteen_name(index):
+    return f'{PREFIX} Столовая {index}'
+
+
+def seeded_canteens():
+    return Canteen.objects.filter(name__startswith=f'{PREFIX} ').order_by('id')
+
+
+def dish_weights(count):
+    # Распределение Ципфа: несколько блюд дают большую часть заказов
+    return [1 / (rank + 1) for rank in range(count)]
+
+
+def seed(canteens=3, dishes=40, users=2000, orders=100000, days=60, stock=100000, chunk_size=10000, seed=1, log=print):
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        canteen_objs = Canteen.objects.bulk_create(
+            Canteen(name=canteen_name(index), address=f'ул. Нагрузочная, {index}') for index in range(canteens)
+        )
+        dish_objs = Dish.objects.bulk_create(
+            Dish(name=f'{PREFIX} Блюдо {index}', price=Decimal(rng.randrange(40, 400)), weight=rng.randrange(100, 500))
+            for index in range(dishes)
+        )
+        CanteenDish.objects.bulk_create(
+            CanteenDish(canteen=canteen, dish=dish, quantity=stock) for canteen in canteen_objs for dish in dish_objs
+        )
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}-worker-{canteen.id}', password=password, role='worker', canteen=canteen)
+            for canteen in canteen_objs
+        ] + [
+            User(username=f'{PREFIX}-student-{index}', password=password) for index in range(users)
+        ], batch_size=chunk_size)
+    # bulk_create не отправляет сигналы: индекс поиска обновляем сами
+    bump_index_version()
+    log(f'Столовых: {canteens}, блюд: {dishes}, пользователей: {users}')
+
+    user_ids = list(User.objects.filter(username__startswith=f'{PREFIX}-student-').values_list('id', flat=True))
+    weights = dish_weights(dishes)
+    hours, hour_weights = zip(*HOUR_WEIGHTS.items())
+    today = timezone.localdate()
+
+    created = 0
+    while created < orders:
+        size = min(chunk_size, orders - created)
+        batch, moments, contents = [], [], []
+        for _ in range(size):
+            day = today - timedelta(days=rng.randrange(1, days + 1))
+            moment = datetime.combine(day, time(rng.choices(hours, hour_weights)[0], rng.randrange(60), rng.randrange(60)))
+            items = {}
+            for dish in rng.choices(dish_objs, weights, k=rng.choices((1, 2, 3), (5, 3, 2))[0]):
+                items[dish] = items.get(dish, 0) + 1
+            batch.append(Order(
+                user_id=rng.choice(user_ids),
+                canteen=rng.choice(canteen_objs),
+                status='closed',
+                total_price=sum(dish.price * quantity for dish, quantity in items.items()),
+            ))
+            moments.append(timezone.make_aware(moment))
+            contents.append(items)
+        # Одна транзакция на порцию: сбой не оставляет заказы без позиций
+        with transaction.atomic():
+            Order.objects.bulk_create(batch)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, dish=dish, quantity=quantity, unit_price=dish.price)
+                for order, items in zip(batch, contents) for dish, quantity in items.items()
+            )
+            # auto_now_add ставит created_at при вставке; время из истории
+            # записывается вторым запросом (bulk_update берет значения как есть)
+            for order, moment in zip(batch, moments):
+                order.created_at = moment
+            Order.objects.bulk_update(batch, ['created_at'], batch_size=1000)
+        created += size
+        log(f'Заказов: {created}/{orders}')
+
+
+def clear(chunk_size=10000):
+    # Удаление порциями, как в cleanup_idempotency_keys. Старые заказы могли
+    # уже уйти в архив (archive_orders)
+    canteen_ids = list(seeded_canteens().values_list('id', flat=True))
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        while True:
+            ids = list(order_model.objects.filter(canteen_id__in=canteen_ids).values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            item_model.objects.filter(order_id__in=ids).delete()
+            order_model.objects.filter(id__in=ids).delete()
+    User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+    Dish.objects.filter(name__startswith=f'{PREFIX} ').delete()
+    Canteen.objects.filter(id__in=canteen_ids).delete()
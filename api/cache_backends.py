@@ -0,0 +1,10 @@
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class NonEvictingLocMemCache(LocMemCache):
+    # Кэш в памяти процесса, который при переполнении удаляет только истекшие
+    # ключи. Для отозванных токенов: вытесненная запись снова сделала бы
+    # отозванный токен действительным
+    def _cull(self):
+        for key in [key for key in self._cache if self._has_expired(key)]:
+            self._delete(key)
@@ -0,0 +1,52 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Состояние маршрутизации текущего запроса (ReplicaRoutingMiddleware).
+# Вне запроса (команды, фоновые задачи) все читается с основной базы
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        # pinned — читать с основной базы до конца запроса
+        self.pinned = pinned
+        self.wrote = False
+
+
+def start_routing(pinned):
+    return _routing.set(RoutingState(pinned))
+
+
+def finish_routing(token):
+    state = _routing.get()
+    _routing.reset(token)
+    return state
+
+
+class ReplicaRouter:
+    # Безопасные чтения — на случайную реплику из DATABASE_REPLICAS, записи и
+    # все, что идет после первой записи в запросе, — на основную базу
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.pinned or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # Вызывается и для select_for_update/get_or_create: после них реплика
+        # может еще не видеть данные, которые запрос только что изменил
+        state = _routing.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и на основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему через репликацию
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# Клиент должен заново загрузить очередь (worker/orders): пропущенные события
+# не сохранились (перезапуск процесса или вытеснение из истории)
+RESYNC_EVENT = 'resync'
+
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    type: str
+    data: dict
+    seq: int = 0
+
+
+class InMemoryBroker:
+    # Pub/sub внутри одного процесса. Для нескольких процессов или серверов
+    # нужен внешний брокер с тем же интерфейсом (publish/subscribe), он
+    # подключается через настройку ORDER_EVENTS_BROKER.
+    def __init__(self, history_size=None):
+        self.history_size = history_size or settings.ORDER_EVENTS_HISTORY
+        # Номера событий начинаются с 1 в каждом процессе, поэтому id события
+        # содержит эпоху брокера: Last-Event-ID от прошлого процесса не
+        # совпадет с событиями нового
+        self.epoch = format(time.time_ns() // 1000, 'x')
+        self._lock = threading.Lock()
+        self._ids = defaultdict(itertools.count)
+        self._history = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, event_type, data):
+        # Может вызываться из синхронного кода в любом потоке
+        with self._lock:
+            seq = next(self._ids[channel]) + 1
+            event = Event(id=self.event_id(seq), type=event_type, data=data, seq=seq)
+            self._history[channel].append(event)
+            subscribers = list(self._subscribers[channel])
+        for subscriber in subscribers:
+            loop, queue = subscriber
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Цикл подписчика уже закрыт (воркер остановлен без отписки):
+                # убираем его, заказ при этом остается созданным
+                with self._lock:
+                    self._subscribers[channel].discard(subscriber)
+        return event
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def parse_event_id(self, event_id):
+        # Номер события этого брокера или None для чужого/некорректного id
+        epoch, _, seq = event_id.rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    async def subscribe(self, channel, last_event_id=None, heartbeat=None):
+        # Отдает пропущенные события после last_event_id, затем новые по мере
+        # публикации. Если за heartbeat секунд ничего не произошло, отдает None.
+        # Если пропущенные события восстановить нельзя, первым отдается
+        # событие resync с id последнего события канала
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            history = self._history[channel]
+            missed = []
+            if last_event_id is not None:
+                seq = self.parse_event_id(last_event_id)
+                last_seq = history[-1].seq if history else 0
+                oldest_seq = history[0].seq if history else 1
+                if seq is None or seq > last_seq or seq < oldest_seq - 1:
+                    missed = [Event(id=self.event_id(last_seq), type=RESYNC_EVENT, data={}, seq=last_seq)]
+                else:
+                    missed = [event for event in history if event.seq > seq]
+            self._subscribers[channel].add(subscriber)
+        try:
+            for event in missed:
+                yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.ORDER_EVENTS_BROKER)()
+
+
+def canteen_channel(canteen_id):
+    return f'canteen:{canteen_id}'
+
+
+def publish_order_event(event_type, canteen_id, data):
+    # Событие уходит только после фиксации транзакции, чтобы кухня не увидела
+    # заказ, который затем откатится. Ошибка брокера не должна превращать
+    # уже зафиксированный заказ в ответ 500
+    transaction.on_commit(
+        lambda: get_broker().publish(canteen_channel(canteen_id), event_type, data),
+        robust=True,
+    )
@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Coalesce, ExtractHour, TruncDate
+from django.utils import timezone
+
+from .models import AggregationCursor, ArchivedOrder, ArchivedOrderItem, CanteenDish, HourlyDemand, Order, OrderItem, stock_total
+
+CURSOR_NAME = 'hourly_demand'
+
+
+def update_hourly_demand(chunk_size=5000):
+    # Инкрементальная агрегация: обрабатываются только заказы после сохраненной
+    # позиции. Свежие заказы (моложе FORECAST_AGGREGATION_LAG) откладываются до
+    # следующего запуска — транзакции с меньшим id могут еще не быть зафиксированы
+    horizon = max(
+        Order.objects.filter(
+            created_at__lt=timezone.now() - settings.FORECAST_AGGREGATION_LAG
+        ).aggregate(value=Max('id'))['value'] or 0,
+        ArchivedOrder.objects.aggregate(value=Max('id'))['value'] or 0,
+    )
+    AggregationCursor.objects.get_or_create(name=CURSOR_NAME)
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Блокировка позиции не дает двум запускам посчитать одни заказы дважды
+            cursor = AggregationCursor.objects.select_for_update().get(name=CURSOR_NAME)
+            if cursor.position >= horizon:
+                return processed
+            upper = min(cursor.position + chunk_size, horizon)
+            _apply_chunk(cursor.position, upper)
+            processed += upper - cursor.position
+            cursor.position = upper
+            cursor.save(update_fields=['position', 'updated_at'])
+
+
+def _apply_chunk(lower, upper):
+    # Группировка выполняется в БД одним запросом на порцию, а приращения
+    # записываются пачками: bulk_update для существующих строк и bulk_create для новых
+    increments = defaultdict(int)
+    moment = Coalesce('order__preparation_time', 'order__created_at')
+    # Старые заказы могли уже уйти в архив (archive_orders) — читаем обе таблицы
+    for model in (OrderItem, ArchivedOrderItem):
+        rows = (
+            model.objects.filter(order_id__gt=lower, order_id__lte=upper, order__canteen__isnull=False)
+            .annotate(moment=moment)
+            .values('dish_id', canteen_id=F('order__canteen_id'), date=TruncDate('moment'), hour=ExtractHour('moment'))
+            .annotate(total=Sum('quantity'))
+            .values_list('canteen_id', 'dish_id', 'date', 'hour', 'total')
+        )
+        for canteen_id, dish_id, date, hour, total in rows:
+            increments[canteen_id, dish_id, date, hour] += total
+    if not increments:
+        return
+
+    existing = HourlyDemand.objects.filter(
+        canteen_id__in={key[0] for key in increments},
+        date__in={key[2] for key in increments},
+    )
+    updated = []
+    for row in existing:
+        key = (row.canteen_id, row.dish_id, row.date, row.hour)
+        if key in increments:
+            row.quantity += increments.pop(key)
+            updated.append(row)
+    HourlyDemand.objects.bulk_update(updated, ['quantity'], batch_size=1000)
+    HourlyDemand.objects.bulk_create([
+        HourlyDemand(canteen_id=canteen_id, dish_id=dish_id, date=date, hour=hour, quantity=quantity)
+        for (canteen_id, dish_id, date, hour), quantity in increments.items()
+    ], batch_size=1000)
+
+
+def forecast_demand(canteen_id, day, weeks=None):
+    # Прогноз на день: средний спрос по часам за те же дни недели последних
+    # weeks недель. Дни без продаж в столовой (закрыта, праздник) не учитываются
+    weeks = weeks or settings.FORECAST_WEEKS
+    dates = [day - timedelta(weeks=index) for index in range(1, weeks + 1)]
+    rows = HourlyDemand.objects.filter(canteen_id=canteen_id, date__in=dates).values_list(
+        'dish_id', 'date', 'hour', 'quantity'
+    )
+
+    observed = set()
+    hourly = defaultdict(lambda: [0] * 24)
+    for dish_id, date, hour, quantity in rows:
+        observed.add(date)
+        hourly[dish_id][hour] += quantity
+    if not observed:
+        return 0, {}
+    return len(observed), {
+        dish_id: [quantity / len(observed) for quantity in hours] for dish_id, hours in hourly.items()
+    }
+
+
+def suggest_quantities(canteen_id, day, weeks=None):
+    # Рекомендуемый остаток на день: прогноз с запасом FORECAST_SAFETY_MARGIN,
+    # restock — сколько нужно добавить к текущему остатку
+    observed, hourly = forecast_demand(canteen_id, day, weeks)
+    stock = {
+        cd.dish_id: cd
+        for cd in CanteenDish.objects.filter(canteen_id=canteen_id).annotate(available_quantity=stock_total()).select_related('dish')
+    }
+    suggestions = []
+    for dish_id, cd in stock.items():
+        hours = hourly.get(dish_id, [0.0] * 24)
+        forecast = sum(hours)
+        suggested = math.ceil(forecast * (1 + settings.FORECAST_SAFETY_MARGIN))
+        suggestions.append({
+            'dish_id': dish_id,
+            'name': cd.dish.name,
+            'quantity': cd.available_quantity,
+            'forecast': round(forecast, 1),
+            'suggested_quantity': suggested,
+            'restock': max(0, suggested - cd.available_quantity),
+            'hourly': [round(value, 1) for value in hours],
+        })
+    suggestions.sort(key=lambda item: (-item['forecast'], item['dish_id']))
+    return {'date': day, 'weeks_observed': observed, 'dishes': suggestions}
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Хешеры с параметрами из настроек. Имена алгоритмов совпадают со
+# стандартными, поэтому уже сохраненные хеши проверяются как раньше, а хеш
+# с другими параметрами (или другим алгоритмом, чем первый в PASSWORD_HASHERS)
+# Django перехеширует при следующем успешном входе (must_update)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # hashlib.scrypt по умолчанию ограничивает память 32 МБ (128 * n * r байт)
+        return 256 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    # Нужен пакет argon2-cffi
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_KIB
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
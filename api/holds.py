@@ -0,0 +1,112 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .menu_cache import bump_menu_version_on_commit
+from .models import StockHold
+from .stock import release_stock_many, reserve_stock_many
+
+
+def set_hold(user_id, canteen_id, dish_id, quantity, hot_slots=None):
+    # Устанавливает резерв блюда в корзине равным quantity (0 — снять резерв)
+    # и продлевает его на STOCK_HOLD_MINUTES. С остатка списывается или
+    # возвращается только разница с прежним резервом. hot_slots — число
+    # слотов блюда, если оно уже известно (см. reserve_stock_many)
+    try:
+        return _set_hold(user_id, canteen_id, dish_id, quantity, hot_slots)
+    except IntegrityError:
+        # Первый резерв блюда одновременно создал параллельный запрос (две
+        # вкладки, повтор запроса). Наша транзакция с ее списанием откачена,
+        # повтор посчитает разницу от его строки
+        return _set_hold(user_id, canteen_id, dish_id, quantity, hot_slots)
+
+
+def _set_hold(user_id, canteen_id, dish_id, quantity, hot_slots):
+    with transaction.atomic():
+        # Блокировка строки резерва не дает очистке вернуть его на остаток
+        # одновременно с изменением (release_expired_holds пропускает такие строки)
+        hold = StockHold.objects.select_for_update().filter(
+            user_id=user_id, canteen_id=canteen_id, dish_id=dish_id
+        ).first()
+        # Просроченный, но еще не возвращенный резерв по-прежнему списан с остатка
+        delta = quantity - (hold.quantity if hold else 0)
+        if delta > 0:
+            reserve_stock_many({(canteen_id, dish_id): delta}, None if hot_slots is None else {(canteen_id, dish_id): hot_slots})
+        elif delta < 0:
+            release_stock_many({(canteen_id, dish_id): -delta})
+        if delta:
+            bump_menu_version_on_commit(canteen_id)
+
+        if not quantity:
+            if hold:
+                hold.delete()
+            return None
+        expires_at = timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+        if hold:
+            hold.quantity, hold.expires_at = quantity, expires_at
+            hold.save(update_fields=['quantity', 'expires_at'])
+            return hold
+        return StockHold.objects.create(
+            user_id=user_id, canteen_id=canteen_id, dish_id=dish_id, quantity=quantity, expires_at=expires_at
+        )
+
+
+def with_active_holds(canteen_dishes, user_id):
+    # Добавляет к строкам CanteenDish активный резерв пользователя (hold_id,
+    # held): заказ читает резервы тем же запросом, что и блюда
+    holds = StockHold.objects.filter(
+        user_id=user_id, canteen_id=OuterRef('canteen_id'), dish_id=OuterRef('dish_id'), expires_at__gt=timezone.now()
+    )
+    return canteen_dishes.annotate(hold_id=Subquery(holds.values('id')[:1]), held=Subquery(holds.values('quantity')[:1]))
+
+
+def consume_holds(user_id, canteen_id, quantities, holds=None):
+    # Переводит активные резервы пользователя в заказ. Возвращает количества,
+    # которые резервами не покрыты и должны быть списаны с остатка обычным
+    # способом. Меняются только строки резервов самого пользователя, строки
+    # CanteenDish, за которые конкурируют все заказы, не блокируются.
+    # holds — уже прочитанные резервы (id, dish_id, количество), см.
+    # with_active_holds; условный UPDATE ниже все равно перепроверяет каждый.
+    # Должна вызываться внутри transaction.atomic
+    now = timezone.now()
+    remaining = Counter(quantities)
+    if holds is None:
+        holds = StockHold.objects.filter(
+            user_id=user_id, canteen_id=canteen_id, dish_id__in=list(quantities), expires_at__gt=now
+        ).values_list('id', 'dish_id', 'quantity')
+    consumed = False
+    for hold_id, dish_id, held in holds:
+        used = min(held, remaining[dish_id])
+        # Условие на срок: резерв, который уже забирает очистка, не используется
+        if StockHold.objects.filter(id=hold_id, quantity__gte=used, expires_at__gt=now).update(quantity=F('quantity') - used):
+            remaining[dish_id] -= used
+            consumed = True
+    if consumed:
+        StockHold.objects.filter(user_id=user_id, canteen_id=canteen_id, quantity=0).delete()
+    return +remaining
+
+
+def release_expired_holds(batch_size=1000):
+    # Возвращает просроченные резервы на остатки порциями в коротких транзакциях.
+    # Строки, заблокированные set_hold, пропускаются до следующего запуска
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = list(
+                StockHold.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now())
+                .values_list('id', 'canteen_id', 'dish_id', 'quantity')[:batch_size]
+            )
+            if not holds:
+                return released
+            quantities = Counter()
+            for _, canteen_id, dish_id, quantity in holds:
+                quantities[canteen_id, dish_id] += quantity
+            StockHold.objects.filter(id__in=[hold[0] for hold in holds]).delete()
+            release_stock_many(quantities)
+            bump_menu_version_on_commit(*(canteen_id for canteen_id, _ in quantities))
+        released += len(holds)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _claim(user_id, endpoint, key, request_hash):
+    # Возвращает (запись, True), если ключ занят этим запросом, или
+    # (существующая запись, False), если запрос с таким ключом уже был.
+    # Запись может исчезнуть между неудачной вставкой и чтением (ее удалил
+    # упавший первый запрос) — тогда вставка повторяется один раз; если ключ
+    # снова занят и снова освобожден, возвращается (None, False)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user_id=user_id, endpoint=endpoint, key=key, request_hash=request_hash
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user_id=user_id, endpoint=endpoint, key=key).first()
+            if record is not None:
+                return record, False
+    return None, False
+
+
+def _in_progress():
+    # Параллельный дубль не ждет первый запрос (это заняло бы поток сервера),
+    # а сразу получает 409: клиент повторит запрос и получит сохраненный ответ
+    response = Response({"error": "Запрос с этим ключом еще выполняется"}, status=status.HTTP_409_CONFLICT)
+    response['Retry-After'] = str(settings.IDEMPOTENCY_RETRY_AFTER)
+    return response
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(endpoint):
+    # Декоратор метода post: при наличии заголовка Idempotency-Key ответ
+    # сохраняется и возвращается при повторных запросах с тем же ключом
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"error": f"Заголовок {IDEMPOTENCY_HEADER} длиннее 255 символов"}, status=status.HTTP_400_BAD_REQUEST)
+
+            request_hash = request_fingerprint(request)
+            record, claimed = _claim(request.user.id, endpoint, key, request_hash)
+
+            if not claimed and record is None:
+                return _in_progress()
+            if not claimed:
+                if record.request_hash != request_hash:
+                    return Response(
+                        {"error": f"{IDEMPOTENCY_HEADER} уже использован для другого запроса"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record.response_status is not None:
+                    return _replay(record)
+                if record.created_at >= timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                    return _in_progress()
+                # Первый запрос завис — выполняем заново
+                IdempotencyKey.objects.filter(user_id=request.user.id, endpoint=endpoint, key=key).delete()
+                record, claimed = _claim(request.user.id, endpoint, key, request_hash)
+                if not claimed:
+                    return _in_progress()
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            # Ошибки сервера не запоминаем, чтобы повтор мог выполниться
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    response_status=response.status_code,
+                    response_body=response.data
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые заказы старше ORDER_ARCHIVE_AFTER_DAYS дней в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, help='Остановиться после N порций')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        archived = batches = 0
+        # Порции переносятся отдельными транзакциями, чтобы не держать блокировки
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_batch(before, options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+        self.stdout.write(f'Перенесено в архив заказов: {archived}')
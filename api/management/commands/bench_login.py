@@ -0,0 +1,74 @@
+import logging
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.benchmarks.rollback import rolled_back
+from api.models import User
+
+HASHERS = {
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'api.hashers.ScryptPasswordHasher',
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+}
+UNLIMITED = {'ip': (10 ** 9, 10 ** 9), 'username': (10 ** 9, 10 ** 9)}
+
+
+class Command(BaseCommand):
+    help = 'Измеряет число входов в секунду на одно ядро для разных хешеров паролей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--hashers', default='pbkdf2,scrypt,argon2')
+
+    def handle(self, *args, **options):
+        # Один процесс — одно ядро: результат масштабируется числом воркеров.
+        # Ответы 400/429 здесь ожидаемы, предупреждения о них не выводим
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        client = APIClient(HTTP_HOST='localhost')
+        url = reverse('authorization')
+        count = options['logins']
+
+        def login(index, password='pass12345'):
+            return client.post(url, {'username': f'bench_{index}', 'password': password}, format='json')
+
+        self.stdout.write(f'{"сценарий":<34} {"входов/с":>10} {"мс/вход":>9}')
+        for name in options['hashers'].split(','):
+            hasher = HASHERS[name]
+            with override_settings(PASSWORD_HASHERS=[hasher], AUTH_THROTTLE_BUCKETS=UNLIMITED, AUTH_COALESCE_SECONDS=0):
+                try:
+                    password = make_password('pass12345')
+                except ValueError as exc:
+                    self.stdout.write(f'{name:<34} пропущен: {exc}')
+                    continue
+                User.objects.filter(username__startswith='bench_').delete()
+                User.objects.bulk_create(User(username=f'bench_{index}', password=password) for index in range(count))
+                self.measure(f'{name}: успешный вход', count, lambda index: login(index), 200)
+                self.measure(f'{name}: неверный пароль', count, lambda index: login(index, 'wrong'), 400)
+
+        cache.clear()
+        with override_settings(AUTH_THROTTLE_BUCKETS=UNLIMITED):
+            login(0)
+            self.measure('повтор тех же логина и пароля', count * 10, lambda index: login(0), 200)
+        with override_settings(AUTH_THROTTLE_BUCKETS={'ip': (1, 1), 'username': (1, 1)}):
+            cache.clear()
+            login(0, 'wrong')
+            self.measure('перебор сверх лимита (429)', count * 10, lambda index: login(0, f'wrong-{index}'), 429)
+
+    def measure(self, label, count, attempt, expected_status):
+        started = time.perf_counter()
+        for index in range(count):
+            response = attempt(index)
+            if response.status_code != expected_status:
+                raise RuntimeError(f'{label}: ответ {response.status_code}, ожидался {expected_status}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<34} {count / elapsed:>10.1f} {elapsed / count * 1000:>9.2f}')
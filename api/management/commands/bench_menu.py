@@ -0,0 +1,55 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.benchmarks.rollback import rolled_back
+from api.menu_cache import SNAPSHOT_KEY, get_menu_version
+from api.models import Canteen, Dish, CanteenDish
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность меню столовой с кэшем и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dishes', type=int, default=50, help='Количество блюд в тестовом меню')
+        parser.add_argument('--requests', type=int, default=500, help='Количество запросов в каждом режиме')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options['dishes'], options['requests'])
+
+    def run(self, dish_count, request_count):
+        canteen = Canteen.objects.create(name='Бенчмарк', address='-')
+        dishes = Dish.objects.bulk_create(
+            Dish(name=f'Блюдо {i}', description='Описание блюда ' * 5, price=Decimal('100.00'), weight=250)
+            for i in range(dish_count)
+        )
+        CanteenDish.objects.bulk_create(
+            CanteenDish(canteen=canteen, dish=dish, quantity=100) for dish in dishes
+        )
+
+        client = APIClient(HTTP_HOST='localhost')
+        url = reverse('canteen-menu', kwargs={'canteen_id': canteen.id})
+
+        def uncached():
+            # Прежний путь: каждый запрос заново читает и сериализует меню
+            cache.delete(SNAPSHOT_KEY.format(canteen_id=canteen.id, version=get_menu_version(canteen.id)))
+            return client.get(url)
+
+        etag = client.get(url)['ETag']
+        modes = [
+            ('без кэша', uncached),
+            ('снимок из кэша', lambda: client.get(url)),
+            ('If-None-Match (304)', lambda: client.get(url, HTTP_IF_NONE_MATCH=etag)),
+        ]
+        self.stdout.write(f'Меню: {dish_count} блюд, {request_count} запросов на режим')
+        for name, call in modes:
+            started = time.perf_counter()
+            for _ in range(request_count):
+                call()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:>22}: {request_count / elapsed:10.1f} запр/с')
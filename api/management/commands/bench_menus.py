@@ -0,0 +1,62 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.benchmarks.rollback import rolled_back
+from api.models import Canteen, Dish, CanteenDish
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и время получения меню всех столовых: по одной столовой и одним запросом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteens', type=int, default=8)
+        parser.add_argument('--dishes', type=int, default=60, help='Блюд в каталоге')
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options['canteens'], options['dishes'], options['rounds'])
+
+    def run(self, canteen_count, dish_count, rounds):
+        canteens = Canteen.objects.bulk_create(
+            Canteen(name=f'Столовая {i}', address=f'ул. Тестовая, {i}') for i in range(canteen_count)
+        )
+        dishes = Dish.objects.bulk_create(
+            Dish(name=f'Блюдо {i}', description='Описание блюда ' * 5, price=Decimal('100.00'),
+                 weight=250, photo=f'dishes/photo_{i}.jpg')
+            for i in range(dish_count)
+        )
+        # Большая часть блюд есть в нескольких столовых
+        CanteenDish.objects.bulk_create(
+            CanteenDish(canteen=canteen, dish=dish, quantity=10)
+            for index, canteen in enumerate(canteens)
+            for dish in dishes[index % 3::2]
+        )
+        ids = ','.join(str(canteen.id) for canteen in canteens)
+        client = APIClient(HTTP_HOST='localhost')
+
+        def per_canteen():
+            responses = [client.get(reverse('canteen-list'))]
+            responses += [client.get(reverse('canteen-menu', kwargs={'canteen_id': canteen.id})) for canteen in canteens]
+            return responses
+
+        modes = [
+            (f'по столовой ({canteen_count + 1} запросов)', per_canteen),
+            ('canteens/menus', lambda: [client.get(reverse('canteen-menus') + f'?ids={ids}')]),
+            ('canteens/menus columnar', lambda: [client.get(reverse('canteen-menus') + f'?ids={ids}&layout=columnar')]),
+        ]
+        self.stdout.write(f'{canteen_count} столовых, {dish_count} блюд, {rounds} повторов, кэш меню очищается перед каждым повтором')
+        for name, call in modes:
+            elapsed = 0.0
+            for _ in range(rounds):
+                cache.clear()
+                started = time.perf_counter()
+                responses = call()
+                elapsed += time.perf_counter() - started
+            size = sum(len(response.content) for response in responses)
+            self.stdout.write(f'{name:>32}: {elapsed / rounds * 1000:8.2f} мс, {size:>8} байт')
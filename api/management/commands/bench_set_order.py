@@ -0,0 +1,114 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, OperationalError
+
+from api.models import User, Canteen, Dish, CanteenDish, Order, OrderItem, stock_total
+from api.stock import InsufficientStock, rebalance_slots, reserve_stock
+
+
+def order_with_lock(user, canteen, dish, quantity):
+    # Прежняя схема: SELECT ... FOR UPDATE, проверка в Python и bulk_update,
+    # блокировка держится всю транзакцию вместе с созданием заказа
+    with transaction.atomic():
+        canteen_dish = CanteenDish.objects.select_for_update().get(canteen=canteen, dish=dish)
+        if canteen_dish.quantity < quantity:
+            return False
+        order = Order.objects.create(user=user, canteen=canteen, status='paid', total_price=dish.price * quantity)
+        OrderItem.objects.bulk_create([OrderItem(order=order, dish=dish, quantity=quantity, unit_price=dish.price)])
+        canteen_dish.quantity -= quantity
+        CanteenDish.objects.bulk_update([canteen_dish], ['quantity'])
+    return True
+
+
+def order_with_conditional_update(user, canteen, dish, quantity):
+    # Текущая схема SetOrderView: условный UPDATE последним шагом транзакции
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(user=user, canteen=canteen, status='paid', total_price=dish.price * quantity)
+            OrderItem.objects.bulk_create([OrderItem(order=order, dish=dish, quantity=quantity, unit_price=dish.price)])
+            reserve_stock(canteen.id, {dish.id: quantity})
+    except InsufficientStock:
+        return False
+    return True
+
+
+STRATEGIES = {
+    'lock': order_with_lock,
+    'conditional': order_with_conditional_update,
+    # Тот же SetOrderView, но блюдо в режиме горячего: остаток разложен по --slots слотам
+    'sharded': order_with_conditional_update,
+}
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест списания остатков: параллельные заказы одного блюда'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,2,4,8,16', help='Числа потоков через запятую')
+        parser.add_argument('--orders', type=int, default=50, help='Заказов на поток')
+        parser.add_argument('--stock', type=int, default=1000, help='Начальный остаток блюда')
+        parser.add_argument('--slots', type=int, default=8, help='Слотов остатка для sharded')
+        parser.add_argument('--strategy', choices=[*STRATEGIES, 'all'], default='all')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # В WAL-режиме читатели не блокируют писателя, а ожидание блокировки
+            # ограничено busy_timeout, как и у серверных СУБД
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+        # Заказы одного блюда в секунду по мере роста конкурентности
+        strategies = list(STRATEGIES) if options['strategy'] == 'all' else [options['strategy']]
+        for thread_count in (int(value) for value in options['threads'].split(',')):
+            for name in strategies:
+                slots = options['slots'] if name == 'sharded' else 0
+                self.run(name, STRATEGIES[name], thread_count, options['orders'], options['stock'], slots)
+
+    def run(self, name, place_order, thread_count, orders_per_thread, stock, slots):
+        canteen = Canteen.objects.create(name='Бенчмарк', address='-')
+        dish = Dish.objects.create(name='Популярное блюдо', price=Decimal('100.00'), weight=250)
+        canteen_dish = CanteenDish.objects.create(canteen=canteen, dish=dish, quantity=stock)
+        if slots:
+            with transaction.atomic():
+                rebalance_slots(canteen_dish.id, slots)
+        users = [User.objects.create(username=f'bench-{name}-{canteen.id}-{i}') for i in range(thread_count)]
+        results = {'ok': 0, 'sold_out': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(user):
+            try:
+                for _ in range(orders_per_thread):
+                    try:
+                        outcome = 'ok' if place_order(user, canteen, dish, 1) else 'sold_out'
+                    except OperationalError:
+                        outcome = 'errors'
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        left = CanteenDish.objects.annotate(available_quantity=stock_total()).get(id=canteen_dish.id).available_quantity
+        sold = sum(OrderItem.objects.filter(order__canteen=canteen).values_list('quantity', flat=True))
+        oversold = sold + left != stock or left < 0
+        total = thread_count * orders_per_thread
+        self.stdout.write(
+            f'{name:>12} x{thread_count:<3}: {total / elapsed:8.1f} заказов/с, успешно {results["ok"]}, '
+            f'нет в наличии {results["sold_out"]}, ошибок БД {results["errors"]}, '
+            f'остаток {left}, продано {sold}, перепродажа: {"ДА" if oversold else "нет"}'
+        )
+
+        Order.objects.filter(canteen=canteen).delete()
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+        canteen.delete()
+        dish.delete()
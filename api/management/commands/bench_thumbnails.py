@@ -0,0 +1,81 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+from PIL import Image, ImageFilter
+from rest_framework.test import APIClient
+
+from api.benchmarks.rollback import rolled_back
+from api.models import Canteen, Dish, CanteenDish
+from api.thumbnails import THUMBNAIL_DIR
+
+
+def camera_photo(width, height, seed):
+    # Шум с размытием сжимается примерно как настоящий снимок еды
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+    image = image.resize((width, height), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость построения миниатюр и объем, который клиент скачивает для меню'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos', type=int, default=24)
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        # Фото пишутся во временный MEDIA_ROOT, данные в БД откатываются в конце
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with rolled_back():
+                self.run(options)
+
+    def run(self, options):
+        canteen = Canteen.objects.create(name='Столовая', address='ул. Тестовая, 1')
+        self.stdout.write(f'Генерация {options["photos"]} фото {options["width"]}x{options["height"]}...')
+        dishes = Dish.objects.bulk_create(
+            Dish(name=f'Блюдо {i}', price=Decimal('100.00'), weight=250,
+                 photo=default_storage.save(f'dishes/photo_{i}.jpg', ContentFile(camera_photo(options['width'], options['height'], i))))
+            for i in range(options['photos'])
+        )
+        CanteenDish.objects.bulk_create(CanteenDish(canteen=canteen, dish=dish, quantity=10) for dish in dishes)
+
+        client = APIClient(HTTP_HOST='localhost')
+        url = reverse('canteen-menu', kwargs={'canteen_id': canteen.id})
+        before = client.get(url)
+        originals = sum(default_storage.size(dish.photo.name) for dish in dishes)
+
+        for workers in sorted({1, options['workers']}):
+            # Уже существующие миниатюры не пересохраняются, поэтому каждый прогон начинается с нуля
+            shutil.rmtree(default_storage.path(THUMBNAIL_DIR), ignore_errors=True)
+            started = time.perf_counter()
+            call_command('generate_thumbnails', workers=workers, force=True, stdout=io.StringIO())
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{workers:>3} процесс(ов): {elapsed:6.2f} с, {len(dishes) / elapsed:6.1f} фото/с')
+
+        cache.clear()
+        after = client.get(url)
+        self.stdout.write(f'JSON меню: {len(before.content)} -> {len(after.content)} байт')
+        self.stdout.write(f'{"оригиналы":>14}: {originals / 1024:10.1f} КБ')
+        variants = [dish['photo_variants'] for dish in after.data]
+        for label in variants[0]:
+            for key in variants[0][label]:
+                paths = [variant[label][key].removeprefix('http://localhost').removeprefix(default_storage.base_url) for variant in variants]
+                size = sum(default_storage.size(path) for path in paths)
+                self.stdout.write(f'{label + " " + key:>14}: {size / 1024:10.1f} КБ ({originals / size:.0f}x меньше)')
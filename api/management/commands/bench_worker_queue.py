@@ -0,0 +1,72 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.benchmarks.rollback import rolled_back
+from api.models import User, Canteen, Dish, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время ответа очереди заказов кухни в зависимости от числа открытых заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='Количество открытых заказов в столовой')
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на каждый размер очереди')
+        parser.add_argument('--explain', action='store_true', help='Показать план запроса')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options['sizes'], options['requests'], options['explain'])
+
+    def run(self, sizes, request_count, explain):
+        canteen = Canteen.objects.create(name='Бенчмарк', address='-')
+        dish = Dish.objects.create(name='Блюдо', price=Decimal('100.00'), weight=250)
+        student = User.objects.create(username=f'bench-student-{canteen.id}')
+        worker = User.objects.create(username=f'bench-worker-{canteen.id}', role='worker', canteen=canteen)
+
+        client = APIClient(HTTP_HOST='localhost')
+        client.cookies['access_token'] = str(RefreshToken.for_user(worker).access_token)
+        url = reverse('worker-order-list')
+        now = timezone.now()
+        created = 0
+
+        for size in sorted(sizes):
+            orders = []
+            for i in range(created, size):
+                scheduled = random.random() < 0.3
+                orders.append(Order(
+                    user=student, canteen=canteen, status=random.choice(['new', 'paid']),
+                    preparation_type='scheduled' if scheduled else 'asap',
+                    preparation_time=now + timedelta(minutes=random.randint(0, 600)) if scheduled else None,
+                    total_price=dish.price,
+                ))
+            orders = Order.objects.bulk_create(orders, batch_size=2000)
+            OrderItem.objects.bulk_create((OrderItem(order=order, dish=dish, unit_price=dish.price) for order in orders), batch_size=2000)
+            created = size
+
+            started = time.perf_counter()
+            for _ in range(request_count):
+                response = client.get(url)
+            elapsed = (time.perf_counter() - started) / request_count
+            self.stdout.write(
+                f'{size:>8} открытых заказов: {elapsed * 1000:7.2f} мс на запрос, '
+                f'{len(response.data["results"])} заказов на странице'
+            )
+
+        if explain:
+            from api.views import WorkerOrderListView
+            from api.pagination import WorkerOrderQueuePagination
+
+            view = WorkerOrderListView()
+            view.request = type('Request', (), {'user': worker})()
+            queryset = view.get_queryset().order_by(*WorkerOrderQueuePagination.ordering)[:21]
+            self.stdout.write(f'{connection.vendor}: {queryset.explain()}')
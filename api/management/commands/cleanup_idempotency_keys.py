@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        # Удаляем порциями, чтобы не держать долгую блокировку таблицы
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(created_at__lt=threshold)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f'Удалено ключей: {deleted}')
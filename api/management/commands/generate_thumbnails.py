@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.menu_cache import bump_menu_version_on_commit
+from api.menu_sync import record_menu_changes
+from api.models import Dish, CanteenDish
+from api.thumbnails import build_thumbnails, thumbnails_outdated
+
+
+def _build(dish_id, name):
+    # Выполняется в дочернем процессе: в БД не ходит, только читает и пишет файлы
+    try:
+        return dish_id, build_thumbnails(name), None
+    except OSError as exc:
+        return dish_id, None, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры фото блюд, у которых их еще нет, в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--force', action='store_true', help='Перестроить миниатюры всех блюд')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сколько блюд сохранять одним запросом')
+
+    def handle(self, *args, **options):
+        dishes = Dish.objects.exclude(photo='').exclude(photo__isnull=True).only('id', 'photo', 'photo_thumbnails')
+        pending = [dish for dish in dishes if options['force'] or thumbnails_outdated(dish)]
+        if not pending:
+            self.stdout.write('Все миниатюры актуальны')
+            return
+
+        started = time.perf_counter()
+        built = []
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = [pool.submit(_build, dish.id, dish.photo.name) for dish in pending]
+            for future in as_completed(futures):
+                dish_id, thumbnails, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Блюдо {dish_id}: {error}')
+                    continue
+                built.append(Dish(id=dish_id, photo_thumbnails=thumbnails))
+                if len(built) >= options['batch_size']:
+                    self.save(built)
+                    built = []
+        self.save(built)
+        elapsed = time.perf_counter() - started
+
+        done = len(pending) - failed
+        self.stdout.write(
+            f'Обработано фото: {done}, ошибок: {failed}, '
+            f'{elapsed:.2f} с ({done / elapsed:.1f} фото/с, процессов: {options["workers"]})'
+        )
+
+    def save(self, dishes):
+        if not dishes:
+            return
+        # bulk_update не вызывает сигналы, поэтому меню помечаем измененным явно
+        with transaction.atomic():
+            Dish.objects.bulk_update(dishes, ['photo_thumbnails'])
+            pairs = list(CanteenDish.objects.filter(dish__in=dishes).values_list('canteen_id', 'dish_id'))
+            record_menu_changes(pairs)
+            bump_menu_version_on_commit(*(canteen_id for canteen_id, _ in pairs))
@@ -0,0 +1,50 @@
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.metrics import parse_prometheus
+
+SORT_KEYS = {
+    'total': lambda h: h['wall'].sum,
+    'slow': lambda h: h['wall'].quantile(0.95),
+    'queries': lambda h: h['queries'].mean,
+}
+
+
+class Command(BaseCommand):
+    help = 'Отчет о самых медленных и "болтливых" (много запросов к БД) эндпоинтах'
+
+    def add_arguments(self, parser):
+        # Метрики хранятся в памяти процессов сервера, у самой команды их нет
+        parser.add_argument('--url', required=True,
+                            help='Адрес /api/v1/_metrics работающего сервера, например '
+                                 'http://127.0.0.1:8000/api/v1/_metrics')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total',
+                            help='total — суммарное время, slow — p95, queries — среднее число запросов')
+
+    def handle(self, *args, **options):
+        request = Request(options['url'])
+        if settings.PROFILING_METRICS_TOKEN:
+            request.add_header('Authorization', f'Bearer {settings.PROFILING_METRICS_TOKEN}')
+        with urlopen(request) as response:
+            endpoints = parse_prometheus(response.read().decode())
+
+        if not endpoints:
+            self.stdout.write('Метрик нет: включите PROFILING_ENABLED на сервере и выполните запросы')
+            return
+
+        rows = sorted(endpoints.items(), key=lambda row: SORT_KEYS[options['sort']](row[1]), reverse=True)
+        header = f'{"эндпоинт":<24}{"запросов":>9}{"ср. мс":>9}{"p95 мс":>9}{"SQL ср.":>9}{"SQL max":>9}{"БД мс":>9}{"рендер мс":>11}{"бюджет":>8}'
+        self.stdout.write(header)
+        for endpoint, h in rows[:options['top']]:
+            budget = settings.PROFILING_QUERY_BUDGETS.get(endpoint)
+            over = budget is not None and h['queries'].max > budget
+            line = (
+                f'{endpoint:<24}{h["wall"].count:>9}{h["wall"].mean * 1000:>9.1f}'
+                f'{h["wall"].quantile(0.95) * 1000:>9.0f}{h["queries"].mean:>9.1f}{h["queries"].max:>9.0f}'
+                f'{h["db"].mean * 1000:>9.1f}{h["render"].mean * 1000:>11.1f}'
+                f'{budget if budget is not None else "-":>8}'
+            )
+            self.stdout.write(self.style.ERROR(line) if over else line)
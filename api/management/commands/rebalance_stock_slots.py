@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import CanteenDish
+from api.stock import rebalance_slots
+
+
+class Command(BaseCommand):
+    help = 'Раскладывает остатки горячих блюд поровну по слотам, включает и выключает режим горячего блюда'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteen', type=int, help='ID столовой')
+        parser.add_argument('--dish', type=int, help='ID блюда')
+        parser.add_argument('--slots', type=int, help='Новое число слотов (для --canteen и --dish)')
+        parser.add_argument('--merge', action='store_true', help='Слить слоты в один остаток и выключить режим')
+
+    def handle(self, *args, **options):
+        if (options['slots'] is not None or options['merge']) and not (options['canteen'] and options['dish']):
+            raise CommandError('--slots и --merge требуют --canteen и --dish')
+        if options['slots'] is not None and options['slots'] < 0:
+            raise CommandError('--slots не может быть отрицательным')
+
+        if options['canteen'] and options['dish']:
+            canteen_dishes = CanteenDish.objects.filter(canteen_id=options['canteen'], dish_id=options['dish'])
+            if not canteen_dishes.exists():
+                raise CommandError('Блюдо не найдено в этой столовой')
+        else:
+            # Без аргументов — все горячие блюда: пополнения из строки CanteenDish
+            # и перекос после заказов раскладываются по слотам заново
+            canteen_dishes = CanteenDish.objects.filter(hot_slots__gt=0)
+            if options['canteen']:
+                canteen_dishes = canteen_dishes.filter(canteen_id=options['canteen'])
+        slot_count = 0 if options['merge'] else options['slots']
+
+        # Каждое блюдо в своей короткой транзакции: заказы ждут только его блокировки
+        for canteen_dish_id, canteen_id, dish_id in canteen_dishes.values_list('id', 'canteen_id', 'dish_id'):
+            with transaction.atomic():
+                total, slots = rebalance_slots(canteen_dish_id, slot_count)
+            self.stdout.write(f'Столовая {canteen_id}, блюдо {dish_id}: остаток {total}, слотов {slots}')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from api.analytics import apply_sales, order_sales
+from api.models import ArchivedOrder, ArchivedOrderItem, DailySales, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает DailySales из истории заказов порциями по id заказа'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Заказов в одной порции')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # Заказы хранятся в двух таблицах (живые и архивные) с общей нумерацией
+        last_id = max(
+            Order.objects.aggregate(value=Max('id'))['value'] or 0,
+            ArchivedOrder.objects.aggregate(value=Max('id'))['value'] or 0,
+        )
+        # Удаление и пересборка — одна транзакция: отчеты до фиксации видят
+        # прежние строки, а не пустую или наполовину собранную таблицу, а сбой
+        # посередине ничего не меняет. Заказы, оформленные во время пересборки,
+        # ждут блокировок строк DailySales до ее конца
+        with transaction.atomic():
+            DailySales.objects.all().delete()
+
+            rows_total = 0
+            for start in range(0, last_id, chunk_size):
+                deltas = {}
+                for model in (OrderItem, ArchivedOrderItem):
+                    rows = order_sales(model, order_id__gt=start, order_id__lte=start + chunk_size)
+                    # Заказ лежит ровно в одной из таблиц, поэтому значения просто складываются
+                    for canteen_id, dish_id, day, quantity, revenue, orders in rows:
+                        previous = deltas.get((canteen_id, dish_id, day), (0, 0, 0))
+                        deltas[canteen_id, dish_id, day] = (
+                            previous[0] + quantity, previous[1] + revenue, previous[2] + orders
+                        )
+                apply_sales(deltas)
+                rows_total += len(deltas)
+                self.stdout.write(f'Заказы до #{min(start + chunk_size, last_id)}: {rows_total} строк')
+        self.stdout.write(self.style.SUCCESS(f'Готово, строк в DailySales: {DailySales.objects.count()}'))
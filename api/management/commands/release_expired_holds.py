@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Возвращает просроченные резервы корзин на остатки блюд'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(options['batch_size'])
+        self.stdout.write(f'Возвращено резервов: {released}')
@@ -0,0 +1,116 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmarks.scenarios import DEFAULT_MIX, run
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX or not weight.isdigit():
+            raise CommandError(f'Неверная доля сценария: {part!r}. Сценарии: {", ".join(DEFAULT_MIX)}')
+        mix[name] = int(weight)
+    return mix
+
+
+class Command(BaseCommand):
+    help = 'Воспроизводит обеденный пик на данных seed_load и сохраняет базовый отчет в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=30.0, help='Длительность прогона (секунды)')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков в каждом процессе')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()))
+        parser.add_argument('--hot-dishes', type=int, default=3, help='Сколько популярных блюд заказывают')
+        parser.add_argument('--status-batch', type=int, default=20, help='Заказов в одной смене статуса')
+        parser.add_argument('--output', help='Куда записать отчет JSON')
+        parser.add_argument('--compare', help='Предыдущий отчет JSON для сравнения')
+        parser.add_argument('--keep', action='store_true', help='Не удалять заказы прогона и не восстанавливать остатки')
+        parser.add_argument(
+            '--url',
+            help='Запущенный сервер с той же базой и SECRET_KEY, например http://127.0.0.1:8000; '
+                 'без него запросы выполняются в процессе через тестовый клиент'
+        )
+
+    def handle(self, *args, **options):
+        # Ошибки запросов учитываются в отчете, трассировки в консоль не выводим
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        if connection.vendor == 'sqlite':
+            # Как в bench_set_order: читатели не блокируют писателя
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+        config = {
+            'duration': options['duration'],
+            'threads': options['threads'],
+            'processes': options['processes'],
+            'mix': parse_mix(options['mix']),
+            'hot_dishes': options['hot_dishes'],
+            'status_batch': options['status_batch'],
+            'keep': options['keep'],
+            'url': options['url'],
+        }
+        try:
+            report = run(config)
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        self.print_report(report, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчет записан в {options["output"]}')
+        if not report['stock']['ok']:
+            raise CommandError(f'Перепродажа или потеря остатков: {report["stock"]["mismatched"]}')
+
+    def print_report(self, report, baseline):
+        self.stdout.write(
+            f'{"сценарий":<14} {"запросов":>9} {"запр/с":>8} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"p99, мс":>9} {"запросов БД":>12} {"ошибок":>7}'
+        )
+        rows = [*report['scenarios'].items(), ('всего', report['total'])]
+        for name, data in rows:
+            latency = data['latency_ms']
+            queries = '-' if self.queries(data) is None else f'{self.queries(data):.2f}'
+            self.stdout.write(
+                f'{name:<14} {data["requests"]:>9} {data["throughput"]:>8.1f} {latency["p50"]:>9.2f} '
+                f'{latency["p95"]:>9.2f} {latency["p99"]:>9.2f} {queries:>12} {data["errors"]:>7}'
+            )
+            previous = self.previous(baseline, name)
+            if previous:
+                self.stdout.write(
+                    f'{"  к базовому":<14} {"":>9} {self.change(data["throughput"], previous["throughput"]):>8} '
+                    + ' '.join(
+                        f'{self.change(latency[key], previous["latency_ms"][key]):>9}' for key in ('p50', 'p95', 'p99')
+                    )
+                    + f' {self.change(self.queries(data), self.queries(previous)):>12}'
+                )
+        stock = report['stock']
+        self.stdout.write(
+            f'Остатки: проверено {stock["checked"]} пар столовая-блюдо, продано {stock["sold"]}, '
+            f'расхождений {len(stock["mismatched"])}'
+        )
+
+    def previous(self, baseline, name):
+        if baseline is None:
+            return None
+        if name == 'всего':
+            return baseline['total']
+        return baseline['scenarios'].get(name)
+
+    def queries(self, data):
+        # Среднее число запросов к БД; при прогоне против сервера (--url) его нет
+        return data['queries'] and data['queries']['avg']
+
+    def change(self, value, previous):
+        if value is None or not previous:
+            return '-'
+        return f'{(value - previous) / previous * 100:+.0f}%'
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import seed
+
+
+class Command(BaseCommand):
+    help = 'Генерирует столовые, блюда, остатки, пользователей и историю заказов для run_load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteens', type=int, default=3)
+        parser.add_argument('--dishes', type=int, default=40)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=100000, help='Заказов в истории (можно миллионы)')
+        parser.add_argument('--days', type=int, default=60, help='За сколько дней распределить историю')
+        parser.add_argument('--stock', type=int, default=100000, help='Начальный остаток каждого блюда')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1, help='Одинаковый seed дает одинаковые данные')
+        parser.add_argument('--clear', action='store_true', help='Только удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seed.clear(options['chunk_size'])
+        if options['clear']:
+            self.stdout.write('Сгенерированные данные удалены')
+            return
+        seed.seed(
+            canteens=options['canteens'], dishes=options['dishes'], users=options['users'],
+            orders=options['orders'], days=options['days'], stock=options['stock'],
+            chunk_size=options['chunk_size'], seed=options['seed'], log=self.stdout.write,
+        )
+        self.stdout.write(f'Готово за {time.perf_counter() - started:.1f} с')
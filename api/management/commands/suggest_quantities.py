@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.forecast import suggest_quantities, update_hourly_demand
+from api.models import Canteen
+
+
+class Command(BaseCommand):
+    help = 'Рекомендует остатки блюд на завтра (или --date) по истории заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteen', type=int, action='append', help='ID столовой (по умолчанию все открытые)')
+        parser.add_argument('--date', type=date.fromisoformat)
+        parser.add_argument('--weeks', type=int, help='Сколько последних недель учитывать')
+        parser.add_argument('--no-update', action='store_true', help='Не обрабатывать новые заказы перед прогнозом')
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.localdate() + timedelta(days=1)
+        canteens = Canteen.objects.filter(id__in=options['canteen']) if options['canteen'] else Canteen.objects.filter(is_open=True)
+        if options['canteen'] and len(canteens) != len(set(options['canteen'])):
+            raise CommandError('Столовая не найдена')
+        if not options['no_update']:
+            update_hourly_demand()
+
+        for canteen in canteens.order_by('id'):
+            report = suggest_quantities(canteen.id, day, options['weeks'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{canteen.name} — {day:%d.%m.%Y}, недель с данными: {report["weeks_observed"]}'
+            ))
+            for dish in report['dishes']:
+                peak = max(range(24), key=dish['hourly'].__getitem__)
+                self.stdout.write(
+                    f'  {dish["name"]:<30} прогноз {dish["forecast"]:>7.1f}  остаток {dish["quantity"]:>5}'
+                    f'  рекомендуется {dish["suggested_quantity"]:>5}  добавить {dish["restock"]:>5}'
+                    + (f'  пик {peak}:00' if dish['forecast'] else '')
+                )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.forecast import update_hourly_demand
+
+
+class Command(BaseCommand):
+    help = 'Добавляет в статистику спроса по часам заказы, появившиеся с прошлого запуска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Заказов в одной порции')
+
+    def handle(self, *args, **options):
+        processed = update_hourly_demand(options['chunk_size'])
+        self.stdout.write(f'Обработано заказов (по id): {processed}')
@@ -0,0 +1,81 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Снимок меню столовой хранится в кэше под ключом с номером версии.
+# Любое изменение остатков или блюд увеличивает версию, поэтому старые снимки
+# просто перестают читаться и вытесняются по таймауту.
+VERSION_KEY = 'menu:version:{canteen_id}'
+SNAPSHOT_KEY = 'menu:snapshot:{canteen_id}:{version}'
+
+
+def _initial_version():
+    # Если ключ версии был вытеснен из кэша, новая версия все равно должна быть
+    # больше всех выданных ранее, иначе клиент со старым ETag получит 304
+    return time.time_ns() // 1000
+
+
+def get_menu_version(canteen_id):
+    key = VERSION_KEY.format(canteen_id=canteen_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_menu_version(canteen_id):
+    key = VERSION_KEY.format(canteen_id=canteen_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_menu_version(canteen_id):
+    key = VERSION_KEY.format(canteen_id=canteen_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.incr(key)
+
+
+def bump_menu_version_on_commit(*canteen_ids):
+    # Версию увеличиваем только после фиксации транзакции: иначе другой запрос
+    # успеет прочитать старые данные и сохранить их под новой версией
+    for canteen_id in set(canteen_ids):
+        transaction.on_commit(lambda canteen_id=canteen_id: bump_menu_version(canteen_id))
+
+
+def menu_etag(canteen_id, version):
+    return f'"menu-{canteen_id}-{version}"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def get_menu_snapshot(canteen_id, version, build):
+    key = SNAPSHOT_KEY.format(canteen_id=canteen_id, version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build()
+        cache.set(key, snapshot, timeout=settings.MENU_CACHE_TIMEOUT)
+    return snapshot
+
+
+async def aget_menu_snapshot(canteen_id, version, abuild):
+    key = SNAPSHOT_KEY.format(canteen_id=canteen_id, version=version)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await abuild()
+        await cache.aset(key, snapshot, timeout=settings.MENU_CACHE_TIMEOUT)
+    return snapshot
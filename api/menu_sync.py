@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from .models import Canteen, CanteenDish, stock_total
+
+# Какие блюда изменились в версии меню столовой. Хранится MENU_CHANGES_RETENTION_HOURS
+# часов; если записи нет, полноту изменений доказать нельзя и клиент получает полный снимок
+CHANGES_KEY = 'menu:changes:{canteen_id}:{version}'
+
+
+def record_menu_changes(pairs):
+    # pairs: пары (canteen_id, dish_id). Сигналы ловят save()/delete(), а списания
+    # остатков идут через update(), поэтому изменения записываются явно, в той
+    # же транзакции. Версия меню каждой затронутой столовой увеличивается одним
+    # UPDATE ... RETURNING: строка столовой заблокирована до фиксации, поэтому
+    # версии столовой выдаются в порядке фиксации, и изменение с меньшей версией
+    # не может стать видно позже большей. Вызов должен быть последней записью
+    # транзакции, чтобы блокировка держалась только на время фиксации
+    dishes = defaultdict(set)
+    for canteen_id, dish_id in pairs:
+        dishes[canteen_id].add(dish_id)
+    if not dishes:
+        return
+    alias = router.db_for_write(Canteen)
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    canteen_ids = sorted(dishes)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {quote(Canteen._meta.db_table)} SET {quote("menu_version")} = {quote("menu_version")} + 1 '
+            f'WHERE {quote("id")} IN ({", ".join(["%s"] * len(canteen_ids))}) RETURNING {quote("id")}, {quote("menu_version")}',
+            canteen_ids
+        )
+        changes = {
+            CHANGES_KEY.format(canteen_id=canteen_id, version=version): sorted(dishes[canteen_id])
+            for canteen_id, version in cursor.fetchall()
+        }
+    transaction.on_commit(
+        lambda: cache.set_many(changes, timeout=settings.MENU_CHANGES_RETENTION_HOURS * 3600), using=alias
+    )
+
+
+def menu_version(canteen_id, using=DEFAULT_DB_ALIAS):
+    return Canteen.objects.using(using).filter(id=canteen_id).values_list('menu_version', flat=True).first() or 0
+
+
+async def amenu_version(canteen_id, using=DEFAULT_DB_ALIAS):
+    return await Canteen.objects.using(using).filter(id=canteen_id).values_list('menu_version', flat=True).afirst() or 0
+
+
+# Версия меню берется с основной базы, а остатки — с реплики, если та уже
+# видит эту версию: версия увеличивается в той же транзакции, что и изменения
+# меню, поэтому реплика с такой же или большей версией содержит их все. С
+# отстающей реплики снимок попал бы в кэш под новой версией, и клиенты видели
+# бы старые остатки до следующего изменения — в этом случае читается основная база
+def menu_read_alias(canteen_id):
+    version = menu_version(canteen_id)
+    alias = router.db_for_read(CanteenDish)
+    if alias != DEFAULT_DB_ALIAS and menu_version(canteen_id, using=alias) < version:
+        alias = DEFAULT_DB_ALIAS
+    return alias, version
+
+
+async def amenu_read_alias(canteen_id):
+    version = await amenu_version(canteen_id)
+    alias = router.db_for_read(CanteenDish)
+    if alias != DEFAULT_DB_ALIAS and await amenu_version(canteen_id, using=alias) < version:
+        alias = DEFAULT_DB_ALIAS
+    return alias, version
+
+
+def menu_delta(canteen_id, since):
+    # Возвращает (версия, остатки изменившихся блюд, id убранных блюд) или None,
+    # если полноту изменений после since доказать нельзя и нужен полный снимок:
+    # разрыв больше MENU_SYNC_MAX_VERSIONS, запись о версии истекла или
+    # вытеснена из кэша, или транзакция уже зафиксирована, но еще не сохранила
+    # свою запись. Версия читается до остатков: клиент в худшем случае получит
+    # в следующей дельте уже известные ему строки
+    alias, version = menu_read_alias(canteen_id)
+    if since > version or version - since > settings.MENU_SYNC_MAX_VERSIONS:
+        return None
+    keys = [CHANGES_KEY.format(canteen_id=canteen_id, version=number) for number in range(since + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+
+    changed_ids = set().union(*changes.values())
+    if not changed_ids:
+        return version, [], []
+
+    canteen_dishes = CanteenDish.objects.using(alias).annotate(available_quantity=stock_total()).filter(
+        canteen_id=canteen_id,
+        dish_id__in=changed_ids,
+        available_quantity__gt=0
+    ).select_related('dish')
+
+    dishes = []
+    for cd in canteen_dishes:
+        dish = cd.dish
+        dish.available_quantity = cd.available_quantity
+        dishes.append(dish)
+
+    removed = sorted(changed_ids - {dish.id for dish in dishes})
+    return version, dishes, removed
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .models import CanteenDish, stock_total
+from .thumbnails import thumbnail_urls
+
+MENU_FIELDS = (
+    'canteen_id', 'canteen__name', 'canteen__address', 'canteen__is_open', 'available_quantity',
+    'dish_id', 'dish__name', 'dish__description', 'dish__price', 'dish__weight', 'dish__photo',
+    'dish__photo_thumbnails',
+)
+
+
+def menu_rows(canteen_ids=None):
+    # Меню нескольких столовых одним запросом: CanteenDish JOIN Dish JOIN Canteen.
+    # Без списка id берутся все открытые столовые.
+    # available_quantity — остаток с учетом слотов горячих блюд (stock_total)
+    queryset = CanteenDish.objects.annotate(available_quantity=stock_total()).filter(available_quantity__gt=0)
+    if canteen_ids is None:
+        queryset = queryset.filter(canteen__is_open=True)
+    else:
+        queryset = queryset.filter(canteen_id__in=canteen_ids)
+    return list(queryset.order_by('canteen_id', 'dish_id').values_list(*MENU_FIELDS))
+
+
+def _price(value):
+    return f'{value:.2f}'
+
+
+def _has_thumbnails(photo, thumbnails):
+    # Миниатюры, построенные не из текущего фото, не отдаем
+    return bool(photo) and bool(thumbnails) and thumbnails.get('source') == photo
+
+
+def _dish(dish_id, name, description, price, weight, photo, thumbnails):
+    return {
+        'id': dish_id,
+        'name': name,
+        'description': description,
+        'price': _price(price),
+        'weight': weight,
+        'photo': default_storage.url(photo) if photo else None,
+        'photo_variants': thumbnail_urls(thumbnails) if _has_thumbnails(photo, thumbnails) else None,
+    }
+
+
+def nested_menus(rows):
+    # Тот же формат блюд, что и у canteens/<id>/menu, сгруппированный по столовым
+    menus = []
+    current = None
+    for canteen_id, name, address, is_open, quantity, dish_id, dish_name, description, price, weight, photo, thumbnails in rows:
+        if current is None or current['canteen']['id'] != canteen_id:
+            current = {
+                'canteen': {'id': canteen_id, 'name': name, 'address': address, 'is_open': is_open},
+                'dishes': [],
+            }
+            menus.append(current)
+        current['dishes'].append({
+            **_dish(dish_id, dish_name, description, price, weight, photo, thumbnails),
+            'available_quantity': quantity,
+        })
+    return menus
+
+
+def search_results(rows):
+    # Результаты поиска (api/search.py): каждое блюдо один раз, в порядке
+    # релевантности, с наличием в каждой столовой
+    results = []
+    for canteen_id, name, address, is_open, quantity, dish_id, dish_name, description, price, weight, photo, thumbnails, rank in rows:
+        if not results or results[-1]['id'] != dish_id:
+            results.append({
+                **_dish(dish_id, dish_name, description, price, weight, photo, thumbnails),
+                'rank': round(rank, 4),
+                'canteens': [],
+            })
+        results[-1]['canteens'].append({
+            'id': canteen_id, 'name': name, 'address': address, 'is_open': is_open, 'available_quantity': quantity,
+        })
+    return results
+
+
+def columnar_menus(rows):
+    # Компактный формат: параллельные массивы полей столовых и блюд (каждое блюдо
+    # один раз, даже если оно есть в нескольких столовых) и матрица остатков
+    # столовая x блюдо. Фото передаются без общего префикса media_url.
+    canteen_index = {}
+    dish_index = {}
+    canteens = {'id': [], 'name': [], 'address': [], 'is_open': []}
+    dishes = {'id': [], 'name': [], 'description': [], 'price': [], 'weight': [], 'photo': [], 'photo_variants': []}
+    cells = []
+
+    for canteen_id, name, address, is_open, quantity, dish_id, dish_name, description, price, weight, photo, thumbnails in rows:
+        if canteen_id not in canteen_index:
+            canteen_index[canteen_id] = len(canteen_index)
+            for key, value in zip(canteens, (canteen_id, name, address, is_open)):
+                canteens[key].append(value)
+        if dish_id not in dish_index:
+            dish_index[dish_id] = len(dish_index)
+            variants = thumbnails['sizes'] if _has_thumbnails(photo, thumbnails) else None
+            values = (dish_id, dish_name, description, _price(price), weight, photo or None, variants)
+            for key, value in zip(dishes, values):
+                dishes[key].append(value)
+        cells.append((canteen_index[canteen_id], dish_index[dish_id], quantity))
+
+    quantity = [[0] * len(dish_index) for _ in canteen_index]
+    for row, column, value in cells:
+        quantity[row][column] = value
+
+    return {
+        'media_url': settings.MEDIA_URL,
+        'canteens': canteens,
+        'dishes': dishes,
+        'quantity': quantity,
+    }
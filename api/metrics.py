@@ -0,0 +1,121 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Границы корзин гистограмм (верхние, включительно), как у Prometheus
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+METRICS = (
+    ('wall', 'canteen_request_duration_seconds', 'Время обработки запроса', DURATION_BUCKETS),
+    ('queries', 'canteen_request_db_queries', 'Количество запросов к БД за запрос', QUERY_BUCKETS),
+    ('db', 'canteen_request_db_duration_seconds', 'Время запросов к БД за запрос', DURATION_BUCKETS),
+    ('render', 'canteen_request_render_duration_seconds', 'Время сериализации ответа в JSON', DURATION_BUCKETS),
+)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        # Оценка сверху: верхняя граница корзины, в которую попадает квантиль
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = defaultdict(
+                lambda: {key: Histogram(buckets) for key, _, _, buckets in METRICS}
+            )
+
+    def observe(self, endpoint, **values):
+        with self._lock:
+            histograms = self.endpoints[endpoint]
+            for key, value in values.items():
+                histograms[key].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(histograms) for endpoint, histograms in self.endpoints.items()}
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for key, name, description, buckets in METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for endpoint in sorted(snapshot):
+                histogram = snapshot[endpoint][key]
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+SAMPLE_RE = re.compile(r'^(\w+?)(_bucket|_sum|_count)\{endpoint="([^"]*)"(?:,le="([^"]+)")?\} (\S+)$')
+
+
+def parse_prometheus(text):
+    # Обратное преобразование вывода to_prometheus (для отчета по работающему серверу)
+    keys = {name: (key, buckets) for key, name, _, buckets in METRICS}
+    endpoints = defaultdict(lambda: {key: Histogram(buckets) for key, _, _, buckets in METRICS})
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if not match or match.group(1) not in keys:
+            continue
+        name, suffix, endpoint, bound, value = match.groups()
+        key, buckets = keys[name]
+        histogram = endpoints[endpoint][key]
+        if suffix == '_sum':
+            histogram.sum = float(value)
+        elif suffix == '_count':
+            histogram.count = int(float(value))
+        elif bound != '+Inf':
+            histogram.counts[buckets.index(type(buckets[0])(bound))] = int(float(value))
+    for histograms in endpoints.values():
+        for histogram in histograms.values():
+            # Корзины в тексте накопительные — возвращаем к поштучным
+            previous = 0
+            for index, cumulative in enumerate(histogram.counts[:-1]):
+                histogram.counts[index] = cumulative - previous
+                previous = cumulative
+            histogram.counts[-1] = histogram.count - previous
+            histogram.max = histogram.quantile(1.0)
+    return dict(endpoints)
+
+
+registry = MetricsRegistry()
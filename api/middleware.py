@@ -0,0 +1,146 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .db_router import finish_routing, start_routing
+from .metrics import registry
+
+logger = logging.getLogger('api.profiling')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class ProfilingMiddleware:
+    # Собирает по имени URL время ответа, число и время запросов к БД и время
+    # рендеринга ответа. Включается настройкой PROFILING_ENABLED.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        request._profiling_render_time = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        self.record(request, time.perf_counter() - started, counter)
+        return response
+
+    async def __acall__(self, request):
+        # Асинхронные представления выполняют запросы в других потоках,
+        # поэтому для них учитывается только время ответа
+        request._profiling_render_time = 0.0
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, time.perf_counter() - started, None)
+        return response
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после представления: засекаем время до и после
+        started = time.perf_counter()
+
+        def finished(rendered):
+            request._profiling_render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(finished)
+        return response
+
+    def record(self, request, wall, counter):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.url_name if match and match.url_name else 'unresolved'
+        values = {'wall': wall, 'render': request._profiling_render_time}
+        if counter is not None:
+            values.update(queries=counter.count, db=counter.duration)
+        registry.observe(endpoint, **values)
+
+        if counter is None:
+            return
+        budget = settings.PROFILING_QUERY_BUDGETS.get(endpoint)
+        if budget is not None and counter.count > budget:
+            message = f'{endpoint}: {counter.count} запросов к БД при бюджете {budget}'
+            if settings.PROFILING_FAIL_ON_BUDGET:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+class ReplicaRoutingMiddleware:
+    # Безопасные запросы читают с реплик. Запрос с записью (и любой не-GET)
+    # работает с основной базой и ставит cookie, по которой следующие запросы
+    # клиента DB_PRIMARY_STICKY_SECONDS секунд тоже идут на основную базу:
+    # после оформления заказа пользователь сразу видит его в истории
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = start_routing(self.pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            state = finish_routing(token)
+        return self.stick(request, response, state)
+
+    async def __acall__(self, request):
+        token = start_routing(self.pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = finish_routing(token)
+        return self.stick(request, response, state)
+
+    def pinned(self, request):
+        if request.method not in self.safe_methods:
+            return True
+        try:
+            return float(request.COOKIES.get(settings.DB_PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stick(self, request, response, state):
+        if settings.DATABASE_REPLICAS and (state.wrote or request.method not in self.safe_methods):
+            window = settings.DB_PRIMARY_STICKY_SECONDS
+            response.set_cookie(
+                settings.DB_PRIMARY_COOKIE, f'{time.time() + window:.3f}',
+                max_age=window, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_order_preparation_time_order_preparation_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['canteen', 'status', 'created_at'], name='order_canteen_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(models.F('canteen'), models.Case(models.When(preparation_type='asap', then=models.Value(0)), default=models.Value(1), output_field=models.IntegerField()), models.Case(models.When(preparation_type='scheduled', then=django.db.models.functions.comparison.Coalesce('preparation_time', 'created_at')), default=models.F('created_at'), output_field=models.DateTimeField()), models.F('id'), condition=models.Q(('status__in', ('new', 'paid'))), name='order_worker_queue_idx'),
+        ),
+    ]
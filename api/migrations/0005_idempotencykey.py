@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_worker_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=100, verbose_name='Эндпоинт')),
+                ('key', models.CharField(max_length=255, verbose_name='Ключ')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='Хэш запроса')),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Код ответа')),
+                ('response_body', models.JSONField(blank=True, null=True, verbose_name='Тело ответа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Время создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+                'unique_together': {('user', 'endpoint', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canteen',
+            name='slot_max_dishes',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Максимум блюд в слоте'),
+        ),
+        migrations.AddField(
+            model_name='canteen',
+            name='slot_max_orders',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Максимум заказов в слоте'),
+        ),
+        migrations.AddField(
+            model_name='canteen',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=10, verbose_name='Длина слота (минуты)'),
+        ),
+        migrations.CreateModel(
+            name='TimeSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='Начало слота')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('dishes', models.PositiveIntegerField(default=0, verbose_name='Блюд')),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_slots', to='api.canteen', verbose_name='Столовая')),
+            ],
+            options={
+                'verbose_name': 'Слот приготовления',
+                'verbose_name_plural': 'Слоты приготовления',
+                'unique_together': {('canteen', 'start')},
+            },
+        ),
+    ]
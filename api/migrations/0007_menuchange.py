@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_canteen_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dish_id', models.BigIntegerField(verbose_name='ID блюда')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Время изменения')),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_changes', to='api.canteen', verbose_name='Столовая')),
+            ],
+            options={
+                'verbose_name': 'Изменение меню',
+                'verbose_name_plural': 'Изменения меню',
+                'indexes': [models.Index(fields=['canteen', 'id'], name='menuchange_canteen_id_idx')],
+            },
+        ),
+    ]
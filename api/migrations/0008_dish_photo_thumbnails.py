@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_menuchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='photo_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Миниатюры фото'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_dish_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Продано, шт.')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов с блюдом')),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.canteen', verbose_name='Столовая')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.dish', verbose_name='Блюдо')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'indexes': [models.Index(fields=['canteen', 'date'], name='dailysales_canteen_date_idx'), models.Index(fields=['date'], name='dailysales_date_idx')],
+                'unique_together': {('canteen', 'dish', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dailysales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregationCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Агрегация')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Последний id заказа')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Время обновления')),
+            ],
+            options={
+                'verbose_name': 'Позиция агрегации',
+                'verbose_name_plural': 'Позиции агрегаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Час')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Продано, шт.')),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_demand', to='api.canteen', verbose_name='Столовая')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_demand', to='api.dish', verbose_name='Блюдо')),
+            ],
+            options={
+                'verbose_name': 'Спрос за час',
+                'verbose_name_plural': 'Спрос по часам',
+                'indexes': [models.Index(fields=['canteen', 'date'], name='hourlydemand_canteen_date_idx')],
+                'unique_together': {('canteen', 'dish', 'date', 'hour')},
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_archive(apps, schema_editor):
+    # PostgreSQL: архив секционируется по месяцам created_at (секции создает
+    # archive_orders). Первичный ключ секционированной таблицы обязан включать
+    # ключ секционирования, поэтому он составной (id, created_at).
+    # Таблица только что создана и пуста, ее можно пересоздать.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE api_archivedorder RENAME TO api_archivedorder_plain')
+    schema_editor.execute(
+        'CREATE TABLE api_archivedorder (LIKE api_archivedorder_plain INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (created_at)'
+    )
+    schema_editor.execute('DROP TABLE api_archivedorder_plain CASCADE')
+    schema_editor.execute('ALTER TABLE api_archivedorder ADD PRIMARY KEY (id, created_at)')
+    schema_editor.execute(
+        'ALTER TABLE api_archivedorder ADD CONSTRAINT api_archivedorder_user_id_fk '
+        'FOREIGN KEY (user_id) REFERENCES api_user (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    schema_editor.execute(
+        'ALTER TABLE api_archivedorder ADD CONSTRAINT api_archivedorder_canteen_id_fk '
+        'FOREIGN KEY (canteen_id) REFERENCES api_canteen (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    schema_editor.execute('CREATE INDEX api_archivedorder_canteen_id ON api_archivedorder (canteen_id)')
+    schema_editor.execute(
+        'CREATE INDEX archivedorder_user_idx ON api_archivedorder (user_id, created_at DESC, id DESC)'
+    )
+    schema_editor.execute('CREATE TABLE api_archivedorder_default PARTITION OF api_archivedorder DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_demand_forecast'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'verbose_name': 'Заказ', 'verbose_name_plural': 'Заказы'},
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('paid', 'Оплачен'), ('ready', 'Готов к выдаче'), ('closed', 'Закрыт')], max_length=10, verbose_name='Статус')),
+                ('preparation_type', models.CharField(choices=[('asap', 'Как можно скорее'), ('scheduled', 'Ко времени')], max_length=10, verbose_name='Тип приготовления')),
+                ('preparation_time', models.DateTimeField(blank=True, null=True, verbose_name='Время приготовления')),
+                ('created_at', models.DateTimeField(verbose_name='Время создания')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Итоговая цена')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Время архивации')),
+                ('canteen', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_orders', to='api.canteen', verbose_name='Столовая')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архивные заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_order_items', to='api.dish', verbose_name='Блюдо')),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.archivedorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Позиция архивного заказа',
+                'verbose_name_plural': 'Позиции архивных заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='archivedorder_user_idx'),
+        ),
+        migrations.RunPython(partition_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='api.canteen', verbose_name='Столовая')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='api.dish', verbose_name='Блюдо')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Резерв в корзине',
+                'verbose_name_plural': 'Резервы в корзинах',
+                'unique_together': {('user', 'canteen', 'dish')},
+            },
+        ),
+    ]
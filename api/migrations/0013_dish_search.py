@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+def create_search_indexes(apps, schema_editor):
+    # PostgreSQL: полнотекстовый индекс по названию и описанию и триграммный
+    # индекс по названию (опечатки и ввод начала слова). Выражение
+    # to_tsvector должно совпадать с api.search.DishDocument, иначе индекс
+    # не будет использоваться. На остальных базах поиск идет по индексу в памяти
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        "CREATE INDEX dish_search_idx ON api_dish "
+        "USING gin (to_tsvector('russian'::regconfig, name || ' ' || description))"
+    )
+    schema_editor.execute('CREATE INDEX dish_name_trgm_idx ON api_dish USING gin (name gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS dish_search_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS dish_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_stockhold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['price'], name='dish_price_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
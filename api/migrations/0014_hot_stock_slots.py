@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_dish_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canteendish',
+            name='hot_slots',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Слотов остатка (горячее блюдо)'),
+        ),
+        migrations.CreateModel(
+            name='StockSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Номер слота')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('canteen_dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='api.canteendish', verbose_name='Блюдо в столовой')),
+            ],
+            options={
+                'verbose_name': 'Слот остатка',
+                'verbose_name_plural': 'Слоты остатков',
+                'unique_together': {('canteen_dish', 'slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def start_after_menu_log(apps, schema_editor):
+    # Клиенты передают в ?since= номер последней записи прежнего журнала.
+    # Версии начинаются с него: клиент с последним номером продолжит получать
+    # дельты, а с более старым получит полный снимок (записей об изменениях
+    # для версий ниже начальной нет)
+    MenuChange = apps.get_model('api', 'MenuChange')
+    Canteen = apps.get_model('api', 'Canteen')
+    db = schema_editor.connection.alias
+    last = MenuChange.objects.using(db).aggregate(value=Max('id'))['value'] or 0
+    Canteen.objects.using(db).update(menu_version=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_hot_stock_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canteen',
+            name='menu_version',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Версия меню'),
+        ),
+        migrations.RunPython(start_after_menu_log, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='MenuChange',
+        ),
+    ]
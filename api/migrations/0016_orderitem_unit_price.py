@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_unit_price(apps, schema_editor):
+    # Цена на момент старых заказов не сохранялась: берем текущую цену блюда,
+    # то есть ту же, по которой их выручку считала пересборка отчетов
+    Dish = apps.get_model('api', 'Dish')
+    db = schema_editor.connection.alias
+    price = Subquery(Dish.objects.using(db).filter(id=OuterRef('dish_id')).values('price')[:1])
+    for name in ('OrderItem', 'ArchivedOrderItem'):
+        apps.get_model('api', name).objects.using(db).filter(unit_price__isnull=True).update(unit_price=price)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_menu_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True, verbose_name='Цена за штуку'),
+        ),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True, verbose_name='Цена за штуку'),
+        ),
+        migrations.RunPython(fill_unit_price, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Цена за штуку'),
+        ),
+        migrations.AlterField(
+            model_name='archivedorderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Цена за штуку'),
+        ),
+    ]
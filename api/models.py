@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Case, When, Value, F, Q, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from decimal import Decimal
@@ -8,6 +10,14 @@ class Canteen(models.Model):
     address = models.CharField(max_length=255, verbose_name="Адрес")
     is_open = models.BooleanField(default=True, verbose_name="Открыто/Закрыто")
     # В будущем можно добавить поля с часами работы для автоматического определения статуса
+    # Ограничения для заказов 'ко времени': длина слота и вместимость одного слота
+    slot_minutes = models.PositiveSmallIntegerField(default=10, verbose_name="Длина слота (минуты)")
+    slot_max_orders = models.PositiveIntegerField(null=True, blank=True, verbose_name="Максимум заказов в слоте")
+    slot_max_dishes = models.PositiveIntegerField(null=True, blank=True, verbose_name="Максимум блюд в слоте")
+    # Версия меню для инкрементальной синхронизации (canteens/<id>/menu?since=<версия>).
+    # Увеличивается в каждой транзакции, меняющей остатки или блюда столовой
+    # (api/menu_sync.py), поэтому выдается в порядке фиксации транзакций
+    menu_version = models.BigIntegerField(default=0, editable=False, verbose_name="Версия меню")
 
     def __str__(self):
         return self.name
@@ -31,6 +41,8 @@ class Dish(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Цена")
     weight = models.PositiveIntegerField(verbose_name="Вес (в граммах)")
     photo = models.ImageField(upload_to='dishes/', blank=True, null=True, verbose_name="Фото")
+    # Пути к миниатюрам разных размеров (api/thumbnails.py) и имя фото, из которого они построены
+    photo_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Миниатюры фото")
 
     def __str__(self):
         return self.name
@@ -38,11 +50,19 @@ class Dish(models.Model):
     class Meta:
         verbose_name = "Блюдо"
         verbose_name_plural = "Блюда"
+        # Фильтр поиска по цене (dishes/search). Индексы для поиска по тексту
+        # создаются на PostgreSQL миграцией 0013
+        indexes = [
+            models.Index(fields=['price'], name='dish_price_idx'),
+        ]
 
 class CanteenDish(models.Model):
     canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE)
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=0, verbose_name="Доступное количество")
+    # Горячее блюдо: остаток разложен по hot_slots строкам StockSlot, и
+    # параллельные заказы списывают с разных строк (api/stock.py). 0 — обычный режим
+    hot_slots = models.PositiveSmallIntegerField(default=0, verbose_name="Слотов остатка (горячее блюдо)")
 
     class Meta:
         unique_together = ('canteen', 'dish') # Гарантирует, что пара столовая-блюдо уникальна
@@ -52,6 +72,58 @@ class CanteenDish(models.Model):
     def __str__(self):
         return f"{self.dish.name} в {self.canteen.name} - {self.quantity} шт."
 
+class StockSlot(models.Model):
+    # Часть остатка горячего блюда. Пополнение попадает в строку CanteenDish,
+    # по слотам его раскладывает rebalance_stock_slots; остаток блюда —
+    # сумма строки CanteenDish и всех слотов (stock_total)
+    canteen_dish = models.ForeignKey(CanteenDish, on_delete=models.CASCADE, related_name='slots', verbose_name="Блюдо в столовой")
+    slot = models.PositiveSmallIntegerField(verbose_name="Номер слота")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Количество")
+
+    def __str__(self):
+        return f"{self.canteen_dish_id} / {self.slot}: {self.quantity} шт."
+
+    class Meta:
+        unique_together = ('canteen_dish', 'slot')
+        verbose_name = "Слот остатка"
+        verbose_name_plural = "Слоты остатков"
+
+def stock_total():
+    # Остаток для выборок CanteenDish (меню, поиск, админка): у горячих блюд
+    # к строке CanteenDish добавляется сумма слотов, у обычных подзапрос не выполняется
+    slots = StockSlot.objects.filter(canteen_dish=OuterRef('pk')).values('canteen_dish').annotate(total=Sum('quantity')).values('total')
+    return Case(
+        When(hot_slots=0, then=F('quantity')),
+        default=F('quantity') + Coalesce(Subquery(slots), 0),
+        output_field=models.PositiveIntegerField()
+    )
+
+# Заказы, которые находятся в очереди на кухне
+ACTIVE_ORDER_STATUSES = ('new', 'paid')
+
+# Переходы статуса, доступные работнику: новый статус -> из каких статусов
+# (оплачен -> готов к выдаче -> закрыт)
+ORDER_STATUS_TRANSITIONS = {
+    'ready': ('paid',),
+    'closed': ('ready',),
+}
+
+def order_queue_priority():
+    # 'asap' заказы получают приоритет (0), 'scheduled' - (1)
+    return Case(
+        When(preparation_type='asap', then=Value(0)),
+        default=Value(1),
+        output_field=models.IntegerField()
+    )
+
+def order_queue_time():
+    # Время создания для 'asap' и время готовки для 'scheduled'
+    return Case(
+        When(preparation_type='scheduled', then=Coalesce('preparation_time', 'created_at')),
+        default=F('created_at'),
+        output_field=models.DateTimeField()
+    )
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('new', 'Новый'),
@@ -77,19 +149,182 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
-        ordering = ['-created_at']
+        # Без сортировки по умолчанию: каждый запрос к горячей таблице задает
+        # порядок сам (история и очередь кухни — через keyset-пагинацию)
+        indexes = [
+            models.Index(fields=['canteen', 'status', 'created_at'], name='order_canteen_status_idx'),
+            # Очередь кухни: частичный индекс по тем же выражениям, что и сортировка
+            # в WorkerOrderListView, чтобы первые N заказов читались без сортировки
+            models.Index(
+                F('canteen'), order_queue_priority(), order_queue_time(), F('id'),
+                condition=Q(status__in=ACTIVE_ORDER_STATUSES),
+                name='order_worker_queue_idx'
+            ),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name="Заказ")
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='order_items', verbose_name="Блюдо")
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
+    # Цена блюда на момент заказа: по ней считаются выручка и пересборка отчетов
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Цена за штуку")
 
     def __str__(self):
         return f"{self.quantity} x {self.dish.name} в заказе №{self.order.id}"
     
     def get_cost(self):
-        return self.dish.price * self.quantity
+        return self.unit_price * self.quantity
 
     class Meta:
         verbose_name = "Позиция заказа"
-        verbose_name_plural = "Позиции заказа"
\ No newline at end of file
+        verbose_name_plural = "Позиции заказа"
+
+class TimeSlot(models.Model):
+    # Счетчики заказов 'ко времени' в одном слоте столовой. Вместимость
+    # проверяется и увеличивается одним условным UPDATE, как и остатки блюд
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='time_slots', verbose_name="Столовая")
+    start = models.DateTimeField(verbose_name="Начало слота")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов")
+    dishes = models.PositiveIntegerField(default=0, verbose_name="Блюд")
+
+    def __str__(self):
+        return f"{self.canteen.name}: {self.start:%d.%m %H:%M} - {self.orders} заказов"
+
+    class Meta:
+        unique_together = ('canteen', 'start')
+        verbose_name = "Слот приготовления"
+        verbose_name_plural = "Слоты приготовления"
+
+class IdempotencyKey(models.Model):
+    # Сохраненный ответ на запрос с заголовком Idempotency-Key: повтор запроса
+    # с тем же ключом получает этот ответ без повторного оформления заказа
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys', verbose_name="Пользователь")
+    endpoint = models.CharField(max_length=100, verbose_name="Эндпоинт")
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    request_hash = models.CharField(max_length=64, verbose_name="Хэш запроса")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Код ответа")
+    response_body = models.JSONField(null=True, blank=True, verbose_name="Тело ответа")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Время создания")
+
+    def __str__(self):
+        return f"{self.endpoint}: {self.key}"
+
+    class Meta:
+        unique_together = ('user', 'endpoint', 'key')
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+
+class DailySales(models.Model):
+    # Предагрегированные продажи (столовая x блюдо x день) для отчетов: обновляются
+    # после каждого заказа (api/analytics.py), пересобираются командой rebuild_sales_rollup
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Столовая")
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Блюдо")
+    date = models.DateField(verbose_name="День")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Продано, шт.")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Выручка")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов с блюдом")
+
+    def __str__(self):
+        return f"{self.date}: {self.dish_id} в столовой {self.canteen_id}"
+
+    class Meta:
+        unique_together = ('canteen', 'dish', 'date')
+        indexes = [
+            models.Index(fields=['canteen', 'date'], name='dailysales_canteen_date_idx'),
+            models.Index(fields=['date'], name='dailysales_date_idx'),
+        ]
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+
+class HourlyDemand(models.Model):
+    # Спрос по часам (столовая x блюдо x день x час) для прогноза (api/forecast.py).
+    # Время — preparation_time заказа ко времени, иначе время оформления
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='hourly_demand', verbose_name="Столовая")
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='hourly_demand', verbose_name="Блюдо")
+    date = models.DateField(verbose_name="День")
+    hour = models.PositiveSmallIntegerField(verbose_name="Час")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Продано, шт.")
+
+    def __str__(self):
+        return f"{self.date} {self.hour}:00: {self.dish_id} в столовой {self.canteen_id}"
+
+    class Meta:
+        unique_together = ('canteen', 'dish', 'date', 'hour')
+        indexes = [
+            models.Index(fields=['canteen', 'date'], name='hourlydemand_canteen_date_idx'),
+        ]
+        verbose_name = "Спрос за час"
+        verbose_name_plural = "Спрос по часам"
+
+class AggregationCursor(models.Model):
+    # Последний обработанный id заказа для инкрементальных агрегаций:
+    # ночной пересчет читает только новые заказы
+    name = models.CharField(max_length=50, unique=True, verbose_name="Агрегация")
+    position = models.BigIntegerField(default=0, verbose_name="Последний id заказа")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+    class Meta:
+        verbose_name = "Позиция агрегации"
+        verbose_name_plural = "Позиции агрегаций"
+
+class ArchivedOrder(models.Model):
+    # Закрытые заказы старше ORDER_ARCHIVE_AFTER_DAYS переносятся сюда командой
+    # archive_orders, чтобы таблица Order содержала только рабочие заказы.
+    # id сохраняется прежним, поэтому история читается из обеих таблиц одним курсором.
+    # На PostgreSQL таблица секционирована по created_at (миграция 0011)
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_orders', verbose_name="Пользователь")
+    canteen = models.ForeignKey(Canteen, on_delete=models.PROTECT, null=True, related_name='archived_orders', verbose_name="Столовая")
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES, verbose_name="Статус")
+    preparation_type = models.CharField(max_length=10, choices=Order.PREPARATION_TYPE_CHOICES, verbose_name="Тип приготовления")
+    preparation_time = models.DateTimeField(null=True, blank=True, verbose_name="Время приготовления")
+    created_at = models.DateTimeField(verbose_name="Время создания")
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Итоговая цена")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Время архивации")
+
+    def __str__(self):
+        return f"Архивный заказ №{self.id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archivedorder_user_idx'),
+        ]
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архивные заказы"
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    # Без ограничения внешнего ключа: на секционированную таблицу нельзя сослаться по одному id
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, db_constraint=False, related_name='items', verbose_name="Заказ")
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='archived_order_items', verbose_name="Блюдо")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Цена за штуку")
+
+    def __str__(self):
+        return f"{self.quantity} x {self.dish_id} в архивном заказе №{self.order_id}"
+
+    class Meta:
+        verbose_name = "Позиция архивного заказа"
+        verbose_name_plural = "Позиции архивных заказов"
+
+class StockHold(models.Model):
+    # Временный резерв блюда в корзине: количество уже списано с CanteenDish,
+    # поэтому меню показывает остаток за вычетом корзин. set_order забирает
+    # резерв в заказ без повторного списания, а просроченные резервы возвращает
+    # на остаток команда release_expired_holds
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_holds', verbose_name="Пользователь")
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='stock_holds', verbose_name="Столовая")
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='stock_holds', verbose_name="Блюдо")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Истекает")
+
+    def __str__(self):
+        return f"{self.quantity} x {self.dish_id} для {self.user_id} до {self.expires_at}"
+
+    class Meta:
+        unique_together = ('user', 'canteen', 'dish')
+        verbose_name = "Резерв в корзине"
+        verbose_name_plural = "Резервы в корзинах"
@@ -0,0 +1,201 @@
+import base64
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def cursor_datetime(value):
+    # Значения курсора приходят от клиента: кроме формы списка проверяется
+    # тип каждого значения, иначе ошибка всплывет только в запросе к базе
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed
+    raise ValueError(value)
+
+
+def cursor_int(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError(value)
+
+
+class PageSizeMixin:
+    # Размер страницы из ?page_size=, не больше max_page_size
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+
+class KeysetPagination(PageSizeMixin, BasePagination):
+    # Пагинация по ключу (keyset): курсор хранит значения полей сортировки
+    # последней записи страницы, следующая страница выбирается условием
+    # "строго после курсора". Стоимость запроса не зависит от номера страницы.
+    ordering = ('-created_at', '-id')
+    # Разбор значения курсора для каждого поля сортировки
+    cursor_parsers = (cursor_datetime, cursor_int)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        # Несколько таблиц с одинаковыми полями сортировки (живые и архивные
+        # заказы): из каждой берется страница после курсора, затем они сливаются
+        querysets = self.page_querysets(querysets, request)
+        return self.merge_pages([list(queryset) for queryset in querysets])
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        # То же для асинхронных представлений: страницы читаются через async ORM
+        querysets = self.page_querysets(querysets, request)
+        return self.merge_pages([[obj async for obj in queryset] for queryset in querysets])
+
+    def page_querysets(self, querysets, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        pages = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if cursor is not None:
+                queryset = queryset.filter(self.build_filter(cursor))
+            # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+            pages.append(queryset[:self.page_size + 1])
+        return pages
+
+    def merge_pages(self, pages):
+        results = [obj for page in pages for obj in page]
+        if len(pages) > 1:
+            for field in reversed(self.ordering):
+                results.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def build_filter(self, values):
+        # Лексикографическое сравнение (a, b, c) > (va, vb, vc) с учетом
+        # направления сортировки каждого поля
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, instance):
+        values = []
+        for name in self.get_field_names():
+            value = getattr(instance, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [parse(value) for parse, value in zip(self.cursor_parsers, values)]
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OrderHistoryPagination(KeysetPagination):
+    # Порядок и курсор KeysetPagination: сначала новые заказы
+    pass
+
+
+class WorkerOrderQueuePagination(KeysetPagination):
+    # Поля queue_priority и queue_time аннотируются в WorkerOrderListView
+    ordering = ('queue_priority', 'queue_time', 'id')
+    cursor_parsers = (cursor_int, cursor_datetime, cursor_int)
+
+
+class DishSearchPagination(PageSizeMixin, BasePagination):
+    # Поиск блюд упорядочен по релевантности, а не по полям записи, поэтому
+    # страницы выбираются по номеру (оконной функцией в api/search.py)
+    max_page_size = 50
+    page_query_param = 'page'
+    invalid_page_message = 'Некорректный номер страницы'
+
+    def page_bounds(self, request):
+        # Смещение и число блюд для выборки: на одно больше страницы, чтобы
+        # узнать, есть ли следующая
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.number < 1:
+            raise NotFound(self.invalid_page_message)
+        return (self.number - 1) * self.page_size, self.page_size + 1
+
+    def paginate_results(self, results):
+        self.has_next = len(results) > self.page_size
+        return results[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
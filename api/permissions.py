@@ -5,4 +5,11 @@ class IsCanteenWorker(BasePermission):
 
     def has_permission(self, request, view):
         user = request.user
-        return user.is_authenticated and user.role == 'worker' and user.canteen is not None
\ No newline at end of file
+        return user.is_authenticated and user.role == 'worker' and user.canteen_id is not None
+
+class IsCanteenAdmin(BasePermission):
+    message = 'Доступ разрешен только администраторам.'
+
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_authenticated and user.role == 'admin'
@@ -0,0 +1,214 @@
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, FloatField, Func, Q, TextField, Value, Window
+from django.db.models.functions import DenseRank
+
+from .menus import MENU_FIELDS
+from .models import CanteenDish, Dish, stock_total
+
+# Поиск блюд (dishes/search, поиск в админке). На PostgreSQL совпадения и
+# релевантность считает база по индексам из миграции 0013: полнотекстовый
+# поиск по названию и описанию и триграммы по названию. На остальных базах
+# (SQLite в разработке и тестах) слова блюд лежат в инвертированном индексе
+# в памяти процесса, который перестраивается при изменении блюд
+
+WORD_RE = re.compile(r'\w+')
+# Веса совпадения слова запроса в названии и в описании (индекс в памяти).
+# Слово запроса, совпавшее только с началом слова блюда («бор» -> «борщ»),
+# весит меньше точного совпадения
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_FACTOR = 0.5
+INDEX_VERSION_KEY = 'dish-search:version'
+# Сколько найденных по индексу в памяти блюд проверяется фильтрами за один
+# запрос: список id в запросе ограничен, а не растет с числом совпадений
+CANDIDATE_CHUNK = 500
+
+
+def words(text):
+    return WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+class DishDocument(Func):
+    # То же выражение, что в индексе dish_search_idx
+    template = "to_tsvector('russian'::regconfig, %(expressions)s)"
+    arg_joiner = " || ' ' || "
+    output_field = TextField()
+
+
+class WebSearchQuery(Func):
+    template = "websearch_to_tsquery('russian'::regconfig, %(expressions)s)"
+    output_field = TextField()
+
+
+class Matches(Func):
+    # документ @@ запрос
+    template = '(%(expressions)s)'
+    arg_joiner = ' @@ '
+    output_field = BooleanField()
+
+
+class WordSimilar(Func):
+    # запрос <% название: в названии есть слово, похожее на запрос
+    # (опечатка или только начало слова), индекс dish_name_trgm_idx
+    template = '(%(expressions)s)'
+    arg_joiner = ' <%% '
+    output_field = BooleanField()
+
+
+class DishIndex:
+    # Слово -> {id блюда: вес}. По отсортированному списку слов бинарным
+    # поиском находятся все слова с заданным началом
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        for dish_id, name, description in rows:
+            for word in words(description):
+                self.postings[word].setdefault(dish_id, DESCRIPTION_WEIGHT)
+            for word in words(name):
+                self.postings[word][dish_id] = NAME_WEIGHT
+        self.words = sorted(self.postings)
+
+    def matches(self, word):
+        found = {}
+        position = bisect.bisect_left(self.words, word)
+        while position < len(self.words) and self.words[position].startswith(word):
+            candidate = self.words[position]
+            factor = 1.0 if candidate == word else PREFIX_FACTOR
+            for dish_id, weight in self.postings[candidate].items():
+                found[dish_id] = max(found.get(dish_id, 0.0), weight * factor)
+            position += 1
+        return found
+
+    def scores(self, query):
+        # Блюдо подходит, если каждое слово запроса совпало с каким-то его
+        # словом; релевантность — сумма весов совпадений
+        scores = None
+        for word in words(query):
+            found = self.matches(word)
+            if scores is None:
+                scores = found
+            else:
+                scores = {dish_id: score + found[dish_id] for dish_id, score in scores.items() if dish_id in found}
+            if not scores:
+                return {}
+        return scores or {}
+
+
+_index_lock = threading.Lock()
+_index = (None, None)
+
+
+def get_index_version():
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        # Как и у версии меню: после вытеснения ключа новая версия больше прежних
+        cache.add(INDEX_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(INDEX_VERSION_KEY)
+    return version
+
+
+def bump_index_version():
+    try:
+        return cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.add(INDEX_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+
+
+def bump_index_version_on_commit():
+    transaction.on_commit(bump_index_version)
+
+
+def get_index():
+    # Версия читается до блюд, поэтому индекс не старше своей версии
+    global _index
+    version = get_index_version()
+    with _index_lock:
+        if _index[0] != version:
+            _index = (version, DishIndex(Dish.objects.values_list('id', 'name', 'description')))
+        return _index[1]
+
+
+def text_match(query, prefix=''):
+    # Условие совпадения с запросом и выражение релевантности для выборки
+    # Dish (prefix='') или модели со ссылкой на блюдо (prefix='dish__').
+    # None — совпадений заведомо нет. Вне PostgreSQL релевантность не
+    # выражается в SQL (None): поиск блюд ранжирует по индексу в памяти сам
+    name, description = F(f'{prefix}name'), F(f'{prefix}description')
+    if connection.vendor == 'postgresql':
+        document = DishDocument(name, description)
+        tsquery = WebSearchQuery(Value(query))
+        condition = Q(Matches(document, tsquery)) | Q(WordSimilar(Value(query), name))
+        rank = (
+            Func(document, tsquery, function='ts_rank', output_field=FloatField())
+            + Func(Value(query), name, function='word_similarity', output_field=FloatField())
+        )
+        return condition, rank
+
+    scores = get_index().scores(query)
+    if not scores:
+        return None
+    return Q(**{f'{prefix}id__in': list(scores)}), None
+
+
+RANGE_FILTERS = (
+    ('price_min', 'dish__price__gte'),
+    ('price_max', 'dish__price__lte'),
+    ('weight_min', 'dish__weight__gte'),
+    ('weight_max', 'dish__weight__lte'),
+)
+
+
+def search_dishes(filters, offset, limit):
+    # Одна выборка CanteenDish JOIN Dish JOIN Canteen: блюда нумеруются по
+    # релевантности оконной функцией, и из базы читаются только строки
+    # блюд страницы вместе с наличием в каждой столовой. Строки одного блюда
+    # идут подряд (MENU_FIELDS + релевантность)
+    queryset = CanteenDish.objects.annotate(available_quantity=stock_total())
+    if filters.get('canteen_ids'):
+        queryset = queryset.filter(canteen_id__in=filters['canteen_ids'])
+    else:
+        queryset = queryset.filter(canteen__is_open=True)
+    if filters.get('in_stock', True):
+        queryset = queryset.filter(available_quantity__gt=0)
+    for name, lookup in RANGE_FILTERS:
+        if filters.get(name) is not None:
+            queryset = queryset.filter(**{lookup: filters[name]})
+
+    rank = Value(0.0, output_field=FloatField())
+    if words(filters.get('q', '')):
+        if connection.vendor != 'postgresql':
+            return ranked_page(queryset, get_index().scores(filters['q']), offset, limit)
+        condition, rank = text_match(filters['q'], prefix='dish__')
+        queryset = queryset.filter(condition)
+
+    return list(
+        queryset.annotate(rank=rank)
+        .annotate(position=Window(DenseRank(), order_by=(F('rank').desc(), F('dish_id').asc())))
+        .filter(position__gt=offset, position__lte=offset + limit)
+        .order_by('position', 'canteen_id')
+        .values_list(*MENU_FIELDS, 'rank')
+    )
+
+
+def ranked_page(queryset, scores, offset, limit):
+    # Поиск по индексу в памяти: найденные блюда ранжируются в Python, а база
+    # проверяет фильтры для них порциями по CANDIDATE_CHUNK в порядке
+    # релевантности, пока не наберется страница. Обычно это один запрос
+    dish_index = MENU_FIELDS.index('dish_id')
+    ranked = sorted(scores, key=lambda dish_id: (-scores[dish_id], dish_id))
+    found = []
+    for start in range(0, len(ranked), CANDIDATE_CHUNK):
+        chunk = ranked[start:start + CANDIDATE_CHUNK]
+        rows = defaultdict(list)
+        for row in queryset.filter(dish_id__in=chunk).order_by('canteen_id').values_list(*MENU_FIELDS):
+            rows[row[dish_index]].append((*row, scores[row[dish_index]]))
+        found.extend(rows[dish_id] for dish_id in chunk if dish_id in rows)
+        if len(found) >= offset + limit:
+            break
+    return [row for dish_rows in found[offset:offset + limit] for row in dish_rows]
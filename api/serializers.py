@@ -1,5 +1,10 @@
 from rest_framework import serializers
-from .models import Dish, Order, OrderItem, User, Canteen, CanteenDish
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from .models import Dish, Order, OrderItem, User, Canteen, CanteenDish, StockHold, ORDER_STATUS_TRANSITIONS
+from .thumbnails import thumbnail_urls, thumbnails_outdated
 import re
 
 class CanteenSerializer(serializers.ModelSerializer):
@@ -10,10 +15,17 @@ class CanteenSerializer(serializers.ModelSerializer):
 class CanteenMenuSerializer(serializers.ModelSerializer):
     # Добавляем поле, которого нет в модели, но которое мы вычислим во view
     available_quantity = serializers.IntegerField()
+    # Миниатюры фото по размерам и форматам; null, пока они не построены
+    photo_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Dish
-        fields = ('id', 'name', 'description', 'price', 'weight', 'photo', 'available_quantity')
+        fields = ('id', 'name', 'description', 'price', 'weight', 'photo', 'photo_variants', 'available_quantity')
+
+    def get_photo_variants(self, obj):
+        if not obj.photo or thumbnails_outdated(obj):
+            return None
+        return thumbnail_urls(obj.photo_thumbnails, self.context.get('request'))
 
 class DishSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,7 +35,7 @@ class DishSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     dish_id = serializers.IntegerField(write_only=True)
     dish_name = serializers.CharField(source='dish.name', read_only=True)
-    dish_price = serializers.DecimalField(source='dish.price', max_digits=8, decimal_places=2, read_only=True)
+    dish_price = serializers.DecimalField(source='unit_price', max_digits=8, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
@@ -49,6 +61,108 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Для заказов 'ко времени' необходимо указать 'preparation_time'.")
         return data
 
+class OrderBatchSerializer(serializers.Serializer):
+    # Каждый заказ валидируется отдельно через OrderCreateSerializer, чтобы
+    # ошибки можно было вернуть по каждому заказу, а не одной общей
+    orders = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    all_or_nothing = serializers.BooleanField(default=False)
+
+    def validate_orders(self, value):
+        max_size = settings.ORDER_BATCH_MAX_SIZE
+        if len(value) > max_size:
+            raise serializers.ValidationError(f"За один запрос можно передать не более {max_size} заказов.")
+        return value
+
+class TimeSlotSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    orders = serializers.IntegerField()
+    dishes = serializers.IntegerField()
+    max_orders = serializers.IntegerField(allow_null=True)
+    max_dishes = serializers.IntegerField(allow_null=True)
+    available = serializers.BooleanField()
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    # По умолчанию — последние 7 дней, включая сегодняшний
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    max_days = 366
+
+    def validate(self, data):
+        date_to = data.get('date_to') or timezone.localdate()
+        date_from = data.get('date_from') or date_to - timedelta(days=6)
+        if date_from > date_to:
+            raise serializers.ValidationError("'date_from' не может быть позже 'date_to'.")
+        if (date_to - date_from).days >= self.max_days:
+            raise serializers.ValidationError(f"Период отчета не может превышать {self.max_days} дней.")
+        return {'date_from': date_from, 'date_to': date_to}
+
+class ForecastQuerySerializer(serializers.Serializer):
+    # По умолчанию — прогноз на завтра
+    date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        return {'date': data.get('date') or timezone.localdate() + timedelta(days=1)}
+
+class DishSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(default='', allow_blank=True, max_length=100)
+    # ID столовых через запятую; по умолчанию — все открытые
+    canteen_ids = serializers.CharField(required=False)
+    price_min = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0, required=False)
+    price_max = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0, required=False)
+    weight_min = serializers.IntegerField(min_value=0, required=False)
+    weight_max = serializers.IntegerField(min_value=0, required=False)
+    # in_stock=false — показывать и столовые, где блюдо закончилось
+    in_stock = serializers.BooleanField(default=True)
+
+    def validate_canteen_ids(self, value):
+        try:
+            return [int(item) for item in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError("Укажите ID столовых целыми числами через запятую.")
+
+    def validate(self, data):
+        for low, high in (('price_min', 'price_max'), ('weight_min', 'weight_max')):
+            if data.get(low) is not None and data.get(high) is not None and data[low] > data[high]:
+                raise serializers.ValidationError(f"'{low}' не может быть больше '{high}'.")
+        return data
+
+class StockHoldCreateSerializer(serializers.Serializer):
+    canteen_id = serializers.IntegerField()
+    dish_id = serializers.IntegerField()
+    # 0 — убрать блюдо из корзины и вернуть резерв на остаток
+    quantity = serializers.IntegerField(min_value=0)
+
+    def validate_quantity(self, value):
+        if value > settings.STOCK_HOLD_MAX_QUANTITY:
+            raise serializers.ValidationError(f"Можно отложить не больше {settings.STOCK_HOLD_MAX_QUANTITY} шт. одного блюда.")
+        return value
+
+class StockHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockHold
+        fields = ('canteen_id', 'dish_id', 'quantity', 'expires_at')
+
+class SalesDishSerializer(serializers.Serializer):
+    dish_id = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    orders = serializers.IntegerField()
+
+class SalesDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class SalesReportSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    dishes = SalesDishSerializer(many=True)
+    days = SalesDaySerializer(many=True)
+
 
 class UserCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -69,11 +183,11 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 class UserDetailSerializer(serializers.ModelSerializer):
-    orders = OrderSerializer(many=True, read_only=True)
-
+    # История заказов отдается отдельным постраничным эндпоинтом (OrderHistoryView),
+    # чтобы стоимость профиля не росла вместе с количеством заказов
     class Meta:
         model = User
-        fields = ('id', 'username', 'first_name', 'last_name', 'role', 'canteen', 'orders')
+        fields = ('id', 'username', 'first_name', 'last_name', 'role', 'canteen')
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -88,13 +202,27 @@ class UserUpdateSerializer(serializers.ModelSerializer):
                 )
         return data
     
+def validate_worker_status(value):
+    # Работник может менять статус только на 'ready' или 'closed'
+    if value not in ORDER_STATUS_TRANSITIONS:
+        raise serializers.ValidationError("Недопустимый статус. Доступные статусы: 'ready', 'closed'.")
+    return value
+
 class OrderStatusUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
     
     def validate_status(self, value):
-        # Работник может менять статус только на 'ready' или 'closed'
-        if value not in ['ready', 'closed']:
-            raise serializers.ValidationError("Недопустимый статус. Доступные статусы: 'ready', 'closed'.")
-        return value
\ No newline at end of file
+        validate_worker_status(value)
+        if self.instance is not None and self.instance.status not in ORDER_STATUS_TRANSITIONS[value]:
+            raise serializers.ValidationError(f"Нельзя перевести заказ из статуса '{self.instance.status}' в '{value}'.")
+        return value
+
+class OrderBulkStatusUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.ORDER_BULK_STATUS_MAX_SIZE
+    )
+    status = serializers.CharField(validators=[validate_worker_status])
\ No newline at end of file
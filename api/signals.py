@@ -0,0 +1,84 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens
+from .models import User, Canteen, Dish, CanteenDish
+from .menu_cache import bump_menu_version_on_commit
+from .menu_sync import record_menu_changes
+from .search import bump_index_version_on_commit
+from .thumbnails import build_thumbnails, thumbnails_outdated
+
+logger = logging.getLogger(__name__)
+
+# Поля пользователя, от которых зависят права, зашитые в токен
+TOKEN_CLAIM_FIELDS = ('role', 'canteen_id', 'is_active', 'password')
+
+
+# Любое изменение остатков или карточки блюда (в том числе из админки)
+# делает устаревшими закэшированные меню затронутых столовых
+@receiver([post_save, post_delete], sender=CanteenDish)
+def canteen_dish_changed(sender, instance, **kwargs):
+    # При удалении самой столовой журнал ее меню удаляется каскадно
+    if isinstance(kwargs.get('origin'), Canteen):
+        return
+    record_menu_changes([(instance.canteen_id, instance.dish_id)])
+    bump_menu_version_on_commit(instance.canteen_id)
+
+
+@receiver(post_save, sender=Dish)
+def dish_changed(sender, instance, **kwargs):
+    canteen_ids = list(CanteenDish.objects.filter(dish=instance).values_list('canteen_id', flat=True))
+    record_menu_changes((canteen_id, instance.id) for canteen_id in canteen_ids)
+    bump_menu_version_on_commit(*canteen_ids)
+
+
+@receiver([post_save, post_delete], sender=Dish)
+def dish_search_changed(sender, instance, **kwargs):
+    # Индекс поиска в памяти (не на PostgreSQL) перестраивается по новой версии
+    bump_index_version_on_commit()
+
+
+@receiver(post_save, sender=Dish)
+def dish_photo_changed(sender, instance, **kwargs):
+    # Миниатюры строятся после сохранения: только тогда загруженный файл уже
+    # лежит в хранилище. Пока их нет, меню отдает оригинал фото
+    if not settings.DISH_THUMBNAILS_ON_SAVE or not thumbnails_outdated(instance):
+        return
+    try:
+        instance.photo_thumbnails = build_thumbnails(instance.photo.name)
+    except OSError:
+        logger.warning('Не удалось построить миниатюры для %s', instance.photo.name, exc_info=True)
+        return
+    Dish.objects.filter(pk=instance.pk).update(photo_thumbnails=instance.photo_thumbnails)
+
+
+@receiver(post_init, sender=User)
+def remember_user_claims(sender, instance, **kwargs):
+    # Значения полей прав на момент загрузки: при сохранении они сравниваются
+    # с новыми без повторного чтения пользователя. Отложенные поля (only/defer)
+    # не запоминаются, чтобы не загружать их здесь
+    instance._token_claims = {field: instance.__dict__[field] for field in TOKEN_CLAIM_FIELDS if field in instance.__dict__}
+
+
+@receiver(pre_save, sender=User)
+def user_claims_changed(sender, instance, update_fields=None, **kwargs):
+    # Токены со старой ролью или столовой отзываются, иначе stateless-режим
+    # продолжал бы пускать пользователя с прежними правами до истечения токена
+    fields = TOKEN_CLAIM_FIELDS if update_fields is None else [field for field in TOKEN_CLAIM_FIELDS if field in update_fields]
+    # Поле, значение которого при загрузке неизвестно, считается измененным
+    missing = object()
+    changed = {field for field in fields if instance._token_claims.get(field, missing) != getattr(instance, field)}
+    instance._token_claims.update((field, getattr(instance, field)) for field in fields)
+    if instance._state.adding:
+        return
+    # Перехеширование при входе (check_password сохраняет только password и,
+    # в отличие от set_password, сбрасывает _password) — тот же пароль в новом
+    # формате: токен, выдаваемый этим входом, и другие сессии остаются в силе
+    if changed == {'password'} and instance._password is None and update_fields == frozenset({'password'}):
+        return
+    if changed:
+        transaction.on_commit(lambda: revoke_user_tokens(instance.pk))
@@ -0,0 +1,84 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F, Q
+
+from .models import TimeSlot
+
+
+class SlotFull(Exception):
+    def __init__(self, canteen_id, start):
+        super().__init__(canteen_id, start)
+        self.canteen_id = canteen_id
+        self.start = start
+
+
+def slot_start(canteen, moment):
+    # Слоты выровнены по эпохе, поэтому граница слота не зависит от часового пояса
+    step = canteen.slot_minutes * 60
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % step, tz=dt_timezone.utc)
+
+
+def slot_demands(canteen, orders):
+    # orders: пары (preparation_time, количество блюд) заказов 'ко времени'
+    demands = defaultdict(lambda: [0, 0])
+    for preparation_time, dishes in orders:
+        demand = demands[slot_start(canteen, preparation_time)]
+        demand[0] += 1
+        demand[1] += dishes
+    return demands
+
+
+def reserve_slots(canteen, demands):
+    # Условное увеличение счетчиков: вместимость проверяется в том же UPDATE,
+    # поэтому параллельные заказы не могут переполнить слот.
+    # Должна вызываться внутри transaction.atomic, как и reserve_stock.
+    for start in sorted(demands):
+        orders, dishes = demands[start]
+        TimeSlot.objects.get_or_create(canteen=canteen, start=start)
+        condition = Q(canteen=canteen, start=start)
+        if canteen.slot_max_orders is not None:
+            condition &= Q(orders__lte=canteen.slot_max_orders - orders)
+        if canteen.slot_max_dishes is not None:
+            condition &= Q(dishes__lte=canteen.slot_max_dishes - dishes)
+        updated = TimeSlot.objects.filter(condition).update(
+            orders=F('orders') + orders,
+            dishes=F('dishes') + dishes
+        )
+        if not updated:
+            raise SlotFull(canteen.id, start)
+
+
+def available_slots(canteen, since, hours):
+    # Все слоты периода считаются по одному запросу к счетчикам
+    step = timedelta(minutes=canteen.slot_minutes)
+    first = slot_start(canteen, since)
+    if first < since:
+        first += step
+    last = since + timedelta(hours=hours)
+    booked = {
+        slot.start: slot
+        for slot in TimeSlot.objects.filter(canteen=canteen, start__gte=first, start__lt=last)
+    }
+
+    slots = []
+    start = first
+    while start < last:
+        slot = booked.get(start)
+        orders = slot.orders if slot else 0
+        dishes = slot.dishes if slot else 0
+        slots.append({
+            'start': start,
+            'end': start + step,
+            'orders': orders,
+            'dishes': dishes,
+            'max_orders': canteen.slot_max_orders,
+            'max_dishes': canteen.slot_max_dishes,
+            'available': (
+                (canteen.slot_max_orders is None or orders < canteen.slot_max_orders)
+                and (canteen.slot_max_dishes is None or dishes < canteen.slot_max_dishes)
+            ),
+        })
+        start += step
+    return slots
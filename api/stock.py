@@ -0,0 +1,164 @@
+import random
+from collections import Counter
+
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Mod
+
+from .menu_sync import record_menu_changes
+from .models import CanteenDish, StockSlot
+
+
+class InsufficientStock(Exception):
+    def __init__(self, dish_id, canteen_id=None):
+        super().__init__(dish_id)
+        self.dish_id = dish_id
+        self.canteen_id = canteen_id
+
+
+def merge_quantities(items):
+    # Одно и то же блюдо может встречаться в заказе несколько раз
+    quantities = Counter()
+    for item in items:
+        quantities[item['dish_id']] += item['quantity']
+    return quantities
+
+
+def reserve_stock(canteen_id, quantities, hot_slots=None):
+    reserve_stock_many(
+        {(canteen_id, dish_id): quantity for dish_id, quantity in quantities.items()},
+        hot_slots and {(canteen_id, dish_id): slots for dish_id, slots in hot_slots.items()}
+    )
+
+
+def reserve_stock_many(quantities, hot_slots=None):
+    # Условное списание одним UPDATE на пару (столовая, блюдо): строка блокируется
+    # только на время выполнения оператора, а проверка остатка и списание
+    # происходят атомарно. Пары обрабатываются в фиксированном порядке, чтобы
+    # параллельные заказы не ловили deadlock.
+    # hot_slots — число слотов пар, уже прочитанное вызывающим кодом: у
+    # обычного блюда (0) при нехватке слоты не проверяются, у горячего сразу
+    # списывается со слотов. Для пар без этих сведений пробуются оба способа.
+    # Должна вызываться внутри transaction.atomic: при нехватке любого блюда
+    # исключение откатывает уже сделанные списания.
+    hot_slots = hot_slots or {}
+    for canteen_id, dish_id in sorted(quantities):
+        quantity = quantities[canteen_id, dish_id]
+        slot_count = hot_slots.get((canteen_id, dish_id))
+        # Строку горячего блюда условие не затрагивает, и заказы его не ждут
+        if not slot_count and CanteenDish.objects.filter(
+            canteen_id=canteen_id,
+            dish_id=dish_id,
+            hot_slots=0,
+            quantity__gte=quantity,
+        ).update(quantity=F('quantity') - quantity):
+            continue
+        if slot_count == 0 or not reserve_hot_stock(canteen_id, dish_id, quantity):
+            raise InsufficientStock(dish_id, canteen_id)
+    record_menu_changes(quantities)
+
+
+def random_slot(canteen_id, dish_id):
+    # Слоты горячего блюда и условие "случайный слот" без отдельного чтения
+    # CanteenDish: id блюда и число слотов берутся подзапросами в том же
+    # операторе. У обычного блюда (hot_slots=0) слотов нет, условие ложно.
+    # Условия на саму строку слота остаются во внешнем WHERE, поэтому
+    # проверка остатка в UPDATE по-прежнему атомарна
+    canteen_dish = CanteenDish.objects.filter(canteen_id=canteen_id, dish_id=dish_id, hot_slots__gt=0)
+    return StockSlot.objects.filter(
+        canteen_dish_id=Subquery(canteen_dish.values('id')),
+        slot=Mod(Value(random.getrandbits(30)), Subquery(canteen_dish.values('hot_slots'))),
+    )
+
+
+def reserve_hot_stock(canteen_id, dish_id, quantity):
+    # Списание с горячего блюда: сначала случайный слот (пока остатка много,
+    # этого достаточно), затем остальные слоты, где хватает остатка, в
+    # случайном порядке. Каждая попытка — тот же условный UPDATE, но строки
+    # у параллельных заказов разные
+    if random_slot(canteen_id, dish_id).filter(quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+        return True
+    # Одно чтение отвечает, горячее ли блюдо (у обычного слотов нет), и
+    # находит слоты, где хватает остатка
+    rows = list(
+        StockSlot.objects.filter(canteen_dish__canteen_id=canteen_id, canteen_dish__dish_id=dish_id)
+        .values_list('canteen_dish_id', 'slot', 'quantity')
+    )
+    if not rows:
+        return False
+    canteen_dish_id = rows[0][0]
+    slots = StockSlot.objects.filter(canteen_dish_id=canteen_dish_id)
+    candidates = [slot for _, slot, available in rows if available >= quantity]
+    random.shuffle(candidates)
+    for slot in candidates:
+        if slots.filter(slot=slot, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            return True
+    return take_from_all_slots(canteen_dish_id, quantity)
+
+
+def take_from_all_slots(canteen_dish_id, quantity):
+    # Ни в одном слоте нет нужного количества целиком (блюдо заканчивается
+    # или пополнение еще лежит в строке CanteenDish): количество собирается
+    # из строки CanteenDish и слотов под блокировкой. Порядок блокировок
+    # (CanteenDish, затем слоты по номеру) тот же, что у rebalance_slots
+    canteen_dish = CanteenDish.objects.select_for_update().only('quantity').get(id=canteen_dish_id)
+    slots = list(StockSlot.objects.select_for_update().filter(canteen_dish_id=canteen_dish_id).order_by('slot'))
+    if canteen_dish.quantity + sum(slot.quantity for slot in slots) < quantity:
+        return False
+    needed = quantity
+    taken = min(canteen_dish.quantity, needed)
+    if taken:
+        CanteenDish.objects.filter(id=canteen_dish_id).update(quantity=F('quantity') - taken)
+        needed -= taken
+    for slot in slots:
+        if not needed:
+            break
+        taken = min(slot.quantity, needed)
+        if taken:
+            StockSlot.objects.filter(id=slot.id).update(quantity=F('quantity') - taken)
+            needed -= taken
+    return True
+
+
+def release_stock_many(quantities):
+    # Возврат на остаток (отмена резерва в корзине): увеличение не может
+    # нарушить остаток, поэтому условие не нужно. У горячего блюда
+    # количество возвращается в случайный слот
+    for canteen_id, dish_id in sorted(quantities):
+        quantity = quantities[canteen_id, dish_id]
+        updated = CanteenDish.objects.filter(canteen_id=canteen_id, dish_id=dish_id, hot_slots=0).update(
+            quantity=F('quantity') + quantity
+        )
+        if not updated:
+            random_slot(canteen_id, dish_id).update(quantity=F('quantity') + quantity)
+    record_menu_changes(quantities)
+
+
+def rebalance_slots(canteen_dish_id, slot_count=None):
+    # Раскладывает весь остаток блюда (строка CanteenDish и слоты) поровну по
+    # slot_count слотам, по умолчанию — по текущему числу слотов. slot_count=0
+    # сливает слоты в строку CanteenDish и выключает режим горячего блюда.
+    # Сумма остатка не меняется. Возвращает (остаток, число слотов).
+    # Должна вызываться внутри transaction.atomic
+    canteen_dish = CanteenDish.objects.select_for_update().only('quantity', 'hot_slots').get(id=canteen_dish_id)
+    slots = {
+        slot.slot: slot
+        for slot in StockSlot.objects.select_for_update().filter(canteen_dish_id=canteen_dish_id).order_by('slot')
+    }
+    if slot_count is None:
+        slot_count = canteen_dish.hot_slots
+    total = canteen_dish.quantity + sum(slot.quantity for slot in slots.values())
+
+    StockSlot.objects.filter(canteen_dish_id=canteen_dish_id, slot__gte=slot_count).delete()
+    share, extra = divmod(total, slot_count) if slot_count else (0, 0)
+    changed, created = [], []
+    for number in range(slot_count):
+        quantity = share + (1 if number < extra else 0)
+        if number not in slots:
+            created.append(StockSlot(canteen_dish_id=canteen_dish_id, slot=number, quantity=quantity))
+        elif slots[number].quantity != quantity:
+            slots[number].quantity = quantity
+            changed.append(slots[number])
+    StockSlot.objects.bulk_update(changed, ['quantity'])
+    StockSlot.objects.bulk_create(created)
+    CanteenDish.objects.filter(id=canteen_dish_id).update(quantity=0 if slot_count else total, hot_slots=slot_count)
+    return total, slot_count
@@ -1,3 +1,1598 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from PIL import Image
+
+from .authentication import add_user_claims, revoke_token, token_cache
+from .idempotency import _claim, request_fingerprint
+from .analytics import apply_sales
+from .benchmarks import seed as seed_load
+from .benchmarks.scenarios import run as run_load
+from .forecast import update_hourly_demand
+from .holds import set_hold
+from .db_router import finish_routing, start_routing
+from .events import InMemoryBroker, canteen_channel, get_broker
+from .menu_cache import get_menu_version
+from .menu_sync import CHANGES_KEY, menu_version
+from .metrics import parse_prometheus, registry
+from .middleware import QueryBudgetExceeded
+from .models import (
+    User, Dish, Order, OrderItem, Canteen, CanteenDish, IdempotencyKey, DailySales, HourlyDemand,
+    ArchivedOrder, ArchivedOrderItem, StockHold, StockSlot
+)
+from .views import AsyncCanteenListView, AsyncCanteenMenuDetailView, AsyncCanteenMenuView, AsyncWorkerOrderListView
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.canteen = Canteen.objects.create(name="Столовая №1", address="ул. Тестовая, 1")
+        self.student = User.objects.create_user(username='student', password='pass12345')
+        self.soup = Dish.objects.create(name="Борщ", price=Decimal('150.00'), weight=300)
+        self.tea = Dish.objects.create(name="Чай", price=Decimal('30.00'), weight=200)
+
+    def login(self, user):
+        token = add_user_claims(RefreshToken.for_user(user).access_token, user)
+        self.client.cookies['access_token'] = str(token)
+
+    def create_order(self, user=None, items=None, **kwargs):
+        order = Order.objects.create(user=user or self.student, canteen=self.canteen, **kwargs)
+        for dish, quantity in (items or [(self.soup, 1), (self.tea, 2)]):
+            OrderItem.objects.create(order=order, dish=dish, quantity=quantity, unit_price=dish.price)
+        return order
+
+
+class OrderHistoryTests(APITestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_user_info_does_not_embed_orders(self):
+        self.create_order()
+        self.login(self.student)
+        response = self.client.get(reverse('get_user_info'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('orders', response.data)
+        self.assertEqual(response.data['username'], 'student')
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.login(self.student)
+        self.create_order()
+        few_info = self.count_queries(reverse('get_user_info'))
+        few_history = self.count_queries(reverse('order-history'))
+
+        for _ in range(15):
+            self.create_order()
+        self.assertEqual(self.count_queries(reverse('get_user_info')), few_info)
+        self.assertEqual(self.count_queries(reverse('order-history')), few_history)
+
+    def test_cursor_walks_history_without_gaps(self):
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.create_order(user=other)
+        created = [self.create_order().id for _ in range(7)]
+        self.login(self.student)
+
+        seen = []
+        url = reverse('order-history') + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, sorted(created, reverse=True))
+        first = self.client.get(reverse('order-history')).data['results'][0]
+        self.assertEqual(first['items'][0]['dish_name'], "Борщ")
+
+    def test_invalid_cursor(self):
+        self.login(self.student)
+        response = self.client.get(reverse('order-history') + '?cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_are_type_checked(self):
+        self.create_order()
+        self.login(self.student)
+        for values in (['not-a-date', 'x'], [{'a': 1}, [1]], [None, None], ['2026-01-01T12:00:00+00:00', True]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get(reverse('order-history'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, values)
+
+
+class CanteenMenuCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+            CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=0)
+        self.url = reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id})
+
+    def test_menu_lists_only_dishes_in_stock(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([dish['name'] for dish in response.data], ["Борщ"])
+        self.assertEqual(response.data[0]['available_quantity'], 5)
+
+    def test_repeated_requests_are_served_from_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stock_change_bumps_version(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup_stock.quantity = 3
+            self.soup_stock.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['available_quantity'], 3)
+
+    def test_order_bumps_version(self):
+        etag = self.client.get(self.url)['ETag']
+        self.login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('set_order'), {
+                'canteen_id': self.canteen.id,
+                'items': [{'dish_id': self.soup.id, 'quantity': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['available_quantity'], 3)
+
+
+class MenuDeltaTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+            self.tea_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=2)
+        self.url = reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id})
+        response = self.client.get(self.url)
+        self.version = int(response['X-Menu-Version'])
+        self.etag = response['ETag']
+
+    def get_delta(self, since, **extra):
+        return self.client.get(self.url, {'since': since}, **extra)
+
+    def test_delta_contains_only_changed_and_removed_dishes(self):
+        self.login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('set_order'), {
+                'canteen_id': self.canteen.id,
+                'items': [{'dish_id': self.soup.id, 'quantity': 1}],
+            }, format='json')
+            self.tea_stock.delete()
+
+        response = self.get_delta(self.version)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['full'])
+        self.assertGreater(response.data['version'], self.version)
+        self.assertEqual([(dish['id'], dish['available_quantity']) for dish in response.data['dishes']], [(self.soup.id, 4)])
+        self.assertEqual(response.data['removed'], [self.tea.id])
+
+        response = self.get_delta(response.data['version'])
+        self.assertEqual(response.data['dishes'], [])
+        self.assertEqual(response.data['removed'], [])
+
+    def test_unchanged_menu_costs_no_queries(self):
+        with self.assertNumQueries(0):
+            response = self.get_delta(self.version, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def change_soup(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup_stock.quantity = quantity
+            self.soup_stock.save()
+
+    def assertFullSnapshot(self, response, soup_quantity):
+        self.assertTrue(response.data['full'])
+        self.assertEqual(
+            sorted((dish['id'], dish['available_quantity']) for dish in response.data['dishes']),
+            [(self.soup.id, soup_quantity), (self.tea.id, 2)]
+        )
+
+    def test_versions_are_per_canteen(self):
+        other = Canteen.objects.create(name="Столовая №2", address="ул. Тестовая, 2")
+        with self.captureOnCommitCallbacks(execute=True):
+            CanteenDish.objects.create(canteen=other, dish=self.soup, quantity=5)
+        self.assertEqual(menu_version(self.canteen.id), self.version)
+        self.change_soup(3)
+        self.assertEqual(menu_version(self.canteen.id), self.version + 1)
+
+    def test_expired_changes_fall_back_to_full_snapshot(self):
+        self.change_soup(3)
+        self.change_soup(2)
+        cache.delete(CHANGES_KEY.format(canteen_id=self.canteen.id, version=self.version + 1))
+        self.assertFullSnapshot(self.get_delta(self.version), 2)
+
+        response = self.get_delta(self.version + 1)
+        self.assertFalse(response.data['full'])
+        self.assertEqual([dish['available_quantity'] for dish in response.data['dishes']], [2])
+
+    def test_unrecorded_commit_falls_back_to_full_snapshot(self):
+        # Транзакция зафиксирована, но ее список изменений еще не сохранен в
+        # кэше (on_commit не выполнен): полноту дельты доказать нельзя
+        with self.captureOnCommitCallbacks(execute=False):
+            self.soup_stock.quantity = 3
+            self.soup_stock.save()
+        response = self.get_delta(self.version)
+        # Версия кэша тоже еще не увеличена: отдается прежний снимок со своей версией
+        self.assertFullSnapshot(response, 5)
+        self.assertEqual(response.data['version'], self.version)
+
+    @override_settings(MENU_SYNC_MAX_VERSIONS=1)
+    def test_long_gap_falls_back_to_full_snapshot(self):
+        self.change_soup(3)
+        self.change_soup(2)
+        self.assertFullSnapshot(self.get_delta(self.version), 2)
+        self.assertFalse(self.get_delta(self.version + 1).data['full'])
+        # Версия из будущего (например, от другой базы)
+        self.assertFullSnapshot(self.get_delta(self.version + 10), 2)
+
+    def test_invalid_since(self):
+        response = self.get_delta('abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class SetOrderTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=3)
+        self.tea_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=10)
+        self.login(self.student)
+
+    def post_order(self, items):
+        return self.client.post(reverse('set_order'), {
+            'canteen_id': self.canteen.id,
+            'items': items,
+        }, format='json')
+
+    def test_order_decrements_stock(self):
+        response = self.post_order([{'dish_id': self.soup.id, 'quantity': 2}, {'dish_id': self.tea.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'paid')
+        self.assertEqual(response.data['total_price'], '330.00')
+        self.soup_stock.refresh_from_db()
+        self.tea_stock.refresh_from_db()
+        self.assertEqual((self.soup_stock.quantity, self.tea_stock.quantity), (1, 9))
+
+    def test_insufficient_stock_rolls_back_whole_order(self):
+        response = self.post_order([{'dish_id': self.tea.id, 'quantity': 4}, {'dish_id': self.soup.id, 'quantity': 4}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Доступно: 3", response.data['error'])
+        self.tea_stock.refresh_from_db()
+        self.assertEqual(self.tea_stock.quantity, 10)
+        self.assertFalse(Order.objects.exists())
+
+    def test_repeated_dish_is_checked_against_total_quantity(self):
+        response = self.post_order([{'dish_id': self.soup.id, 'quantity': 2}, {'dish_id': self.soup.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 400)
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 3)
+
+
+class StockHoldTests(SetOrderTests):
+    def hold(self, dish, quantity):
+        # Версия меню увеличивается после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('cart-holds'), {
+                'canteen_id': self.canteen.id, 'dish_id': dish.id, 'quantity': quantity
+            }, format='json')
+
+    def menu_quantities(self):
+        menu = self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id}))
+        return {dish['id']: dish['available_quantity'] for dish in menu.data}
+
+    def test_hold_reserves_stock_shown_in_menu(self):
+        self.assertEqual(self.hold(self.soup, 2).data['quantity'], 2)
+        self.assertEqual(self.menu_quantities()[self.soup.id], 1)
+        # Повторное добавление меняет резерв на разницу
+        self.hold(self.soup, 1)
+        self.assertEqual(self.menu_quantities()[self.soup.id], 2)
+
+        # У обычного блюда при нехватке слоты горячего блюда не проверяются
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.hold(self.soup, 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Доступно: 2", response.data['error'])
+        self.assertFalse([query for query in ctx.captured_queries if query['sql'].startswith(('UPDATE "api_stockslot"', 'SELECT "api_stockslot"'))])
+        self.assertEqual(self.hold(self.soup, 0).status_code, 204)
+        self.assertEqual(self.menu_quantities()[self.soup.id], 3)
+        self.assertEqual(self.client.get(reverse('cart-holds')).data, [])
+
+    def test_concurrent_first_hold_is_retried(self):
+        # Параллельный запрос успел создать резерв (2 шт.) после того, как этот
+        # не нашел строку: вставка падает, и повтор списывает только разницу
+        self.hold(self.tea, 2)
+        real_first = QuerySet.first
+        misses = [None]
+
+        def first(queryset):
+            return misses.pop() if misses else real_first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', first):
+            hold = set_hold(self.student.id, self.canteen.id, self.tea.id, 3)
+        self.assertEqual(hold.quantity, 3)
+        self.assertEqual(StockHold.objects.get().quantity, 3)
+        self.tea_stock.refresh_from_db()
+        self.assertEqual(self.tea_stock.quantity, 7)
+
+    def test_order_converts_hold_without_touching_stock(self):
+        self.hold(self.soup, 3)
+        self.hold(self.tea, 1)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_order([{'dish_id': self.soup.id, 'quantity': 3}, {'dish_id': self.tea.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 201)
+        stock_updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE "api_canteendish"')]
+        self.assertEqual(len(stock_updates), 1)
+        self.soup_stock.refresh_from_db()
+        self.tea_stock.refresh_from_db()
+        self.assertEqual((self.soup_stock.quantity, self.tea_stock.quantity), (0, 8))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_released_by_sweeper(self):
+        self.hold(self.soup, 2)
+        self.hold(self.tea, 5)
+        StockHold.objects.filter(dish=self.soup).update(expires_at=timezone.now() - timedelta(seconds=1))
+        # Просроченный резерв не используется при оформлении
+        self.assertEqual(self.post_order([{'dish_id': self.soup.id, 'quantity': 2}]).status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('release_expired_holds', batch_size=1, stdout=io.StringIO())
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 3)
+        self.assertEqual([hold['dish_id'] for hold in self.client.get(reverse('cart-holds')).data], [self.tea.id])
+        self.assertEqual(self.menu_quantities(), {self.soup.id: 3, self.tea.id: 5})
+
+
+class HotStockTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=10)
+        self.login(self.student)
+        call_command('rebalance_stock_slots', canteen=self.canteen.id, dish=self.soup.id, slots=4, stdout=io.StringIO())
+
+    def slots(self):
+        return list(StockSlot.objects.filter(canteen_dish=self.soup_stock).order_by('slot').values_list('quantity', flat=True))
+
+    def order(self, quantity):
+        return self.client.post(reverse('set_order'), {
+            'canteen_id': self.canteen.id, 'items': [{'dish_id': self.soup.id, 'quantity': quantity}],
+        }, format='json')
+
+    def menu_quantity(self):
+        menu = self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id}))
+        return {dish['id']: dish['available_quantity'] for dish in menu.data}.get(self.soup.id)
+
+    def test_stock_is_split_across_slots(self):
+        self.soup_stock.refresh_from_db()
+        self.assertEqual((self.soup_stock.quantity, self.soup_stock.hot_slots), (0, 4))
+        self.assertEqual(self.slots(), [3, 3, 2, 2])
+        self.assertEqual(self.menu_quantity(), 10)
+
+    def test_order_takes_from_one_slot_without_touching_dish_row(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.order(2)
+        self.assertEqual(response.status_code, 201)
+        stock_updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len([sql for sql in stock_updates if sql.startswith('UPDATE "api_stockslot"')]), 1)
+        self.assertEqual(sum(self.slots()), 8)
+        self.assertEqual(self.menu_quantity(), 8)
+
+    def test_order_larger_than_any_slot_collects_from_several(self):
+        self.assertEqual(self.order(7).status_code, 201)
+        self.assertEqual(sum(self.slots()), 3)
+        response = self.order(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Доступно: 3", response.data['error'])
+        self.assertEqual(self.order(3).status_code, 201)
+        self.assertEqual(self.slots(), [0, 0, 0, 0])
+        self.assertIsNone(self.menu_quantity())
+
+    def test_restock_hold_release_and_merge(self):
+        # Пополнение в строке CanteenDish тоже продается и видно в меню
+        CanteenDish.objects.filter(id=self.soup_stock.id).update(quantity=5)
+        self.assertEqual(self.menu_quantity(), 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cart-holds'), {'canteen_id': self.canteen.id, 'dish_id': self.soup.id, 'quantity': 2}, format='json')
+            self.client.post(reverse('cart-holds'), {'canteen_id': self.canteen.id, 'dish_id': self.soup.id, 'quantity': 0}, format='json')
+        self.assertEqual(self.menu_quantity(), 15)
+
+        call_command('rebalance_stock_slots', stdout=io.StringIO())
+        self.soup_stock.refresh_from_db()
+        self.assertEqual((self.soup_stock.quantity, sorted(self.slots())), (0, [3, 4, 4, 4]))
+
+        call_command('rebalance_stock_slots', canteen=self.canteen.id, dish=self.soup.id, merge=True, stdout=io.StringIO())
+        self.soup_stock.refresh_from_db()
+        self.assertEqual((self.soup_stock.quantity, self.soup_stock.hot_slots, self.slots()), (15, 0, []))
+        self.assertEqual(self.order(2).status_code, 201)
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 13)
+
+
+class ConcurrentOrderTests(TransactionTestCase):
+    threads = 8
+    orders_per_thread = 5
+    stock = 20
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти отклоняет конкурентные записи вместо ожидания блокировки')
+
+    def test_concurrent_orders_never_oversell(self):
+        canteen = Canteen.objects.create(name="Столовая №1", address="ул. Тестовая, 1")
+        dish = Dish.objects.create(name="Борщ", price=Decimal('150.00'), weight=300)
+        CanteenDish.objects.create(canteen=canteen, dish=dish, quantity=self.stock)
+        users = [User.objects.create(username=f'student{i}') for i in range(self.threads)]
+        statuses = []
+
+        def place_orders(user):
+            client = APIClient()
+            client.cookies['access_token'] = str(RefreshToken.for_user(user).access_token)
+            try:
+                for _ in range(self.orders_per_thread):
+                    response = client.post(reverse('set_order'), {
+                        'canteen_id': canteen.id,
+                        'items': [{'dish_id': dish.id, 'quantity': 1}],
+                    }, format='json')
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=place_orders, args=(user,)) for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Заказов больше, чем порций: продано ровно столько, сколько было,
+        # остальные получили 400, а не ошибку сервера
+        left = CanteenDish.objects.get(canteen=canteen, dish=dish).quantity
+        self.assertEqual(left, 0)
+        self.assertEqual(len(statuses), self.threads * self.orders_per_thread)
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(statuses.count(400), len(statuses) - self.stock)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), self.stock)
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class LoadScenarioTests(TransactionTestCase):
+    def test_seed_and_run_produce_consistent_report(self):
+        seed_load.seed(canteens=2, dishes=4, users=5, orders=30, days=3, stock=1000, chunk_size=7, log=lambda message: None)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertFalse(Order.objects.exclude(created_at__date__lt=timezone.localdate()).exists())
+
+        canteens = list(seed_load.seeded_canteens())
+        # Продажа до прогона должна пережить вычитание продаж прогона
+        dish = CanteenDish.objects.filter(canteen=canteens[0]).order_by('dish_id').first().dish
+        apply_sales({(canteens[0].id, dish.id, timezone.localdate()): (1, dish.price, 1)})
+        sales = list(DailySales.objects.values_list('dish_id', 'quantity'))
+        versions = {canteen.id: get_menu_version(canteen.id) for canteen in canteens}
+        menu_versions = {canteen.id: menu_version(canteen.id) for canteen in canteens}
+
+        report = run_load({
+            'duration': 0.5, 'threads': 1, 'processes': 1, 'mix': {'menu': 1, 'order': 1, 'worker_status': 1},
+            'hot_dishes': 2, 'status_batch': 5, 'keep': False,
+        })
+        self.assertTrue(report['stock']['ok'])
+        self.assertGreater(report['stock']['sold'], 0)
+        self.assertEqual(report['total']['errors'], 0, report['scenarios'])
+        self.assertEqual(set(report['total']['latency_ms']), {'p50', 'p95', 'p99', 'max'})
+        # Заказы прогона удалены, остатки восстановлены, следов в продажах
+        # не осталось; версии меню не откатываются, а растут
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(set(CanteenDish.objects.values_list('quantity', flat=True)), {1000})
+        self.assertEqual(list(DailySales.objects.values_list('dish_id', 'quantity')), sales)
+        self.assertTrue(all(get_menu_version(canteen.id) > versions[canteen.id] for canteen in canteens))
+        self.assertTrue(all(menu_version(canteen.id) > menu_versions[canteen.id] for canteen in canteens))
+
+        seed_load.clear(chunk_size=7)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class LiveLoadScenarioTests(LiveServerTestCase):
+    def test_run_against_server_over_http(self):
+        seed_load.seed(canteens=1, dishes=2, users=2, orders=5, days=1, stock=1000, chunk_size=5, log=lambda message: None)
+        report = run_load({
+            'duration': 0.5, 'threads': 1, 'processes': 1, 'mix': {'menu': 1, 'order': 1},
+            'hot_dishes': 1, 'status_batch': 5, 'keep': False, 'url': self.live_server_url,
+        })
+        self.assertTrue(report['stock']['ok'])
+        self.assertGreater(report['stock']['sold'], 0)
+        self.assertEqual(report['total']['errors'], 0, report['scenarios'])
+        self.assertEqual(set(report['scenarios']['menu']['statuses']) - {'200', '304'}, set())
+        # Запросы к БД выполняет сервер, отсюда их число не известно
+        self.assertIsNone(report['total']['queries'])
+        seed_load.clear(chunk_size=5)
+
+
+class WorkerOrderQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.login(self.worker)
+
+    def test_queue_is_sorted_by_priority(self):
+        now = timezone.now()
+        late = self.create_order(preparation_type='scheduled', preparation_time=now + timedelta(hours=2))
+        first_asap = self.create_order(status='paid')
+        early = self.create_order(preparation_type='scheduled', preparation_time=now + timedelta(hours=1))
+        second_asap = self.create_order()
+        self.create_order(status='ready')
+
+        response = self.client.get(reverse('worker-order-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [order['id'] for order in response.data['results']],
+            [first_asap.id, second_asap.id, early.id, late.id]
+        )
+
+    def test_queue_is_paginated_by_cursor(self):
+        now = timezone.now()
+        expected = [self.create_order().id for _ in range(3)]
+        expected += [
+            self.create_order(preparation_type='scheduled', preparation_time=now + timedelta(minutes=minutes)).id
+            for minutes in (30, 10, 20)
+        ]
+        expected[3:] = [expected[4], expected[5], expected[3]]
+
+        seen = []
+        url = reverse('worker-order-list') + '?page_size=2'
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_student_has_no_access(self):
+        self.login(self.student)
+        response = self.client.get(reverse('worker-order-list'))
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkOrderStatusTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.login(self.worker)
+
+    def bulk(self, ids, new_status):
+        return self.client.post(reverse('worker-order-bulk-status'), {'ids': ids, 'status': new_status}, format='json')
+
+    def test_transitions_follow_state_machine(self):
+        paid = [self.create_order(status='paid') for _ in range(3)]
+        unpaid = self.create_order(status='new')
+        other_canteen = Canteen.objects.create(name="Столовая №2", address="ул. Тестовая, 2")
+        foreign = Order.objects.create(user=self.student, canteen=other_canteen, status='paid')
+        ids = [order.id for order in paid] + [unpaid.id, foreign.id, 10 ** 9]
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(5):
+            response = self.bulk(ids, 'ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['changed'], [order.id for order in paid])
+        self.assertEqual(response.data['skipped'], [unpaid.id, foreign.id, 10 ** 9])
+        self.assertEqual(Order.objects.filter(status='ready').count(), 3)
+
+        # Повтор ничего не меняет, а закрыть можно только готовые заказы
+        self.assertEqual(self.bulk(ids, 'ready').data['changed'], [])
+        self.assertEqual(self.bulk([paid[0].id, unpaid.id], 'closed').data['changed'], [paid[0].id])
+
+    def test_invalid_requests(self):
+        order = self.create_order(status='paid')
+        self.assertEqual(self.bulk([order.id], 'paid').status_code, 400)
+        self.assertEqual(self.bulk([], 'ready').status_code, 400)
+        self.assertEqual(
+            self.client.patch(reverse('worker-order-update', kwargs={'pk': order.id}), {'status': 'closed'}, format='json').status_code,
+            400
+        )
+        self.login(self.student)
+        self.assertEqual(self.bulk([order.id], 'ready').status_code, 403)
+
+
+class OrderEventsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        get_broker.cache_clear()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+
+    def test_broker_replays_events_after_last_event_id(self):
+        broker = InMemoryBroker(history_size=10)
+
+        async def scenario():
+            for number in range(3):
+                broker.publish('kitchen', 'order_created', {'id': number})
+            events = broker.subscribe('kitchen', last_event_id=broker.event_id(1), heartbeat=1)
+            replayed = [await anext(events), await anext(events)]
+            broker.publish('kitchen', 'order_status_changed', {'id': 0})
+            live = await anext(events)
+            await events.aclose()
+            return replayed, live
+
+        replayed, live = asyncio.run(scenario())
+        self.assertEqual([event.id for event in replayed], [broker.event_id(2), broker.event_id(3)])
+        self.assertEqual((live.id, live.type), (broker.event_id(4), 'order_status_changed'))
+
+    def test_unknown_last_event_id_forces_resync(self):
+        # Id от брокера прошлого процесса, некорректный id и события,
+        # вытесненные из истории, досылать нельзя
+        old = InMemoryBroker(history_size=2)
+        old.publish('kitchen', 'order_created', {'id': 1})
+        broker = InMemoryBroker(history_size=2)
+        broker.epoch = old.epoch + '0'
+        for number in range(4):
+            broker.publish('kitchen', 'order_created', {'id': number})
+
+        async def first_event(last_event_id):
+            events = broker.subscribe('kitchen', last_event_id=last_event_id, heartbeat=0.01)
+            event = await anext(events)
+            await events.aclose()
+            return event
+
+        for last_event_id in (old.event_id(1), 'bad', broker.event_id(1)):
+            event = asyncio.run(first_event(last_event_id))
+            self.assertEqual((event.type, event.id), ('resync', broker.event_id(4)), last_event_id)
+        event = asyncio.run(first_event(broker.event_id(2)))
+        self.assertEqual((event.type, event.id), ('order_created', broker.event_id(3)))
+
+    def test_closed_subscriber_loop_is_dropped(self):
+        broker = InMemoryBroker(history_size=10)
+        loop = asyncio.new_event_loop()
+        broker._subscribers['kitchen'].add((loop, asyncio.Queue()))
+        loop.close()
+
+        event = broker.publish('kitchen', 'order_created', {'id': 1})
+        self.assertEqual(event.seq, 1)
+        self.assertEqual(broker._subscribers['kitchen'], set())
+
+    def test_order_and_status_change_are_published(self):
+        self.login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('set_order'), {
+                'canteen_id': self.canteen.id,
+                'items': [{'dish_id': self.soup.id, 'quantity': 1}],
+            }, format='json')
+        order_id = response.data['id']
+
+        self.login(self.worker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('worker-order-update', kwargs={'pk': order_id}), {'status': 'ready'}, format='json')
+
+        history = list(get_broker()._history[canteen_channel(self.canteen.id)])
+        self.assertEqual([event.type for event in history], ['order_created', 'order_status_changed'])
+        self.assertEqual(history[1].data, {'id': order_id, 'status': 'ready'})
+
+    def test_stream_resumes_from_last_event_id(self):
+        broker = get_broker()
+        channel = canteen_channel(self.canteen.id)
+        broker.publish(channel, 'order_created', {'id': 1})
+        broker.publish(channel, 'order_created', {'id': 2})
+        self.login(self.worker)
+
+        response = self.client.get(reverse('worker-order-events'), HTTP_LAST_EVENT_ID=broker.event_id(1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def first_chunk():
+            content = response.streaming_content
+            chunk = await anext(content)
+            await content.aclose()
+            return chunk
+
+        chunk = asyncio.run(first_chunk())
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        self.assertEqual(chunk, f'id: {broker.event_id(2)}\nevent: order_created\ndata: {{"id": 2}}\n\n')
+
+    def test_stream_requires_worker(self):
+        self.login(self.student)
+        self.assertEqual(self.client.get(reverse('worker-order-events')).status_code, 403)
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('worker-order-events')).status_code, 401)
+
+
+class AsyncReadViewsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=3)
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.factory = RequestFactory(HTTP_HOST='testserver')
+
+    def call(self, view, url, **kwargs):
+        # Асинхронные представления под тестовым (синхронным) обработчиком
+        request = self.factory.get(url)
+        request.COOKIES.update({key: morsel.value for key, morsel in self.client.cookies.items()})
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+    def assertSameResponse(self, view, url, **kwargs):
+        expected = self.client.get(url)
+        response = self.call(view, url, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_canteen_list_and_menu_match_sync_views(self):
+        self.assertSameResponse(AsyncCanteenListView, reverse('canteen-list'))
+        kwargs = {'canteen_id': self.canteen.id}
+        url = reverse('canteen-menu', kwargs=kwargs)
+        response = self.assertSameResponse(AsyncCanteenMenuView, url, **kwargs)
+        self.assertEqual([dish['id'] for dish in json.loads(response.content)], [self.soup.id, self.tea.id])
+        self.assertEqual(response['ETag'], self.client.get(url)['ETag'])
+
+        self.assertSameResponse(AsyncCanteenMenuView, url + '?since=0', **kwargs)
+        self.assertEqual(self.call(AsyncCanteenMenuView, url + '?since=x', **kwargs).status_code, 400)
+
+    def test_menu_detail_matches_sync_view(self):
+        kwargs = {'canteen_id': self.canteen.id, 'dish_id': self.tea.id}
+        self.assertSameResponse(AsyncCanteenMenuDetailView, reverse('canteen-menu-detail', kwargs=kwargs), **kwargs)
+        kwargs['dish_id'] = 0
+        self.assertSameResponse(AsyncCanteenMenuDetailView, reverse('canteen-menu-detail', kwargs=kwargs), **kwargs)
+
+    def test_worker_queue_matches_sync_view(self):
+        for _ in range(3):
+            self.create_order()
+        self.login(self.worker)
+        url = reverse('worker-order-list') + '?page_size=2'
+        response = self.assertSameResponse(AsyncWorkerOrderListView, url)
+        self.assertSameResponse(AsyncWorkerOrderListView, json.loads(response.content)['next'])
+
+    def test_worker_queue_requires_worker(self):
+        url = reverse('worker-order-list')
+        self.assertEqual(self.call(AsyncWorkerOrderListView, url).status_code, 401)
+        self.login(self.student)
+        self.assertEqual(self.call(AsyncWorkerOrderListView, url).status_code, 403)
+
+
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.create_order()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_stateless_mode_skips_user_query(self):
+        self.login(self.worker)
+        url = reverse('worker-order-list')
+        stateful = self.count_queries(url)
+        with override_settings(JWT_STATELESS_AUTH=True):
+            stateless = self.count_queries(url)
+        self.assertEqual(stateless, stateful - 1)
+        # Остаются только заказы и их позиции
+        self.assertEqual(stateless, 2)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_profile_is_loaded_from_db_in_stateless_mode(self):
+        self.login(self.student)
+        response = self.client.get(reverse('get_user_info'))
+        self.assertEqual(response.data['username'], 'student')
+        self.assertEqual(self.client.get(reverse('order-history')).status_code, 200)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_role_change_revokes_tokens(self):
+        self.login(self.worker)
+        self.assertEqual(self.client.get(reverse('worker-order-list')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            self.worker.role = 'student'
+            self.worker.save()
+        self.assertEqual(self.client.get(reverse('worker-order-list')).status_code, 401)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_token_issued_right_after_revocation_is_valid(self):
+        # Отзыв сравнивает поколения, а не секунды iat: новый токен, выданный
+        # в ту же секунду, действует, а старый остается отозванным
+        self.login(self.student)
+        stale = self.client.cookies['access_token'].value
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.canteen = self.canteen
+            self.student.save()
+        self.login(self.student)
+        self.assertEqual(self.client.get(reverse('get_user_info')).status_code, 200)
+        self.client.cookies['access_token'] = stale
+        self.assertEqual(self.client.get(reverse('get_user_info')).status_code, 401)
+
+    def test_logout_revokes_token(self):
+        self.login(self.student)
+        token = self.client.cookies['access_token'].value
+        self.client.post(reverse('logout'))
+        self.client.cookies['access_token'] = token
+        self.assertEqual(self.client.get(reverse('get_user_info')).status_code, 401)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_revocation_survives_cache_overflow(self):
+        # Переполнение кэша (MAX_ENTRIES у LocMem, LRU у Redis) не должно
+        # возвращать силу отозванным токенам
+        self.login(self.worker)
+        revoked = self.client.cookies['access_token'].value
+        self.client.post(reverse('logout'))
+        self.login(self.worker)
+        stale = self.client.cookies['access_token'].value
+        with self.captureOnCommitCallbacks(execute=True):
+            self.worker.is_active = False
+            self.worker.save()
+        User.objects.filter(pk=self.worker.pk).update(is_active=True)
+
+        for number in range(3 * 300):
+            cache.set(f'filler:{number}', number)
+            revoke_token(RefreshToken.for_user(self.worker).access_token)
+        for token in (revoked, stale):
+            self.client.cookies['access_token'] = token
+            self.assertEqual(self.client.get(reverse('worker-order-list')).status_code, 401)
+
+
+class TokenRefreshTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.cookies['refresh_token'] = str(RefreshToken.for_user(self.student))
+
+    def refresh(self):
+        return self.client.post(reverse('token-refresh'))
+
+    def test_refresh_rotates_tokens_without_password(self):
+        old_refresh = self.client.cookies['refresh_token'].value
+        with self.assertNumQueries(1):
+            response = self.refresh()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cookies['refresh_token']['httponly'])
+        self.assertEqual(response.cookies['refresh_token']['path'], settings.JWT_REFRESH_COOKIE_PATH)
+        self.assertNotEqual(response.cookies['refresh_token'].value, old_refresh)
+        self.assertEqual(self.client.get(reverse('get_user_info')).data['username'], 'student')
+
+        # Использованный refresh-токен повторно не принимается
+        self.client.cookies['refresh_token'] = old_refresh
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_used_refresh_token_stays_rejected_after_cache_overflow(self):
+        old_refresh = self.client.cookies['refresh_token'].value
+        self.assertEqual(self.refresh().status_code, 200)
+        for number in range(3 * 300):
+            cache.set(f'filler:{number}', number)
+            token_cache.set(f'filler:{number}', number, timeout=60)
+        self.client.cookies['refresh_token'] = old_refresh
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_logout_revokes_refresh_token(self):
+        self.login(self.student)
+        refresh = self.client.cookies['refresh_token'].value
+        response = self.client.post(reverse('logout'))
+        self.assertEqual(response.cookies['refresh_token'].value, '')
+        self.client.cookies['refresh_token'] = refresh
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_password_change_and_blocking_stop_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.set_password('new-pass-123')
+            self.student.save()
+        self.assertEqual(self.refresh().status_code, 401)
+
+        blocked = User.objects.create_user(username='blocked', password='pass12345')
+        self.client.cookies['refresh_token'] = str(RefreshToken.for_user(blocked))
+        User.objects.filter(pk=blocked.pk).update(is_active=False)
+        self.assertEqual(self.refresh().status_code, 401)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['api.hashers.PBKDF2PasswordHasher', 'api.hashers.ScryptPasswordHasher'],
+    PASSWORD_PBKDF2_ITERATIONS=1000,
+    PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10,
+    PASSWORD_SCRYPT_PARALLELISM=1,
+)
+class LoginPipelineTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.student.set_password('pass12345')
+        self.student.save()
+
+    def authorize(self, password='pass12345', username='student'):
+        return self.client.post(reverse('authorization'), {'username': username, 'password': password}, format='json')
+
+    @override_settings(AUTH_THROTTLE_BUCKETS={'ip': (100, 60), 'username': (2, 1)})
+    def test_username_bucket_limits_attempts(self):
+        self.assertEqual(self.authorize('wrong-1').status_code, 400)
+        self.assertEqual(self.authorize('wrong-2').status_code, 400)
+        response = self.authorize()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        # Другой логин с того же адреса не затронут
+        self.assertEqual(self.authorize(username='nobody').status_code, 400)
+
+    @override_settings(AUTH_THROTTLE_BUCKETS={'ip': (2, 1), 'username': (100, 60)})
+    def test_ip_bucket_covers_login_and_registration(self):
+        self.assertEqual(self.authorize().status_code, 200)
+        self.assertEqual(self.authorize(username='other').status_code, 400)
+        response = self.client.post(reverse('create_user'), {'username': 'new', 'password': 'Str0ng-pass!'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.client.defaults['REMOTE_ADDR'] = '10.0.0.2'
+        response = self.client.post(reverse('create_user'), {'username': 'new', 'password': 'Str0ng-pass!'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_identical_credentials_are_verified_once(self):
+        with mock.patch('api.authentication.authenticate', wraps=authenticate) as checked:
+            self.assertEqual(self.authorize().status_code, 200)
+            self.assertEqual(self.authorize().status_code, 200)
+            self.assertEqual(self.authorize('wrong').status_code, 400)
+            self.assertEqual(self.authorize('wrong').status_code, 400)
+            self.assertEqual(checked.call_count, 2)
+
+            # Смена пароля делает сохраненный успешный результат недействительным
+            self.student.set_password('new-pass-123')
+            self.student.save()
+            self.assertEqual(self.authorize().status_code, 400)
+            self.assertEqual(checked.call_count, 3)
+
+    def test_hash_is_upgraded_on_login(self):
+        # Хеш в актуальном формате не пересохраняется; перехеширование —
+        # один UPDATE без повторного чтения пользователя
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authorize().status_code, 200)
+        with override_settings(PASSWORD_HASHERS=['api.hashers.ScryptPasswordHasher', 'api.hashers.PBKDF2PasswordHasher'], AUTH_COALESCE_SECONDS=0):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.authorize().status_code, 200)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('scrypt$1024$'))
+
+        with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 11, PASSWORD_HASHERS=['api.hashers.ScryptPasswordHasher'], AUTH_COALESCE_SECONDS=0):
+            self.assertEqual(self.authorize().status_code, 200)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('scrypt$2048$'))
+
+
+class LoginHashUpgradeTests(TransactionTestCase):
+    # Отзыв токенов выполняется в on_commit, поэтому нужны настоящие транзакции
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.student = User.objects.create_user(username='student', password='pass12345')
+
+    def test_hash_is_upgraded_on_login(self):
+        other_session = APIClient()
+        other_session.cookies['access_token'] = str(add_user_claims(RefreshToken.for_user(self.student).access_token, self.student))
+
+        with override_settings(PASSWORD_HASHERS=['api.hashers.ScryptPasswordHasher', 'api.hashers.PBKDF2PasswordHasher']):
+            response = self.client.post(reverse('authorization'), {'username': 'student', 'password': 'pass12345'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('scrypt$'))
+
+        # Новый формат хеша — не смена пароля: ни выданный входом токен,
+        # ни другие сессии не отзываются
+        self.assertEqual(self.client.get(reverse('get_user_info')).status_code, 200)
+        self.assertEqual(other_session.get(reverse('get_user_info')).status_code, 200)
+
+        self.student.set_password('new-pass-123')
+        self.student.save()
+        self.assertEqual(other_session.get(reverse('get_user_info')).status_code, 401)
+
+
+class BatchOrderTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=10)
+        self.admin = User.objects.create_user(username='teacher', password='pass12345', role='admin')
+        self.login(self.admin)
+
+    def order(self, dish, quantity, **extra):
+        return {'canteen_id': self.canteen.id, 'items': [{'dish_id': dish.id, 'quantity': quantity}], **extra}
+
+    def post_batch(self, orders, **extra):
+        return self.client.post(reverse('order-batch'), {'orders': orders, **extra}, format='json')
+
+    def test_batch_creates_orders_for_several_users(self):
+        with self.assertNumQueries(19):
+            response = self.post_batch([
+                self.order(self.soup, 2, user_id=self.student.id),
+                self.order(self.tea, 1),
+                self.order(self.soup, 1, preparation_type='scheduled', preparation_time=timezone.now() + timedelta(hours=1)),
+            ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Order.objects.filter(user=self.student).count(), 1)
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 2)
+        self.assertEqual(response.data['results'][0]['order']['total_price'], '300.00')
+
+    def test_partial_batch_reports_failures(self):
+        response = self.post_batch([
+            self.order(self.soup, 4),
+            self.order(self.soup, 4),
+            self.order(self.tea, 0),
+        ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'failed', 'failed'])
+        self.assertIn("Доступно: 1", response.data['results'][1]['error'])
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 1)
+
+    def test_all_or_nothing_rejects_whole_batch(self):
+        response = self.post_batch([self.order(self.soup, 4), self.order(self.soup, 4)], all_or_nothing=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 5)
+
+    def test_student_cannot_order_for_others(self):
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.login(self.student)
+        response = self.post_batch([self.order(self.soup, 1, user_id=other.id)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup_stock = CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        self.login(self.student)
+        self.payload = {'canteen_id': self.canteen.id, 'items': [{'dish_id': self.soup.id, 'quantity': 2}]}
+
+    def post_order(self, key, payload=None):
+        return self.client.post(reverse('set_order'), payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_returns_stored_response(self):
+        first = self.post_order('retry-1')
+        second = self.post_order('retry-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.soup_stock.refresh_from_db()
+        self.assertEqual(self.soup_stock.quantity, 3)
+
+    def test_key_reused_with_other_payload(self):
+        self.post_order('retry-1')
+        other = {'canteen_id': self.canteen.id, 'items': [{'dish_id': self.soup.id, 'quantity': 1}]}
+        self.assertEqual(self.post_order('retry-1', other).status_code, 422)
+
+    def test_request_in_progress(self):
+        request_hash = hashlib.sha256(json.dumps(self.payload, sort_keys=True).encode()).hexdigest()
+        IdempotencyKey.objects.create(user=self.student, endpoint='set_order', key='retry-1', request_hash=request_hash)
+        response = self.post_order('retry-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # Зависший запрос (старше IDEMPOTENCY_LOCK_TIMEOUT) выполняется заново
+        IdempotencyKey.objects.filter(key='retry-1').update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.post_order('retry-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_released_during_claim(self):
+        # Запись дубля исчезает между неудачной вставкой и чтением: первый
+        # запрос упал и удалил свой ключ
+        request_hash = request_fingerprint(mock.Mock(data=self.payload))
+        IdempotencyKey.objects.create(user=self.student, endpoint='set_order', key='retry-1', request_hash=request_hash)
+
+        def vanish():
+            IdempotencyKey.objects.all().delete()
+
+        with mock.patch.object(QuerySet, 'first', side_effect=vanish):
+            record, claimed = _claim(self.student.id, 'set_order', 'retry-1', request_hash)
+        self.assertTrue(claimed)
+        self.assertEqual(record.key, 'retry-1')
+
+        # Ключ все время занят другим запросом и освобождается: 409 вместо 500
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.assertEqual(_claim(self.student.id, 'set_order', 'retry-1', request_hash), (None, False))
+            self.assertEqual(self.post_order('retry-1').status_code, 409)
+
+    def test_cleanup_command(self):
+        self.post_order('old')
+        self.post_order('fresh', {'canteen_id': self.canteen.id, 'items': [{'dish_id': self.soup.id, 'quantity': 1}]})
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timedelta(days=2))
+        call_command('cleanup_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+
+class TimeSlotTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.canteen.slot_max_orders = 2
+        self.canteen.slot_max_dishes = 3
+        self.canteen.save()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=50)
+        self.login(self.student)
+        self.slot = timezone.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+        self.slot -= timedelta(minutes=self.slot.minute % 10)
+
+    def order(self, quantity=1, minutes=0):
+        return {
+            'canteen_id': self.canteen.id,
+            'preparation_type': 'scheduled',
+            'preparation_time': (self.slot + timedelta(minutes=minutes)).isoformat(),
+            'items': [{'dish_id': self.soup.id, 'quantity': quantity}],
+        }
+
+    def test_slot_order_limit(self):
+        for minutes in (1, 9):
+            self.assertEqual(self.client.post(reverse('set_order'), self.order(minutes=minutes), format='json').status_code, 201)
+        response = self.client.post(reverse('set_order'), self.order(minutes=5), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("заполнен", response.data['error'])
+        # Следующий слот свободен
+        self.assertEqual(self.client.post(reverse('set_order'), self.order(minutes=10), format='json').status_code, 201)
+
+    def test_slot_dish_limit_rolls_back_stock(self):
+        self.client.post(reverse('set_order'), self.order(quantity=2), format='json')
+        response = self.client.post(reverse('set_order'), self.order(quantity=2), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CanteenDish.objects.get(dish=self.soup).quantity, 48)
+
+    def test_slots_endpoint(self):
+        self.client.post(reverse('set_order'), self.order(), format='json')
+        self.client.post(reverse('set_order'), self.order(), format='json')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('canteen-slots', kwargs={'canteen_id': self.canteen.id}) + '?hours=2')
+        self.assertEqual(len(response.data), 12)
+        booked = [slot for slot in response.data if slot['orders']]
+        self.assertEqual(len(booked), 1)
+        self.assertEqual((booked[0]['orders'], booked[0]['dishes'], booked[0]['available']), (2, 2, False))
+
+    def test_batch_respects_slot_capacity(self):
+        self.login(User.objects.create_user(username='teacher', password='pass12345', role='admin'))
+        response = self.client.post(reverse('order-batch'), {
+            'orders': [self.order(), self.order(), self.order()],
+        }, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'created', 'failed'])
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_FAIL_ON_BUDGET=False)
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+
+    def test_requests_are_recorded_per_endpoint(self):
+        self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id}))
+        self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id}))
+        histograms = registry.snapshot()['canteen-menu']
+        self.assertEqual(histograms['wall'].count, 2)
+        # Второй запрос отдается из кэша без обращения к БД
+        self.assertEqual(histograms['queries'].sum, 2)
+
+    def test_metrics_endpoint_round_trip(self):
+        self.client.get(reverse('canteen-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('canteen_request_db_queries_count{endpoint="canteen-list"} 1', text)
+        parsed = parse_prometheus(text)
+        self.assertEqual(parsed['canteen-list']['queries'].sum, 1)
+
+    @override_settings(PROFILING_FAIL_ON_BUDGET=True, PROFILING_QUERY_BUDGETS={'canteen-list': 0})
+    def test_budget_violation_fails(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('canteen-list'))
+
+    def test_report_command(self):
+        self.client.get(reverse('canteen-list'))
+        metrics = self.client.get(reverse('metrics')).content
+        out = io.StringIO()
+        with mock.patch('api.management.commands.profiling_report.urlopen', return_value=io.BytesIO(metrics)):
+            call_command('profiling_report', '--url', 'http://server/api/v1/_metrics', '--sort', 'queries', stdout=out)
+        self.assertIn('canteen-list', out.getvalue())
+
+
+class CanteenMenusTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = Canteen.objects.create(name="Столовая №2", address="ул. Тестовая, 2")
+        self.closed = Canteen.objects.create(name="Закрытая", address="ул. Тестовая, 3", is_open=False)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=0)
+        CanteenDish.objects.create(canteen=self.second, dish=self.tea, quantity=7)
+        CanteenDish.objects.create(canteen=self.second, dish=self.soup, quantity=2)
+        CanteenDish.objects.create(canteen=self.closed, dish=self.soup, quantity=9)
+
+    def test_nested_layout_matches_single_menu(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('canteen-menus'))
+        self.assertEqual([menu['canteen']['id'] for menu in response.data], [self.canteen.id, self.second.id])
+        single = self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id})).data
+        self.assertEqual(response.data[0]['dishes'], single)
+
+    def test_columnar_layout(self):
+        response = self.client.get(reverse('canteen-menus') + f'?ids={self.second.id},{self.closed.id}&layout=columnar')
+        self.assertEqual(response.data['canteens']['id'], [self.second.id, self.closed.id])
+        self.assertEqual(response.data['dishes']['id'], [self.soup.id, self.tea.id])
+        self.assertEqual(response.data['dishes']['price'], ['150.00', '30.00'])
+        self.assertEqual(response.data['quantity'], [[2, 7], [9, 0]])
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get(reverse('canteen-menus') + '?ids=a,b').status_code, 400)
+
+
+class DishSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = Canteen.objects.create(name="Столовая №2", address="ул. Тестовая, 2")
+        self.closed = Canteen.objects.create(name="Закрытая", address="ул. Тестовая, 3", is_open=False)
+        self.syrniki = Dish.objects.create(name="Сырники", description="Творожные, со сметаной", price=Decimal('120.00'), weight=200)
+        self.salad = Dish.objects.create(name="Салат из свеклы", description="Со сметаной, подается к борщу", price=Decimal('80.00'), weight=150)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        CanteenDish.objects.create(canteen=self.second, dish=self.soup, quantity=0)
+        CanteenDish.objects.create(canteen=self.closed, dish=self.soup, quantity=9)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.syrniki, quantity=3)
+        CanteenDish.objects.create(canteen=self.second, dish=self.salad, quantity=4)
+
+    def search(self, query=''):
+        return self.client.get(reverse('dish-search') + query)
+
+    def test_ranked_results_with_availability(self):
+        with self.assertNumQueries(2):
+            response = self.search('?q=борщ')
+        self.assertEqual(response.status_code, 200)
+        # Совпадение в названии выше совпадения с началом слова в описании
+        self.assertEqual([dish['id'] for dish in response.data['results']], [self.soup.id, self.salad.id])
+        self.assertGreater(response.data['results'][0]['rank'], response.data['results'][1]['rank'])
+        with self.assertNumQueries(1):
+            response = self.search('?q=сырн')
+        self.assertEqual(response.data['results'][0]['canteens'], [{
+            'id': self.canteen.id, 'name': self.canteen.name, 'address': self.canteen.address,
+            'is_open': True, 'available_quantity': 3,
+        }])
+        self.assertEqual(response.data['results'][0]['price'], '120.00')
+        self.assertEqual(self.search('?q=сметан свекл').data['results'][0]['id'], self.salad.id)
+        self.assertEqual(self.search('?q=пицца').data['results'], [])
+
+    def test_filters(self):
+        response = self.search('?q=борщ')
+        self.assertEqual([canteen['id'] for canteen in response.data['results'][0]['canteens']], [self.canteen.id])
+        response = self.search(f'?q=борщ&in_stock=false&canteen_ids={self.second.id},{self.closed.id}')
+        self.assertEqual(
+            [(canteen['id'], canteen['available_quantity']) for canteen in response.data['results'][0]['canteens']],
+            [(self.second.id, 0), (self.closed.id, 9)]
+        )
+        response = self.search('?price_min=100&weight_max=250')
+        self.assertEqual([dish['id'] for dish in response.data['results']], [self.syrniki.id])
+        self.assertEqual(self.search('?price_min=100&price_max=50').status_code, 400)
+        self.assertEqual(self.search('?canteen_ids=a').status_code, 400)
+
+    def test_pagination_by_dish(self):
+        first = self.search(f'?in_stock=false&canteen_ids={self.canteen.id},{self.second.id}&page_size=2')
+        self.assertEqual([dish['id'] for dish in first.data['results']], [self.soup.id, self.syrniki.id])
+        self.assertEqual(len(first.data['results'][0]['canteens']), 2)
+        second = self.client.get(first.data['next'])
+        self.assertEqual([dish['id'] for dish in second.data['results']], [self.salad.id])
+        self.assertIsNone(second.data['next'])
+        self.assertEqual(self.search('?page=0').status_code, 404)
+
+    def test_index_candidates_are_filtered_in_chunks(self):
+        # Найденные по индексу блюда проверяются фильтрами порциями в порядке
+        # релевантности, а не одним списком id всех совпадений
+        # Первый поиск строит индекс в памяти (отдельное чтение блюд)
+        self.client.get(reverse('dish-search'), {'q': 'сметан'})
+        with mock.patch('api.search.CANDIDATE_CHUNK', 1):
+            with self.assertNumQueries(2):
+                first = self.client.get(reverse('dish-search'), {'q': 'сметан', 'page_size': 1})
+            self.assertEqual([dish['id'] for dish in first.data['results']], [self.syrniki.id])
+            second = self.client.get(first.data['next'])
+            self.assertEqual([dish['id'] for dish in second.data['results']], [self.salad.id])
+            self.assertIsNone(second.data['next'])
+
+    def test_index_follows_dish_changes(self):
+        self.assertEqual(self.search('?q=оладьи').data['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.syrniki.name = "Оладьи"
+            self.syrniki.save()
+        self.assertEqual([dish['id'] for dish in self.search('?q=оладьи').data['results']], [self.syrniki.id])
+
+
+class ThumbnailTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, DISH_THUMBNAIL_SIZES={'small': 40, 'large': 120})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+
+    def photo(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('borsch.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def menu_dish(self):
+        cache.clear()
+        return self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id})).data[0]
+
+    def test_upload_builds_hashed_variants(self):
+        self.soup.photo = self.photo()
+        self.soup.save()
+
+        variants = self.menu_dish()['photo_variants']
+        self.assertEqual(set(variants), {'small', 'large'})
+        self.assertEqual(set(variants['small']), {'webp', 'jpeg'})
+        path = self.soup.photo_thumbnails['sizes']['small']['webp']
+        with default_storage.open(path) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (40, 30))
+
+        # Новое фото — новый хэш в имени, старые URL можно кэшировать бессрочно
+        self.soup.photo = self.photo('blue')
+        self.soup.save()
+        self.assertNotEqual(self.menu_dish()['photo_variants']['small']['webp'], variants['small']['webp'])
+
+    def test_menu_list_urls_match_detail(self):
+        # Снимок в кэше хранит относительные URL, ответ — абсолютные, как у детального эндпоинта
+        self.soup.photo = self.photo()
+        self.soup.save()
+        listed = self.menu_dish()
+        self.assertTrue(listed['photo'].startswith('http://testserver/'))
+        self.assertTrue(listed['photo_variants']['small']['webp'].startswith('http://testserver/'))
+        detail = self.client.get(reverse('canteen-menu-detail', kwargs={'canteen_id': self.canteen.id, 'dish_id': self.soup.id}))
+        self.assertEqual(listed['photo'], detail.data['photo'])
+        self.assertEqual(listed['photo_variants'], detail.data['photo_variants'])
+        delta = self.client.get(reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id}), {'since': 0}).data
+        self.assertEqual(delta['dishes'][0]['photo'], listed['photo'])
+
+    @override_settings(DISH_THUMBNAILS_ON_SAVE=False)
+    def test_backfill_command(self):
+        self.soup.photo = self.photo()
+        self.soup.save()
+        self.assertIsNone(self.menu_dish()['photo_variants'])
+
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+        self.soup.refresh_from_db()
+        self.assertEqual(self.soup.photo_thumbnails['source'], self.soup.photo.name)
+        self.assertIsNotNone(self.menu_dish()['photo_variants'])
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'нужна вторая база: --settings=core.settings_test')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(APITestCase):
+    # Реплика в тестах — отдельная пустая база, поэтому по ответу видно, откуда читали
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+
+    def test_safe_reads_go_to_replica(self):
+        self.assertEqual(self.client.get(reverse('canteen-list')).data, [])
+        # Вне запроса чтение идет с основной базы
+        self.assertEqual(Canteen.objects.count(), 1)
+
+    def test_client_sticks_to_primary_after_write(self):
+        self.login(self.student)
+        response = self.client.post(reverse('set_order'), {
+            'canteen_id': self.canteen.id,
+            'items': [{'dish_id': self.soup.id, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(settings.DB_PRIMARY_COOKIE, response.cookies)
+
+        response = self.client.get(reverse('order-history'))
+        self.assertEqual(len(response.data['results']), 1)
+
+        self.client.cookies[settings.DB_PRIMARY_COOKIE] = '0'
+        self.assertEqual(self.client.get(reverse('canteen-list')).data, [])
+
+    def test_menu_falls_back_to_primary_while_replica_lags(self):
+        # Снимок меню кэшируется под версией основной базы: отстающая реплика
+        # (здесь — пустая) не должна попасть в кэш
+        kwargs = {'canteen_id': self.canteen.id}
+        url = reverse('canteen-menu', kwargs=kwargs)
+        response = self.client.get(url)
+        self.assertEqual([dish['name'] for dish in response.data], ["Борщ"])
+        self.assertEqual(response['X-Menu-Version'], str(menu_version(self.canteen.id)))
+        response = self.client.get(url, {'since': 0})
+        self.assertEqual([dish['name'] for dish in response.data['dishes']], ["Борщ"])
+
+        cache.clear()
+        request = RequestFactory(HTTP_HOST='testserver').get(url)
+        token = start_routing(pinned=False)
+        try:
+            response = async_to_sync(AsyncCanteenMenuView.as_view())(request, **kwargs)
+        finally:
+            finish_routing(token)
+        self.assertEqual([dish['name'] for dish in json.loads(response.content)], ["Борщ"])
+
+    def test_menu_reads_replica_that_has_primary_version(self):
+        # bulk_create не вызывает сигналов, поэтому версия основной базы не меняется;
+        # блюдо на реплике названо иначе, чтобы было видно, откуда читали
+        version = menu_version(self.canteen.id)
+        Canteen.objects.using('replica').bulk_create([Canteen(id=self.canteen.id, name=self.canteen.name, address=self.canteen.address, menu_version=version)])
+        Dish.objects.using('replica').bulk_create([Dish(id=self.soup.id, name="Борщ с реплики", price=self.soup.price, weight=300)])
+        CanteenDish.objects.using('replica').bulk_create([CanteenDish(canteen_id=self.canteen.id, dish_id=self.soup.id, quantity=5)])
+
+        cache.clear()
+        url = reverse('canteen-menu', kwargs={'canteen_id': self.canteen.id})
+        response = self.client.get(url)
+        self.assertEqual([dish['name'] for dish in response.data], ["Борщ с реплики"])
+        self.assertEqual(response['X-Menu-Version'], str(version))
+
+
+class SalesReportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=50)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=50)
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.admin = User.objects.create_user(username='admin', password='pass12345', role='admin')
+
+    def place_order(self, items):
+        self.login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('set_order'), {
+                'canteen_id': self.canteen.id,
+                'items': items,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def report(self, user, name='worker-sales-report', **params):
+        self.login(user)
+        return self.client.get(reverse(name), params)
+
+    def test_orders_update_rollup_on_commit(self):
+        self.place_order([{'dish_id': self.soup.id, 'quantity': 2}, {'dish_id': self.tea.id, 'quantity': 1}])
+        self.place_order([{'dish_id': self.soup.id, 'quantity': 1}])
+
+        soup = DailySales.objects.get(dish=self.soup)
+        self.assertEqual((soup.quantity, soup.revenue, soup.orders), (3, Decimal('450.00'), 2))
+
+        with self.assertNumQueries(3):
+            response = self.report(self.worker)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['revenue'], '480.00')
+        self.assertEqual(
+            [(dish['name'], dish['quantity'], dish['orders']) for dish in response.data['dishes']],
+            [("Борщ", 3, 2), ("Чай", 1, 1)]
+        )
+        self.assertEqual(response.data['days'][0]['date'], timezone.localdate().isoformat())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.place_order([{'dish_id': self.soup.id, 'quantity': 2}])
+        # Пересборка считает выручку по цене на момент заказа, а не по текущей
+        Dish.objects.filter(id=self.soup.id).update(price=Decimal('200.00'))
+        self.place_order([{'dish_id': self.soup.id, 'quantity': 1}, {'dish_id': self.tea.id, 'quantity': 3}])
+        self.assertEqual(DailySales.objects.get(dish=self.soup).revenue, Decimal('500.00'))
+        incremental = set(DailySales.objects.values_list('canteen_id', 'dish_id', 'date', 'quantity', 'revenue', 'orders'))
+
+        call_command('rebuild_sales_rollup', chunk_size=1, stdout=io.StringIO())
+        rebuilt = set(DailySales.objects.values_list('canteen_id', 'dish_id', 'date', 'quantity', 'revenue', 'orders'))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_permissions_and_validation(self):
+        self.assertEqual(self.report(self.student).status_code, 403)
+        self.assertEqual(self.report(self.worker, name='sales-report').status_code, 403)
+        self.assertEqual(self.report(self.admin, name='sales-report', canteen_id=self.canteen.id).status_code, 200)
+        response = self.report(self.worker, date_from='2026-02-01', date_to='2026-01-01')
+        self.assertEqual(response.status_code, 400)
+
+
+class ForecastTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.soup, quantity=5)
+        CanteenDish.objects.create(canteen=self.canteen, dish=self.tea, quantity=0)
+        self.worker = User.objects.create_user(username='worker', password='pass12345', role='worker', canteen=self.canteen)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def order_at(self, weeks_ago, hour, soup):
+        moment = timezone.make_aware(datetime.combine(self.day - timedelta(weeks=weeks_ago), time(hour)))
+        order = self.create_order(items=[(self.soup, soup)])
+        Order.objects.filter(id=order.id).update(created_at=moment)
+
+    def test_incremental_aggregation_and_suggestion(self):
+        self.order_at(1, 12, soup=10)
+        self.order_at(2, 12, soup=6)
+        self.order_at(2, 13, soup=4)
+        self.assertEqual(update_hourly_demand(), 3)
+        # Повторный запуск не пересчитывает уже обработанные заказы
+        self.assertEqual(update_hourly_demand(), 0)
+        self.order_at(1, 12, soup=2)
+        update_hourly_demand(chunk_size=1)
+        self.assertEqual(HourlyDemand.objects.get(date=self.day - timedelta(weeks=1), hour=12).quantity, 12)
+
+        self.login(self.worker)
+        response = self.client.get(reverse('worker-forecast'), {'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['weeks_observed'], 2)
+        soup = response.data['dishes'][0]
+        # (12 + 10) / 2 недели = 11, с запасом 10% — 13
+        self.assertEqual((soup['dish_id'], soup['forecast']), (self.soup.id, 11.0))
+        self.assertEqual(soup['hourly'][12], 9.0)
+        self.assertEqual((soup['suggested_quantity'], soup['restock']), (13, 8))
+        self.assertEqual(response.data['dishes'][1]['forecast'], 0)
+
+    def test_recent_orders_wait_for_next_run(self):
+        self.create_order()
+        self.assertEqual(update_hourly_demand(), 0)
+
+    def test_command(self):
+        self.order_at(1, 12, soup=3)
+        out = io.StringIO()
+        call_command('suggest_quantities', canteen=[self.canteen.id], date=self.day, stdout=out)
+        self.assertIn('Борщ', out.getvalue())
+
+
+class OrderArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=60)
+        self.archived = []
+        for _ in range(3):
+            order = self.create_order(status='closed')
+            self.archived.append(order.id)
+        Order.objects.filter(id__in=self.archived).update(created_at=self.old)
+        self.stale_ready = self.create_order(status='ready')
+        Order.objects.filter(id=self.stale_ready.id).update(created_at=self.old)
+        self.recent = self.create_order(status='closed')
+
+    def test_moves_old_closed_orders_in_batches(self):
+        out = io.StringIO()
+        call_command('archive_orders', days=30, batch_size=2, stdout=out)
+        self.assertIn('3', out.getvalue())
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {self.stale_ready.id, self.recent.id})
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), self.archived)
+        self.assertEqual(ArchivedOrderItem.objects.filter(order_id=self.archived[0]).count(), 2)
+        self.assertFalse(OrderItem.objects.filter(order_id__in=self.archived).exists())
+
+    def test_history_reads_across_live_and_archive(self):
+        call_command('archive_orders', days=30, stdout=io.StringIO())
+        self.login(self.student)
+
+        seen = []
+        url = reverse('order-history') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        # Сначала новые заказы, внутри одной секунды — по убыванию id
+        self.assertEqual(seen, [self.recent.id, self.stale_ready.id] + sorted(self.archived, reverse=True))
+        archived = self.client.get(reverse('order-history') + '?page_size=10').data['results'][-1]
+        self.assertEqual([item['dish_name'] for item in archived['items']], ["Борщ", "Чай"])
+
+    def test_rollup_rebuild_includes_archive(self):
+        call_command('archive_orders', days=30, stdout=io.StringIO())
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.assertEqual(DailySales.objects.filter(date=timezone.localdate(self.old)).get(dish=self.soup).orders, 4)
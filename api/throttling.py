@@ -0,0 +1,60 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # Token bucket в кэше: ведро на AUTH_THROTTLE_BUCKETS[scope][0] попыток
+    # пополняется на [1] попыток в минуту. Пачка попыток подряд допустима,
+    # а перебор паролей упирается в скорость пополнения — до проверки хеша.
+    # Чтение и запись состояния не атомарны: параллельные запросы могут
+    # получить по одной лишней попытке, для ограничения перебора это неважно
+    scope = None
+
+    def get_ident_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        capacity, per_minute = settings.AUTH_THROTTLE_BUCKETS[self.scope]
+        rate = per_minute / 60
+        key = f'throttle:{self.scope}:{ident}'
+        now = time.time()
+
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.retry_after = (1 - tokens) / rate
+            return False
+        # Полное ведро можно не хранить: ключ живет, пока ведро не наполнится
+        cache.set(key, (tokens - 1, now), timeout=math.ceil((capacity - tokens + 1) / rate))
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class AuthIPThrottle(TokenBucketThrottle):
+    # Все попытки входа и регистрации с одного адреса (с учетом NUM_PROXIES)
+    scope = 'ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class AuthUsernameThrottle(TokenBucketThrottle):
+    # Попытки входа под одним логином с любых адресов: против перебора
+    # пароля конкретного пользователя через много IP
+    scope = 'username'
+
+    def get_ident_key(self, request, view):
+        username = request.data.get('username')
+        if not isinstance(username, str) or not username:
+            return None
+        return hashlib.sha256(username.encode()).hexdigest()[:32]
@@ -0,0 +1,59 @@
+import hashlib
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Миниатюры лежат рядом с оригиналами, имя содержит хэш исходного файла:
+# при замене фото меняется и URL, поэтому миниатюры можно кэшировать навсегда
+THUMBNAIL_DIR = 'dishes/thumbs'
+FORMATS = (('webp', 'WEBP', 'webp'), ('jpeg', 'JPEG', 'jpg'))
+
+
+def thumbnails_outdated(dish):
+    return bool(dish.photo) and (dish.photo_thumbnails or {}).get('source') != dish.photo.name
+
+
+def build_thumbnails(name):
+    # Читает оригинал из хранилища и сохраняет все размеры во всех форматах.
+    # Возвращает значение для Dish.photo_thumbnails
+    with default_storage.open(name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    image = Image.open(io.BytesIO(data))
+    # JPEG декодируется сразу в уменьшенном масштабе — это в разы быстрее
+    # полного декодирования снимка с камеры
+    image.draft('RGB', (max(settings.DISH_THUMBNAIL_SIZES.values()),) * 2)
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    sizes = {}
+    for label, width in settings.DISH_THUMBNAIL_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((width, width), Image.Resampling.LANCZOS)
+        sizes[label] = {}
+        for key, pillow_format, extension in FORMATS:
+            path = posixpath.join(THUMBNAIL_DIR, f'{digest}-{width}.{extension}')
+            if not default_storage.exists(path):
+                buffer = io.BytesIO()
+                variant.save(buffer, pillow_format, quality=settings.DISH_THUMBNAIL_QUALITY)
+                path = default_storage.save(path, ContentFile(buffer.getvalue()))
+            sizes[label][key] = path
+    return {'source': name, 'sizes': sizes}
+
+
+def thumbnail_urls(thumbnails, request=None):
+    # Те же правила построения URL, что и у ImageField в DRF: абсолютные при
+    # наличии request, иначе относительные
+    if not thumbnails:
+        return None
+    urls = {}
+    for label, variants in thumbnails['sizes'].items():
+        urls[label] = {}
+        for key, path in variants.items():
+            url = default_storage.url(path)
+            urls[label][key] = request.build_absolute_uri(url) if request is not None else url
+    return urls
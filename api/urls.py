@@ -1,32 +1,70 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     CreateUserView,
     AuthorizationView,
+    TokenRefreshView,
     GetUserInfoView,
+    OrderHistoryView,
     UpdateUserView,
     CanteenListView,
     CanteenMenuView,
+    CanteenMenusView,
     CanteenMenuDetailView,
+    CanteenSlotsView,
+    DishSearchView,
     #GetDishInfoView,
     #GetDishesInfoView,
     SetOrderView,
+    BatchOrderView,
+    StockHoldView,
     LogoutView,
     WorkerOrderListView,
-    WorkerOrderUpdateStatusView
+    WorkerOrderEventsView,
+    WorkerOrderUpdateStatusView,
+    WorkerOrderBulkStatusView,
+    WorkerSalesReportView,
+    SalesReportView,
+    WorkerForecastView,
+    MetricsView,
+    AsyncCanteenListView,
+    AsyncCanteenMenuView,
+    AsyncCanteenMenuDetailView,
+    AsyncWorkerOrderListView
 )
 
+# Под ASGI эндпоинты чтения можно обслуживать асинхронными представлениями
+if settings.ASYNC_READ_VIEWS:
+    CanteenListView = AsyncCanteenListView
+    CanteenMenuView = AsyncCanteenMenuView
+    CanteenMenuDetailView = AsyncCanteenMenuDetailView
+    WorkerOrderListView = AsyncWorkerOrderListView
+
 urlpatterns = [
     path('create_user', CreateUserView.as_view(), name='create_user'),
     path('authorization', AuthorizationView.as_view(), name='authorization'),
+    path('token/refresh', TokenRefreshView.as_view(), name='token-refresh'),
     path('logout', LogoutView.as_view(), name='logout'),
     path('get_user_info', GetUserInfoView.as_view(), name='get_user_info'),
+    path('orders', OrderHistoryView.as_view(), name='order-history'),
     path('update_user', UpdateUserView.as_view(), name='update_user'),
     #path('get_dish_info/<int:id>', GetDishInfoView.as_view(), name='get_dish_info'),
     #path('get_dishes_info', GetDishesInfoView.as_view(), name='get_dishes_info'),
     path('canteens', CanteenListView.as_view(), name='canteen-list'),
+    path('canteens/menus', CanteenMenusView.as_view(), name='canteen-menus'),
     path('canteens/<int:canteen_id>/menu', CanteenMenuView.as_view(), name='canteen-menu'),
     path('canteens/<int:canteen_id>/menu/<int:dish_id>', CanteenMenuDetailView.as_view(), name='canteen-menu-detail'),
+    path('canteens/<int:canteen_id>/slots', CanteenSlotsView.as_view(), name='canteen-slots'),
+    path('dishes/search', DishSearchView.as_view(), name='dish-search'),
     path('set_order', SetOrderView.as_view(), name='set_order'),
+    path('orders/batch', BatchOrderView.as_view(), name='order-batch'),
+    path('cart/holds', StockHoldView.as_view(), name='cart-holds'),
     path('worker/orders', WorkerOrderListView.as_view(), name='worker-order-list'),
+    path('worker/orders/events', WorkerOrderEventsView.as_view(), name='worker-order-events'),
+    path('worker/orders/status', WorkerOrderBulkStatusView.as_view(), name='worker-order-bulk-status'),
     path('worker/orders/<int:pk>/update-status', WorkerOrderUpdateStatusView.as_view(), name='worker-order-update'),
+    path('worker/reports/sales', WorkerSalesReportView.as_view(), name='worker-sales-report'),
+    path('worker/forecast', WorkerForecastView.as_view(), name='worker-forecast'),
+    path('reports/sales', SalesReportView.as_view(), name='sales-report'),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,37 +1,98 @@
 from rest_framework import generics, status, views
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
+from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
 from django.db import transaction
+from django.db.models import Prefetch
+from collections import Counter, defaultdict
 from decimal import Decimal
+import json
 
-from .models import User, Dish, Order, OrderItem, Canteen, CanteenDish
-from .permissions import IsCanteenWorker
+from .models import (
+    User, Dish, Order, OrderItem, Canteen, CanteenDish, TimeSlot, DailySales,
+    ArchivedOrder, ArchivedOrderItem, StockHold,
+    ACTIVE_ORDER_STATUSES, ORDER_STATUS_TRANSITIONS, order_queue_priority, order_queue_time, stock_total
+)
+from .permissions import IsCanteenWorker, IsCanteenAdmin
 from .serializers import (
     UserCreateSerializer, UserDetailSerializer, DishSerializer, 
     UserUpdateSerializer, OrderSerializer, CanteenSerializer, 
-    CanteenMenuSerializer, OrderStatusUpdateSerializer, OrderCreateSerializer
+    CanteenMenuSerializer, OrderStatusUpdateSerializer, OrderCreateSerializer,
+    OrderBatchSerializer, TimeSlotSerializer, SalesReportQuerySerializer, SalesReportSerializer,
+    ForecastQuerySerializer, StockHoldCreateSerializer, StockHoldSerializer, OrderBulkStatusUpdateSerializer,
+    DishSearchQuerySerializer
+)
+from .authentication import (
+    JWTCookieAuthentication, add_user_claims, authenticate_credentials, is_token_revoked, load_user, revoke_token
+)
+from .throttling import AuthIPThrottle, AuthUsernameThrottle
+from .pagination import DishSearchPagination, OrderHistoryPagination, WorkerOrderQueuePagination
+from .analytics import record_sales_on_commit, sales_report
+from .forecast import suggest_quantities
+from .holds import consume_holds, set_hold, with_active_holds
+from .idempotency import idempotent
+from .menu_sync import amenu_read_alias, menu_delta, menu_read_alias
+from .menus import menu_rows, nested_menus, columnar_menus, search_results
+from .metrics import registry as metrics_registry
+from .search import search_dishes
+from .events import canteen_channel, get_broker, publish_order_event
+from .slots import SlotFull, available_slots, reserve_slots, slot_demands, slot_start
+from .stock import InsufficientStock, merge_quantities, reserve_stock, reserve_stock_many
+from .menu_cache import (
+    get_menu_version, get_menu_snapshot, menu_etag, etag_matches, bump_menu_version_on_commit,
+    aget_menu_version, aget_menu_snapshot
 )
-from .authentication import JWTCookieAuthentication
 
 # Функция для установки cookie
 def set_jwt_cookies(response, user):
-    refresh = RefreshToken.for_user(user)
+    # Claims refresh-токена (поколение для отзыва) копируются в access-токен
+    refresh = add_user_claims(RefreshToken.for_user(user), user)
+    access = refresh.access_token
     response.set_cookie(
         key='access_token',
-        value=str(refresh.access_token),
+        value=str(access),
+        httponly=True,
+        secure=False, # В продакшене должно быть True
+        samesite='Lax'
+    )
+    # Refresh-токен уходит только на эндпоинты API (token/refresh, logout):
+    # по нему access-токен обновляется без повторного ввода пароля
+    response.set_cookie(
+        key='refresh_token',
+        value=str(refresh),
+        max_age=int(refresh.lifetime.total_seconds()),
+        path=settings.JWT_REFRESH_COOKIE_PATH,
         httponly=True,
         secure=False, # В продакшене должно быть True
         samesite='Lax'
     )
     return response
 
+def delete_jwt_cookies(response):
+    response.delete_cookie('access_token')
+    response.delete_cookie('refresh_token', path=settings.JWT_REFRESH_COOKIE_PATH)
+    return response
+
+def slot_full_message(start):
+    return f"Слот {timezone.localtime(start):%H:%M} заполнен, выберите другое время"
+
 # 1. create_user
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserCreateSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [AuthIPThrottle]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -48,12 +109,14 @@ class CreateUserView(generics.CreateAPIView):
 # 2. authorization
 class AuthorizationView(views.APIView):
     permission_classes = [AllowAny]
+    # Лимиты проверяются до хеширования пароля: перебор не нагружает CPU
+    throttle_classes = [AuthIPThrottle, AuthUsernameThrottle]
 
     def post(self, request, *args, **kwargs):
         username = request.data.get('username')
         password = request.data.get('password')
 
-        user = authenticate(username=username, password=password)
+        user = authenticate_credentials(request, username, password)
 
         if user is not None:
             response = Response(
@@ -68,13 +131,41 @@ class AuthorizationView(views.APIView):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+# 2.1. token/refresh
+class TokenRefreshView(views.APIView):
+    # Новая пара токенов по refresh-токену из cookie: проверка подписи и одного
+    # ключа в хранилище отзыва (token_cache) вместо хеширования пароля.
+    # Предъявленный refresh-токен отзывается (ротация), повторно обменять его
+    # нельзя: хранилище не вытесняет записи, поэтому отметка об использовании
+    # живет до истечения самого токена
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        token = request.COOKIES.get('refresh_token')
+        user = None
+        if token:
+            try:
+                refresh = RefreshToken(token)
+            except TokenError:
+                refresh = None
+            if refresh is not None and not is_token_revoked(refresh) and revoke_token(refresh):
+                # Пользователь перечитывается: роль и столовая в новом токене
+                # должны быть актуальными, а заблокированный не получит токен
+                user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+
+        if user is None:
+            response = Response({"error": "Сессия истекла, войдите снова"}, status=status.HTTP_401_UNAUTHORIZED)
+            return delete_jwt_cookies(response)
+        response = Response({"message": "Токен обновлен"}, status=status.HTTP_200_OK)
+        return set_jwt_cookies(response, user)
+
 # 3. get_user_info
 class GetUserInfoView(views.APIView):
     authentication_classes = [JWTCookieAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
+        user = load_user(request.user)
         serializer = UserDetailSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -85,7 +176,7 @@ class UpdateUserView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return load_user(self.request.user)
 
     def update(self, request, *args, **kwargs):
         # Используем метод update из родительского класса, он обработает валидацию и сохранение
@@ -93,6 +184,29 @@ class UpdateUserView(generics.UpdateAPIView):
         response.data = {"message": "Данные пользователя успешно обновлены."}
         return response
 
+# 3.2 orders — история заказов пользователя
+class OrderHistoryView(generics.ListAPIView):
+    serializer_class = OrderSerializer
+    authentication_classes = [JWTCookieAuthentication]
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+
+    def get_queryset(self):
+        # Позиции и блюда подгружаются одним запросом на страницу, а не по запросу на заказ
+        return Order.objects.filter(user_id=self.request.user.id).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('dish'))
+        )
+
+    def get_archived_queryset(self):
+        return ArchivedOrder.objects.filter(user_id=self.request.user.id).prefetch_related(
+            Prefetch('items', queryset=ArchivedOrderItem.objects.select_related('dish'))
+        )
+
+    def list(self, request, *args, **kwargs):
+        # Заказы, перенесенные в архив (archive_orders), выдаются тем же курсором
+        page = self.paginator.paginate_querysets([self.get_queryset(), self.get_archived_queryset()], request, self)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
 # 4. get_dish_info/id
 #class GetDishInfoView(generics.RetrieveAPIView):
 #    queryset = Dish.objects.filter(is_available=True)
@@ -106,6 +220,47 @@ class UpdateUserView(generics.UpdateAPIView):
 #    serializer_class = DishSerializer
 #    permission_classes = [AllowAny]
 
+def canteen_menu_queryset(canteen_id):
+    return CanteenDish.objects.annotate(available_quantity=stock_total()).filter(
+        canteen_id=canteen_id,
+        available_quantity__gt=0
+    ).select_related('dish')
+
+def menu_dish(canteen_dish):
+    # "Прикрепляем" количество к объекту блюда для сериализатора
+    dish = canteen_dish.dish
+    dish.available_quantity = canteen_dish.available_quantity
+    return dish
+
+def absolute_menu_urls(dishes, request):
+    # Снимок меню в кэше хранит относительные URL фото (он общий для всех
+    # хостов); в ответ они попадают абсолютными, как у CanteenMenuDetailView
+    result = []
+    for dish in dishes:
+        dish = dict(dish)
+        if dish['photo']:
+            dish['photo'] = request.build_absolute_uri(dish['photo'])
+        if dish['photo_variants']:
+            dish['photo_variants'] = {
+                label: {key: request.build_absolute_uri(url) for key, url in variants.items()}
+                for label, variants in dish['photo_variants'].items()
+            }
+        result.append(dish)
+    return result
+
+def worker_order_queue(canteen_id):
+    # Сортировка по приоритету выполняется в БД (и совпадает с индексом
+    # order_worker_queue_idx), поэтому ответ можно отдавать постранично
+    return Order.objects.filter(
+        canteen_id=canteen_id,
+        status__in=ACTIVE_ORDER_STATUSES
+    ).annotate(
+        queue_priority=order_queue_priority(),
+        queue_time=order_queue_time()
+    ).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('dish'))
+    )
+
 class CanteenListView(generics.ListAPIView):
     queryset = Canteen.objects.all()
     serializer_class = CanteenSerializer
@@ -115,20 +270,58 @@ class CanteenMenuView(generics.ListAPIView):
     serializer_class = CanteenMenuSerializer
     permission_classes = [AllowAny]
 
-    def get_queryset(self):
+    def build_snapshot(self):
+        # Версия читается до самого меню: клиент с этой версией в худшем
+        # случае получит в следующей дельте уже известные ему строки.
+        # Реплика используется, только если уже видит эту версию (api/menu_sync.py).
+        # Сериализуем без request: в кэше относительные URL, абсолютными их
+        # делает absolute_menu_urls для каждого ответа
         canteen_id = self.kwargs.get('canteen_id')
-        canteen_dishes = CanteenDish.objects.filter(
-            canteen_id=canteen_id, 
-            quantity__gt=0
-        ).select_related('dish')
-
-        dishes = []
-        for cd in canteen_dishes:
-            dish = cd.dish
-            dish.available_quantity = cd.quantity 
-            dishes.append(dish)
-        
-        return dishes
+        alias, version = menu_read_alias(canteen_id)
+        dishes = [menu_dish(cd) for cd in canteen_menu_queryset(canteen_id).using(alias)]
+        serializer = CanteenMenuSerializer(dishes, many=True)
+        return {'version': version, 'dishes': [dict(item) for item in serializer.data]}
+
+    def delta(self, canteen_id, version, since):
+        # ?since=<версия>: только изменившиеся и убранные блюда. Если полноту
+        # изменений доказать нельзя, отдаем полный снимок с full=true
+        delta = menu_delta(canteen_id, since)
+        if delta is None:
+            snapshot = get_menu_snapshot(canteen_id, version, self.build_snapshot)
+            dishes = absolute_menu_urls(snapshot['dishes'], self.request)
+            return {'version': snapshot['version'], 'full': True, 'dishes': dishes, 'removed': []}
+        sequence, dishes, removed = delta
+        return {
+            'version': sequence,
+            'full': False,
+            'dishes': CanteenMenuSerializer(dishes, many=True, context={'request': self.request}).data,
+            'removed': removed,
+        }
+
+    def list(self, request, *args, **kwargs):
+        canteen_id = self.kwargs.get('canteen_id')
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({"error": "Параметр 'since' должен быть целым числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = get_menu_version(canteen_id)
+        etag = menu_etag(canteen_id, version)
+
+        # Клиент уже получил эту версию меню — отвечаем 304, не обращаясь к БД
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif since is not None:
+            response = Response(self.delta(canteen_id, version, since))
+        else:
+            snapshot = get_menu_snapshot(canteen_id, version, self.build_snapshot)
+            response = Response(absolute_menu_urls(snapshot['dishes'], request))
+            response['X-Menu-Version'] = snapshot['version']
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
 
 class CanteenMenuDetailView(generics.GenericAPIView):
     serializer_class = CanteenMenuSerializer
@@ -137,7 +330,7 @@ class CanteenMenuDetailView(generics.GenericAPIView):
     def get(self, request, canteen_id, dish_id):
         try:
             # Ищем конкретную запись об остатках для пары столовая-блюдо
-            canteen_dish = CanteenDish.objects.select_related('dish').get(
+            canteen_dish = CanteenDish.objects.annotate(available_quantity=stock_total()).select_related('dish').get(
                 canteen_id=canteen_id,
                 dish_id=dish_id
             )
@@ -145,18 +338,68 @@ class CanteenMenuDetailView(generics.GenericAPIView):
             return Response({"error": "Блюдо не найдено в этой столовой"}, status=status.HTTP_404_NOT_FOUND)
 
         # "Прикрепляем" количество к объекту блюда для сериализатора
-        dish = canteen_dish.dish
-        dish.available_quantity = canteen_dish.quantity
+        dish = menu_dish(canteen_dish)
 
         serializer = self.get_serializer(dish)
         return Response(serializer.data)
 
+class CanteenMenusView(views.APIView):
+    # Меню всех открытых (или выбранных через ?ids=1,2) столовых одним запросом.
+    # ?layout=columnar возвращает компактный столбцовый формат
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        canteen_ids = None
+        if request.query_params.get('ids'):
+            try:
+                canteen_ids = [int(value) for value in request.query_params['ids'].split(',')]
+            except ValueError:
+                return Response({"error": "Параметр 'ids' должен быть списком целых чисел через запятую"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = menu_rows(canteen_ids)
+        if request.query_params.get('layout') == 'columnar':
+            return Response(columnar_menus(rows))
+        return Response(nested_menus(rows))
+
+class DishSearchView(views.APIView):
+    # Поиск блюд по названию и описанию во всех столовых сразу: клиенту не
+    # нужно скачивать меню каждой столовой и фильтровать их у себя
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        # dict(): иначе отсутствующий in_stock из QueryDict читается как false
+        serializer = DishSearchQuerySerializer(data=request.query_params.dict())
+        serializer.is_valid(raise_exception=True)
+        paginator = DishSearchPagination()
+        offset, limit = paginator.page_bounds(request)
+        results = search_results(search_dishes(serializer.validated_data, offset, limit))
+        return paginator.get_paginated_response(paginator.paginate_results(results))
+
+class CanteenSlotsView(views.APIView):
+    # Свободные слоты для заказов 'ко времени' на ближайшие hours часов
+    permission_classes = [AllowAny]
+    max_hours = 24
+
+    def get(self, request, canteen_id):
+        try:
+            canteen = Canteen.objects.get(id=canteen_id)
+        except Canteen.DoesNotExist:
+            return Response({"error": "Столовая не найдена"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            hours = min(int(request.query_params.get('hours', 4)), self.max_hours)
+        except ValueError:
+            return Response({"error": "Параметр 'hours' должен быть целым числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        slots = available_slots(canteen, timezone.now(), hours)
+        return Response(TimeSlotSerializer(slots, many=True).data)
+
 # 6. set_order
 class SetOrderView(views.APIView):
     authentication_classes = [JWTCookieAuthentication]
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
+    @idempotent('set_order')
     def post(self, request, *args, **kwargs):
         canteen_id = request.data.get('canteen_id')
         serializer = OrderCreateSerializer(data=request.data)
@@ -164,10 +407,24 @@ class SetOrderView(views.APIView):
         validated_data = serializer.validated_data
 
         items_data = validated_data.get('items', [])
-        
-        try:
-            canteen = Canteen.objects.get(id=canteen_id, is_open=True)
-        except Canteen.DoesNotExist:
+        dish_ids = [item.get('dish_id') for item in items_data]
+
+        # Читаем блюда без блокировок: остатки проверяются и списываются атомарно ниже.
+        # Столовая и резервы корзины читаются тем же запросом; отдельный запрос к
+        # столовой нужен, только если блюд не нашлось, чтобы отличить закрытую
+        # столовую от чужих блюд
+        canteen_dishes = with_active_holds(CanteenDish.objects.filter(
+            canteen_id=canteen_id,
+            canteen__is_open=True,
+            dish_id__in=dish_ids
+        ).select_related('dish', 'canteen'), request.user.id)
+
+        canteen_dishes_map = {cd.dish_id: cd for cd in canteen_dishes}
+        if canteen_dishes_map:
+            canteen = next(iter(canteen_dishes_map.values())).canteen
+        else:
+            canteen = Canteen.objects.filter(id=canteen_id, is_open=True).first()
+        if canteen is None:
             return Response(
                 {"error": f"Столовая с ID {canteen_id} не найдена или закрыта"},
                 status=status.HTTP_404_NOT_FOUND
@@ -176,15 +433,6 @@ class SetOrderView(views.APIView):
         if not items_data:
             return Response({"error": "Список 'items' не может быть пустым"}, status=status.HTTP_400_BAD_REQUEST)
 
-        dish_ids = [item.get('dish_id') for item in items_data]
-        
-        canteen_dishes = CanteenDish.objects.filter(
-            canteen=canteen,
-            dish_id__in=dish_ids
-        ).select_for_update()
-
-        canteen_dishes_map = {cd.dish_id: cd for cd in canteen_dishes}
-
         for item_data in items_data:
             dish_id = item_data.get('dish_id')
             quantity = item_data.get('quantity', 1)
@@ -194,71 +442,323 @@ class SetOrderView(views.APIView):
 
             if dish_id not in canteen_dishes_map:
                 return Response({"error": f"Блюдо с ID {dish_id} не найдено в этой столовой"}, status=status.HTTP_404_NOT_FOUND)
-            
-            canteen_dish = canteen_dishes_map[dish_id]
-            if canteen_dish.quantity < quantity:
-                return Response({"error": f"Недостаточное количество блюда '{canteen_dish.dish.name}'. Доступно: {canteen_dish.quantity}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        order = Order.objects.create(
-            user=request.user, 
-            canteen=canteen, 
-            status='new',
-            preparation_type=validated_data.get('preparation_type', 'asap'),
-            preparation_time=validated_data.get('preparation_time')
+
+        total_price = sum(
+            (canteen_dishes_map[item['dish_id']].dish.price * item['quantity'] for item in items_data),
+            Decimal('0.0')
         )
-        total_price = Decimal('0.0')
 
-        order_items_to_create = []
-        for item_data in items_data:
-            dish_id = item_data['dish_id']
-            quantity = item_data['quantity']
-            canteen_dish = canteen_dishes_map[dish_id]
-
-            canteen_dish.quantity -= quantity
-            
-            order_items_to_create.append(
-                OrderItem(order=order, dish=canteen_dish.dish, quantity=quantity)
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user_id=request.user.id, 
+                    canteen=canteen, 
+                    status='paid',
+                    preparation_type=validated_data.get('preparation_type', 'asap'),
+                    preparation_time=validated_data.get('preparation_time'),
+                    total_price=total_price
+                )
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order, dish=canteen_dishes_map[item['dish_id']].dish, quantity=item['quantity'],
+                        unit_price=canteen_dishes_map[item['dish_id']].dish.price
+                    )
+                    for item in items_data
+                ])
+                if order.preparation_type == 'scheduled':
+                    reserve_slots(canteen, slot_demands(canteen, [
+                        (order.preparation_time, sum(item['quantity'] for item in items_data))
+                    ]))
+                # Списание — последний шаг транзакции, чтобы строки остатков
+                # оставались заблокированными как можно меньше. Отложенное в
+                # корзине уже списано: с остатка берется только непокрытое резервами
+                holds = [(cd.hold_id, cd.dish_id, cd.held) for cd in canteen_dishes_map.values() if cd.hold_id]
+                reserve_stock(
+                    canteen.id,
+                    consume_holds(request.user.id, canteen.id, merge_quantities(items_data), holds),
+                    {cd.dish_id: cd.hot_slots for cd in canteen_dishes_map.values()}
+                )
+                # update() не вызывает сигналы, поэтому версию меню увеличиваем явно
+                bump_menu_version_on_commit(canteen.id)
+                record_sales_on_commit(
+                    (order, item.dish_id, item.quantity, item.unit_price) for item in order_items
+                )
+        except InsufficientStock as exc:
+            canteen_dish = CanteenDish.objects.annotate(available_quantity=stock_total()).select_related('dish').get(canteen=canteen, dish_id=exc.dish_id)
+            return Response({"error": f"Недостаточное количество блюда '{canteen_dish.dish.name}'. Доступно: {canteen_dish.available_quantity}"}, status=status.HTTP_400_BAD_REQUEST)
+        except SlotFull as exc:
+            return Response({"error": slot_full_message(exc.start)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_serializer = OrderSerializer(order)
+        publish_order_event('order_created', canteen.id, response_serializer.data)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+# 6.1 orders/batch — пакетное оформление заказов (классы, мероприятия)
+class BatchOrderView(views.APIView):
+    authentication_classes = [JWTCookieAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @idempotent('order-batch')
+    def post(self, request, *args, **kwargs):
+        batch = OrderBatchSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+        orders_data = batch.validated_data['orders']
+        all_or_nothing = batch.validated_data['all_or_nothing']
+
+        errors = {}
+        valid = {}
+        for index, order_data in enumerate(orders_data):
+            error, data = self.validate_order(request.user, order_data)
+            if error:
+                errors[index] = error
+            else:
+                valid[index] = data
+
+        # Одно чтение на весь пакет: открытые столовые, пользователи, остатки и слоты
+        canteen_ids = {data['canteen_id'] for data in valid.values()}
+        open_canteens = Canteen.objects.filter(id__in=canteen_ids, is_open=True).in_bulk()
+        user_ids = {data['user_id'] for data in valid.values()} - {request.user.id}
+        known_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) | {request.user.id}
+        dish_ids = {item['dish_id'] for data in valid.values() for item in data['items']}
+        stock = {
+            (cd.canteen_id, cd.dish_id): cd
+            for cd in CanteenDish.objects.filter(canteen_id__in=open_canteens, dish_id__in=dish_ids)
+            .annotate(available_quantity=stock_total()).select_related('dish')
+        }
+        remaining = {key: cd.available_quantity for key, cd in stock.items()}
+        for data in valid.values():
+            canteen = open_canteens.get(data['canteen_id'])
+            if canteen and data.get('preparation_type') == 'scheduled':
+                data['slot'] = slot_start(canteen, data['preparation_time'])
+        slot_usage = {
+            (slot.canteen_id, slot.start): [slot.orders, slot.dishes]
+            for slot in TimeSlot.objects.filter(
+                canteen_id__in=open_canteens,
+                start__in={data['slot'] for data in valid.values() if 'slot' in data}
             )
-            total_price += canteen_dish.dish.price * quantity
+        }
+
+        accepted = {}
+        for index, data in valid.items():
+            error = self.allocate(data, open_canteens, known_users, stock, remaining, slot_usage)
+            if error:
+                errors[index] = error
+            else:
+                accepted[index] = data
+
+        if all_or_nothing and errors:
+            accepted = {}
+
+        created = {}
+        while accepted:
+            try:
+                created = self.create_orders(accepted, stock, open_canteens)
+                break
+            except SlotFull as exc:
+                # Слот заполнился параллельными заказами
+                rejected = [index for index, data in accepted.items()
+                            if data['canteen_id'] == exc.canteen_id and data.get('slot') == exc.start]
+                if all_or_nothing:
+                    rejected = list(accepted)
+                for index in rejected:
+                    errors[index] = slot_full_message(exc.start)
+                    del accepted[index]
+            except InsufficientStock as exc:
+                # Остаток успел измениться между чтением и списанием (параллельные заказы)
+                canteen_dish = stock[exc.canteen_id, exc.dish_id]
+                message = f"Недостаточное количество блюда '{canteen_dish.dish.name}'"
+                if all_or_nothing:
+                    errors.update({index: message for index in accepted})
+                    accepted = {}
+                    break
+                for index, data in list(accepted.items()):
+                    if data['canteen_id'] != exc.canteen_id:
+                        continue
+                    if any(item['dish_id'] == exc.dish_id for item in data['items']):
+                        errors[index] = message
+                        del accepted[index]
+
+        orders = Order.objects.filter(id__in=created.values()).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('dish'))
+        )
+        serialized = {order.id: OrderSerializer(order).data for order in orders}
+
+        results = []
+        for index in range(len(orders_data)):
+            if index in created:
+                order_data = serialized[created[index]]
+                publish_order_event('order_created', valid[index]['canteen_id'], order_data)
+                results.append({"index": index, "status": "created", "order": order_data})
+            else:
+                error = errors.get(index, "Пакет отклонен из-за ошибок в других заказах")
+                results.append({"index": index, "status": "failed", "error": error})
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(created) < len(orders_data):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({"created": len(created), "results": results}, status=response_status)
+
+    def validate_order(self, user, order_data):
+        serializer = OrderCreateSerializer(data=order_data)
+        if not serializer.is_valid():
+            return serializer.errors, None
+        data = dict(serializer.validated_data)
+
+        if not data.get('items'):
+            return "Список 'items' не может быть пустым", None
+        for item_data in data['items']:
+            if not isinstance(item_data.get('quantity'), int) or item_data['quantity'] <= 0:
+                return f"Некорректные данные для позиции: {item_data}", None
+
+        # Заказы за других пользователей может оформлять только администратор
+        data['user_id'] = order_data.get('user_id', user.id)
+        if not isinstance(data['user_id'], int):
+            return "Поле 'user_id' должно быть целым числом", None
+        if data['user_id'] != user.id and user.role != 'admin':
+            return "Оформлять заказы за других пользователей может только администратор", None
+        return None, data
+
+    def allocate(self, data, open_canteens, known_users, stock, remaining, slot_usage):
+        canteen_id = data['canteen_id']
+        if canteen_id not in open_canteens:
+            return f"Столовая с ID {canteen_id} не найдена или закрыта"
+        if data['user_id'] not in known_users:
+            return f"Пользователь с ID {data['user_id']} не найден"
+
+        needed = merge_quantities(data['items'])
+        for dish_id, quantity in needed.items():
+            key = (canteen_id, dish_id)
+            if key not in stock:
+                return f"Блюдо с ID {dish_id} не найдено в этой столовой"
+            if remaining[key] < quantity:
+                return f"Недостаточное количество блюда '{stock[key].dish.name}'. Доступно: {remaining[key]}"
+
+        if 'slot' in data:
+            canteen = open_canteens[canteen_id]
+            usage = slot_usage.setdefault((canteen_id, data['slot']), [0, 0])
+            dishes = sum(needed.values())
+            if (canteen.slot_max_orders is not None and usage[0] + 1 > canteen.slot_max_orders) or \
+                    (canteen.slot_max_dishes is not None and usage[1] + dishes > canteen.slot_max_dishes):
+                return slot_full_message(data['slot'])
+            usage[0] += 1
+            usage[1] += dishes
+
+        for dish_id, quantity in needed.items():
+            remaining[canteen_id, dish_id] -= quantity
+        return None
+
+    def create_orders(self, accepted, stock, canteens):
+        with transaction.atomic():
+            indexes = list(accepted)
+            orders = Order.objects.bulk_create([
+                Order(
+                    user_id=accepted[index]['user_id'],
+                    canteen_id=accepted[index]['canteen_id'],
+                    status='paid',
+                    preparation_type=accepted[index].get('preparation_type', 'asap'),
+                    preparation_time=accepted[index].get('preparation_time'),
+                    total_price=sum(
+                        (stock[accepted[index]['canteen_id'], item['dish_id']].dish.price * item['quantity']
+                         for item in accepted[index]['items']),
+                        Decimal('0.0')
+                    )
+                )
+                for index in indexes
+            ])
+
+            items = []
+            quantities = Counter()
+            for index, order in zip(indexes, orders):
+                for item in accepted[index]['items']:
+                    items.append(OrderItem(
+                        order=order, dish_id=item['dish_id'], quantity=item['quantity'],
+                        unit_price=stock[order.canteen_id, item['dish_id']].dish.price
+                    ))
+                    quantities[order.canteen_id, item['dish_id']] += item['quantity']
+            OrderItem.objects.bulk_create(items)
+
+            scheduled = defaultdict(list)
+            for data in accepted.values():
+                if 'slot' in data:
+                    scheduled[data['canteen_id']].append(
+                        (data['preparation_time'], sum(item['quantity'] for item in data['items']))
+                    )
+            for canteen_id, slot_orders in scheduled.items():
+                reserve_slots(canteens[canteen_id], slot_demands(canteens[canteen_id], slot_orders))
+            reserve_stock_many(quantities, {key: stock[key].hot_slots for key in quantities})
+            bump_menu_version_on_commit(*(canteen_id for canteen_id, _ in quantities))
+            record_sales_on_commit(
+                (item.order, item.dish_id, item.quantity, item.unit_price) for item in items
+            )
+        return {index: order.id for index, order in zip(indexes, orders)}
 
-        CanteenDish.objects.bulk_update(canteen_dishes_map.values(), ['quantity'])
-        OrderItem.objects.bulk_create(order_items_to_create)
+# 6.2 cart/holds — резервы блюд в корзине
+class StockHoldView(views.APIView):
+    # Добавление в корзину сразу откладывает блюдо на STOCK_HOLD_MINUTES минут:
+    # о том, что блюдо закончилось, пользователь узнает здесь, а не при оформлении
+    authentication_classes = [JWTCookieAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        order.total_price = total_price
-        order.status = 'paid'
-        order.save()
+    def get(self, request, *args, **kwargs):
+        holds = StockHold.objects.filter(user_id=request.user.id, expires_at__gt=timezone.now()).order_by('id')
+        return Response(StockHoldSerializer(holds, many=True).data)
 
-        response_serializer = OrderSerializer(order)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    def post(self, request, *args, **kwargs):
+        serializer = StockHoldCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        canteen_id, dish_id, quantity = (serializer.validated_data[field] for field in ('canteen_id', 'dish_id', 'quantity'))
+
+        hot_slots = None
+        if quantity:
+            # Тот же запрос, что проверяет столовую, дает число слотов блюда:
+            # при нехватке обычного блюда слоты не проверяются
+            hot_slots = CanteenDish.objects.filter(
+                canteen_id=canteen_id, dish_id=dish_id, canteen__is_open=True
+            ).values_list('hot_slots', flat=True).first()
+            if hot_slots is None:
+                if not Canteen.objects.filter(id=canteen_id, is_open=True).exists():
+                    return Response(
+                        {"error": f"Столовая с ID {canteen_id} не найдена или закрыта"},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                return Response({"error": f"Блюдо с ID {dish_id} не найдено в этой столовой"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            hold = set_hold(request.user.id, canteen_id, dish_id, quantity, hot_slots)
+        except InsufficientStock:
+            canteen_dish = CanteenDish.objects.annotate(available_quantity=stock_total()).select_related('dish').filter(canteen_id=canteen_id, dish_id=dish_id).first()
+            if canteen_dish is None:
+                return Response({"error": f"Блюдо с ID {dish_id} не найдено в этой столовой"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"error": f"Недостаточное количество блюда '{canteen_dish.dish.name}'. Доступно: {canteen_dish.available_quantity}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if hold is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(StockHoldSerializer(hold).data)
 
 # API для выхода (удаление cookie)
 class LogoutView(views.APIView):
     def post(self, request, *args, **kwargs):
+        # Отзываем токены, чтобы их нельзя было использовать до истечения срока
+        for cookie, token_class in (('access_token', AccessToken), ('refresh_token', RefreshToken)):
+            token = request.COOKIES.get(cookie)
+            if token:
+                try:
+                    revoke_token(token_class(token))
+                except TokenError:
+                    pass
         response = Response({"message": "Выход выполнен успешно"}, status=status.HTTP_200_OK)
-        response.delete_cookie('access_token')
-        return response
+        return delete_jwt_cookies(response)
     
 class WorkerOrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     authentication_classes = [JWTCookieAuthentication]
     permission_classes = [IsCanteenWorker]
+    pagination_class = WorkerOrderQueuePagination
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Order.objects.filter(
-            canteen=user.canteen, 
-            status__in=['paid', 'new']
-        ).prefetch_related('items__dish')
-
-        # Сортируем: 'asap' заказы получают приоритет (0), 'scheduled' - (1)
-        # Затем сортируем по времени создания для 'asap' и по времени готовки для 'scheduled'
-        return sorted(
-            queryset, 
-            key=lambda order: (
-                0 if order.preparation_type == 'asap' else 1,
-                order.preparation_time if order.preparation_type == 'scheduled' and order.preparation_time else order.created_at
-            )
-        )
+        return worker_order_queue(self.request.user.canteen_id)
 
 class WorkerOrderUpdateStatusView(generics.UpdateAPIView):
     serializer_class = OrderStatusUpdateSerializer
@@ -268,7 +768,234 @@ class WorkerOrderUpdateStatusView(generics.UpdateAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return Order.objects.filter(canteen=user.canteen)
+        return Order.objects.filter(canteen_id=user.canteen_id)
 
     def update(self, request, *args, **kwargs):
-        return super().update(request, *args, **kwargs)
\ No newline at end of file
+        return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        order = serializer.save()
+        publish_order_event('order_status_changed', order.canteen_id, {'id': order.id, 'status': order.status})
+
+class WorkerOrderBulkStatusView(views.APIView):
+    # Смена статуса сразу нескольких заказов одним условным UPDATE: меняются
+    # только заказы столовой работника, находящиеся в допустимом для перехода
+    # статусе. Остальные id возвращаются в skipped
+    authentication_classes = [JWTCookieAuthentication]
+    permission_classes = [IsCanteenWorker]
+
+    def post(self, request, *args, **kwargs):
+        serializer = OrderBulkStatusUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        new_status = serializer.validated_data['status']
+        canteen_id = request.user.canteen_id
+
+        with transaction.atomic():
+            orders = Order.objects.filter(
+                canteen_id=canteen_id,
+                id__in=ids,
+                status__in=ORDER_STATUS_TRANSITIONS[new_status]
+            )
+            # Строки блокируются, чтобы ответ точно совпал с тем, что изменил UPDATE
+            changed = sorted(orders.select_for_update().values_list('id', flat=True))
+            if changed:
+                orders.filter(id__in=changed).update(status=new_status)
+            for order_id in changed:
+                publish_order_event('order_status_changed', canteen_id, {'id': order_id, 'status': new_status})
+
+        changed_ids = set(changed)
+        return Response({
+            'status': new_status,
+            'changed': changed,
+            'skipped': [order_id for order_id in ids if order_id not in changed_ids],
+        })
+
+class SalesReportMixin:
+    # Отчет о продажах за период (?date_from=&date_to=) по DailySales. Подкласс
+    # задает права доступа и get_sales — строки DailySales, видимые пользователю
+    authentication_classes = [JWTCookieAuthentication]
+
+    def get_sales(self, request):
+        raise NotImplementedError('SalesReportMixin: подкласс должен определить get_sales()')
+
+    def get(self, request, *args, **kwargs):
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        report = sales_report(self.get_sales(request), **query.validated_data)
+        return Response(SalesReportSerializer(report).data)
+
+class WorkerSalesReportView(SalesReportMixin, views.APIView):
+    permission_classes = [IsCanteenWorker]
+
+    def get_sales(self, request):
+        return DailySales.objects.filter(canteen_id=request.user.canteen_id)
+
+class SalesReportView(SalesReportMixin, views.APIView):
+    # Для администратора: по всем столовым или по одной (?canteen_id=)
+    permission_classes = [IsCanteenAdmin]
+
+    def get_sales(self, request):
+        queryset = DailySales.objects.all()
+        canteen_id = request.query_params.get('canteen_id')
+        if canteen_id:
+            if not canteen_id.isdigit():
+                raise ValidationError({"canteen_id": "Должен быть целым числом."})
+            queryset = queryset.filter(canteen_id=canteen_id)
+        return queryset
+
+class WorkerForecastView(views.APIView):
+    # Прогноз спроса по часам и рекомендуемые остатки блюд столовой работника на
+    # день (?date=, по умолчанию завтра). Данные обновляет команда update_demand
+    authentication_classes = [JWTCookieAuthentication]
+    permission_classes = [IsCanteenWorker]
+
+    def get(self, request, *args, **kwargs):
+        query = ForecastQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(suggest_quantities(request.user.canteen_id, query.validated_data['date']))
+
+async def authenticate_worker(request):
+    # Проверка JWT и роли для асинхронных представлений: (пользователь, None)
+    # или (None, ответ с ошибкой) — как у IsCanteenWorker в DRF
+    try:
+        auth = await JWTCookieAuthentication().aauthenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        auth = None
+    if auth is None:
+        return None, json_response({"detail": "Учетные данные не были предоставлены."}, status.HTTP_401_UNAUTHORIZED)
+
+    user = auth[0]
+    if user.role != 'worker' or user.canteen_id is None:
+        return None, json_response({"detail": IsCanteenWorker.message}, status.HTTP_403_FORBIDDEN)
+    return user, None
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    # Тот же JSON, что отдает JSONRenderer DRF: без экранирования кириллицы и пробелов
+    return JsonResponse(
+        data, status=status_code, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')}
+    )
+
+# Асинхронные версии эндпоинтов чтения (ASYNC_READ_VIEWS=True, только под ASGI).
+# DRF не поддерживает async-представления, поэтому это обычные Django View:
+# запросы идут через async ORM (aget, aiterator), кэш — через aget/aset,
+# а ответ совпадает с синхронной версией байт в байт
+
+class AsyncCanteenListView(View):
+    async def get(self, request, *args, **kwargs):
+        canteens = [canteen async for canteen in Canteen.objects.all()]
+        return json_response(CanteenSerializer(canteens, many=True).data)
+
+class AsyncCanteenMenuView(View):
+    async def build_snapshot(self, canteen_id):
+        alias, version = await amenu_read_alias(canteen_id)
+        queryset = canteen_menu_queryset(canteen_id).using(alias)
+        dishes = [menu_dish(cd) async for cd in queryset.aiterator()]
+        return {'version': version, 'dishes': [dict(item) for item in CanteenMenuSerializer(dishes, many=True).data]}
+
+    async def snapshot(self, canteen_id, version):
+        return await aget_menu_snapshot(canteen_id, version, lambda: self.build_snapshot(canteen_id))
+
+    async def delta(self, request, canteen_id, version, since):
+        # Журнал изменений читается несколькими запросами — отдаем его в поток
+        delta = await sync_to_async(menu_delta)(canteen_id, since)
+        if delta is None:
+            snapshot = await self.snapshot(canteen_id, version)
+            dishes = absolute_menu_urls(snapshot['dishes'], request)
+            return {'version': snapshot['version'], 'full': True, 'dishes': dishes, 'removed': []}
+        sequence, dishes, removed = delta
+        return {
+            'version': sequence,
+            'full': False,
+            'dishes': CanteenMenuSerializer(dishes, many=True, context={'request': request}).data,
+            'removed': removed,
+        }
+
+    async def get(self, request, canteen_id):
+        since = request.GET.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return json_response({"error": "Параметр 'since' должен быть целым числом"}, status.HTTP_400_BAD_REQUEST)
+
+        version = await aget_menu_version(canteen_id)
+        etag = menu_etag(canteen_id, version)
+
+        if etag_matches(request, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif since is not None:
+            response = json_response(await self.delta(request, canteen_id, version, since))
+        else:
+            snapshot = await self.snapshot(canteen_id, version)
+            response = json_response(absolute_menu_urls(snapshot['dishes'], request))
+            response['X-Menu-Version'] = snapshot['version']
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class AsyncCanteenMenuDetailView(View):
+    async def get(self, request, canteen_id, dish_id):
+        try:
+            canteen_dish = await CanteenDish.objects.annotate(available_quantity=stock_total()).select_related('dish').aget(
+                canteen_id=canteen_id,
+                dish_id=dish_id
+            )
+        except CanteenDish.DoesNotExist:
+            return json_response({"error": "Блюдо не найдено в этой столовой"}, status.HTTP_404_NOT_FOUND)
+        serializer = CanteenMenuSerializer(menu_dish(canteen_dish), context={'request': request})
+        return json_response(serializer.data)
+
+class AsyncWorkerOrderListView(View):
+    async def get(self, request, *args, **kwargs):
+        user, error = await authenticate_worker(request)
+        if error is not None:
+            return error
+
+        paginator = WorkerOrderQueuePagination()
+        try:
+            page = await paginator.apaginate_querysets([worker_order_queue(user.canteen_id)], Request(request))
+        except NotFound as exc:
+            return json_response({"detail": exc.detail}, status.HTTP_404_NOT_FOUND)
+        return json_response(paginator.get_paginated_response(OrderSerializer(page, many=True).data).data)
+
+class WorkerOrderEventsView(View):
+    # Server-Sent Events для кухни: новые заказы и смена статусов в столовой
+    # работника. Асинхронное представление: под ASGI (core/asgi.py) открытое
+    # соединение не занимает поток. Переподключение с заголовком Last-Event-ID
+    # досылает пропущенные события, а если их уже нет — событие resync.
+    async def get(self, request, *args, **kwargs):
+        user, error = await authenticate_worker(request)
+        if error is not None:
+            return error
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or None
+
+        response = StreamingHttpResponse(
+            self.stream(canteen_channel(user.canteen_id), last_event_id),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, channel, last_event_id):
+        events = get_broker().subscribe(channel, last_event_id, heartbeat=settings.ORDER_EVENTS_HEARTBEAT)
+        async for event in events:
+            if event is None:
+                # Комментарий не дает прокси закрыть неактивное соединение
+                yield ': heartbeat\n\n'
+                continue
+            data = json.dumps(event.data, cls=DjangoJSONEncoder, ensure_ascii=False)
+            yield f'id: {event.id}\nevent: {event.type}\ndata: {data}\n\n'
+
+class MetricsView(View):
+    # Метрики ProfilingMiddleware в текстовом формате Prometheus
+    def get(self, request, *args, **kwargs):
+        if not settings.PROFILING_ENABLED:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        token = settings.PROFILING_METRICS_TOKEN
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(metrics_registry.to_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
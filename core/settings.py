@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -72,6 +74,139 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2 (остальные параметры как у
+# основной базы). Безопасные чтения уходят на реплики (api.db_router), а после
+# записи клиент DB_PRIMARY_STICKY_SECONDS секунд читает с основной базы
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+DB_PRIMARY_STICKY_SECONDS = int(os.getenv('DB_PRIMARY_STICKY_SECONDS', '5'))
+DB_PRIMARY_COOKIE = 'db_primary_until'
+
+# Кэш: Redis в продакшене (если задан REDIS_URL), иначе локальная память процесса.
+# Отозванные токены и поколения токенов пользователей хранятся отдельно (алиас
+# tokens): их нельзя вытеснять, иначе отозванный токен снова станет действительным.
+# Экземпляр Redis для REDIS_TOKENS_URL должен работать с maxmemory-policy
+# noeviction; ключи в нем удаляются сами по истечении срока действия токенов
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+        'tokens': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_TOKENS_URL', os.getenv('REDIS_URL')),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'canteen-ordering',
+        },
+        'tokens': {
+            'BACKEND': 'api.cache_backends.NonEvictingLocMemCache',
+            'LOCATION': 'canteen-ordering-tokens',
+        },
+    }
+
+# Время жизни снимка меню столовой в кэше (секунды)
+MENU_CACHE_TIMEOUT = int(os.getenv('MENU_CACHE_TIMEOUT', '300'))
+
+# Инкрементальная синхронизация меню (?since=<версия>): при отставании клиента
+# больше чем на столько версий отдается полный снимок; сколько часов в кэше
+# хранятся списки изменившихся блюд по версиям
+MENU_SYNC_MAX_VERSIONS = int(os.getenv('MENU_SYNC_MAX_VERSIONS', '500'))
+MENU_CHANGES_RETENTION_HOURS = int(os.getenv('MENU_CHANGES_RETENTION_HOURS', '24'))
+
+# Миниатюры фото блюд: ширина (по большей стороне) для каждого размера.
+# При DISH_THUMBNAILS_ON_SAVE=False они строятся только командой generate_thumbnails
+DISH_THUMBNAIL_SIZES = {'small': 160, 'medium': 480, 'large': 960}
+DISH_THUMBNAIL_QUALITY = 80
+DISH_THUMBNAILS_ON_SAVE = os.getenv('DISH_THUMBNAILS_ON_SAVE', 'True') == 'True'
+
+# Прогноз спроса (api/forecast.py): сколько последних недель усредняется,
+# запас сверх прогноза и задержка, после которой заказ попадает в агрегацию
+FORECAST_WEEKS = int(os.getenv('FORECAST_WEEKS', '4'))
+FORECAST_SAFETY_MARGIN = float(os.getenv('FORECAST_SAFETY_MARGIN', '0.1'))
+FORECAST_AGGREGATION_LAG = timedelta(minutes=5)
+
+# Закрытые заказы старше этого срока переносит в архив команда archive_orders
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '30'))
+
+# События заказов для кухни (Server-Sent Events). InMemoryBroker работает в
+# пределах одного процесса; для нескольких процессов укажите внешний брокер
+ORDER_EVENTS_BROKER = os.getenv('ORDER_EVENTS_BROKER', 'api.events.InMemoryBroker')
+# Сколько последних событий каждой столовой хранить для досылки по Last-Event-ID
+ORDER_EVENTS_HISTORY = int(os.getenv('ORDER_EVENTS_HISTORY', '1000'))
+# Интервал heartbeat-комментариев в потоке событий (секунды)
+ORDER_EVENTS_HEARTBEAT = int(os.getenv('ORDER_EVENTS_HEARTBEAT', '15'))
+
+# Асинхронные версии эндпоинтов чтения (список столовых, меню, блюдо меню,
+# очередь заказов кухни). Включайте только при запуске под ASGI (core/asgi.py):
+# под WSGI каждый такой запрос выполнялся бы через отдельный цикл событий
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Резервы блюд в корзине (cart/holds): срок жизни в минутах и максимум штук
+# одного блюда. Просроченные резервы возвращает на остаток release_expired_holds
+STOCK_HOLD_MINUTES = int(os.getenv('STOCK_HOLD_MINUTES', '10'))
+STOCK_HOLD_MAX_QUANTITY = int(os.getenv('STOCK_HOLD_MAX_QUANTITY', '20'))
+
+# Максимальное количество заказов в одном запросе orders/batch
+ORDER_BATCH_MAX_SIZE = int(os.getenv('ORDER_BATCH_MAX_SIZE', '200'))
+# Максимальное количество заказов в одном запросе worker/orders/status
+ORDER_BULK_STATUS_MAX_SIZE = int(os.getenv('ORDER_BULK_STATUS_MAX_SIZE', '200'))
+
+# Idempotency-Key для set_order и orders/batch: сколько хранить ответы (часы),
+# через сколько секунд параллельному дублю повторить запрос (Retry-After у 409)
+# и через сколько секунд считать незавершенный запрос зависшим
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+IDEMPOTENCY_RETRY_AFTER = 1
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+
+# Профилирование эндпоинтов (api.middleware.ProfilingMiddleware): время ответа,
+# число и время запросов к БД, время рендеринга. Метрики доступны в формате
+# Prometheus по /api/v1/_metrics, отчет — python manage.py profiling_report
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+# Если задан, /api/v1/_metrics требует заголовок "Authorization: Bearer <токен>"
+PROFILING_METRICS_TOKEN = os.getenv('PROFILING_METRICS_TOKEN', '')
+# Превышение бюджета запросов пишется в лог, а с этим флагом — роняет запрос
+# (удобно для тестов: PROFILING_ENABLED=True PROFILING_FAIL_ON_BUDGET=True python manage.py test)
+PROFILING_FAIL_ON_BUDGET = os.getenv('PROFILING_FAIL_ON_BUDGET', 'False') == 'True'
+PROFILING_QUERY_BUDGETS = {
+    'create_user': 3,
+    # Чтение пользователя и, если check_password перехеширует пароль, его UPDATE
+    'authorization': 2,
+    'get_user_info': 1,
+    'order-history': 5,
+    'update_user': 4,
+    'canteen-list': 1,
+    'canteen-menu': 3,
+    'canteen-menu-detail': 1,
+    'canteen-menus': 1,
+    'canteen-slots': 2,
+    # Плюс чтение блюд при перестройке индекса поиска в памяти (не на PostgreSQL)
+    'dish-search': 2,
+    # Худший случай — перехват зависшего Idempotency-Key; увеличение версии
+    # меню (menu_sync) входит в каждый заказ, резервы корзины читаются вместе с блюдами
+    'set_order': 20,
+    'order-batch': 30,
+    'worker-order-list': 3,
+    'worker-order-update': 4,
+    'worker-order-bulk-status': 5,
+    'worker-sales-report': 3,
+    'sales-report': 3,
+    'worker-forecast': 3,
+    # Худший случай — нехватка остатка: после неудачного UPDATE строки блюда
+    # откат и чтение остатка для сообщения об ошибке (слоты проверяются,
+    # только если блюдо горячее)
+    'cart-holds': 8,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -87,6 +222,37 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Алгоритм для новых хешей паролей: pbkdf2, scrypt или argon2 (нужен пакет
+# argon2-cffi). Хеши остальных алгоритмов по-прежнему проверяются, а при
+# успешном входе пароль перехешируется выбранным алгоритмом с текущими параметрами
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'api.hashers.ScryptPasswordHasher',
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+# Параметры хешеров (по умолчанию — как в Django). Стоимость проверки пароля
+# определяет, сколько входов в секунду выдерживает одно ядро (bench_login)
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', '1000000'))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv('PASSWORD_SCRYPT_PARALLELISM', '5'))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_KIB = int(os.getenv('PASSWORD_ARGON2_MEMORY_KIB', '102400'))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', '8'))
+
+# Ограничение попыток входа и регистрации (token bucket в кэше):
+# (емкость ведра, пополнение попыток в минуту) на IP-адрес и на логин
+AUTH_THROTTLE_BUCKETS = {
+    'ip': (int(os.getenv('AUTH_THROTTLE_IP_BURST', '30')), float(os.getenv('AUTH_THROTTLE_IP_PER_MINUTE', '20'))),
+    'username': (int(os.getenv('AUTH_THROTTLE_USERNAME_BURST', '10')), float(os.getenv('AUTH_THROTTLE_USERNAME_PER_MINUTE', '5'))),
+}
+# Сколько секунд переиспользовать результат проверки тех же логина и пароля
+# (двойное нажатие «Войти», повтор запроса клиентом, перебор одной пары); 0 — не кэшировать
+AUTH_COALESCE_SECONDS = int(os.getenv('AUTH_COALESCE_SECONDS', '5'))
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -110,9 +276,17 @@ REST_FRAMEWORK = {
     )
 }
 
+# Stateless-аутентификация: пользователь (роль и столовая) берется из claims
+# access-токена без запроса к БД. При включении стоит сократить срок жизни токена
+# через JWT_ACCESS_TOKEN_MINUTES; отозванные токены проверяются по кэшу
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'False') == 'True'
+
+# Путь cookie refresh_token: браузер отправляет его только на эндпоинты API
+JWT_REFRESH_COOKIE_PATH = os.getenv('JWT_REFRESH_COOKIE_PATH', '/api/v1/')
+
 SIMPLE_JWT = {
-    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
-    "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', '60'))),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', '1'))),
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
     "UPDATE_LAST_LOGIN": False,
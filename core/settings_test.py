@@ -0,0 +1,26 @@
+# Настройки для тестов без PostgreSQL: python manage.py test --settings=core.settings_test
+# Вторая база SQLite изображает реплику для тестов маршрутизации чтений
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+
+# Все файлы баз — во временном каталоге, в том числе рабочие (NAME): к ним
+# подключаются management-команды с этими настройками и процессы, запущенные
+# вне тестового раннера, и файлы не должны оставаться в репозитории
+TEST_DB_DIR = Path(tempfile.gettempdir())
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_DB_DIR / 'canteen_default.sqlite3',
+        # Тестовая база в файле, а не в памяти: конкурентные тесты заказов
+        # ждут блокировку записи вместо ошибки "database table is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 30},
+        'TEST': {'NAME': TEST_DB_DIR / 'canteen_test_default.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_DB_DIR / 'canteen_replica.sqlite3',
+    },
+}